@@ -0,0 +1,120 @@
+"""
+Compressed drives.
+
+Writes the same text-heavy files, log lines and a document, through the
+file handle API to a plain drive and to compressed drives using zlib and
+lzma, then reads them back whole and with random 4 KiB reads, which only
+decompress the chunks they touch. Reports the compression ratio and the
+read and write throughput of each drive.
+
+Run from the project root:  python -m benchmarks.compression [MB per file] [random reads]
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+from benchmarks.harness import HeadlessSession
+
+BLOCK = 64 * 1024 # Bytes per write() and read() call
+DRIVES = {'P:': None, 'Z:': 'zlib', 'L:': 'lzma'}
+
+
+def _log_text(size):
+    levels = ['INFO', 'INFO', 'INFO', 'DEBUG', 'WARNING', 'ERROR']
+    words = "kernel scheduler process drive file buffer index request timer console".split()
+    rng = random.Random(1)
+    lines, total, i = [], 0, 0
+    while total < size:
+        line = (f"2026-10-17 12:{i // 60 % 60:02}:{i % 60:02}.{i % 1000:03} {rng.choice(levels):<7} "
+                f"[{rng.choice(words)}] {' '.join(rng.choices(words, k=8))} id={rng.randrange(100000)}\n")
+        lines.append(line)
+        total += len(line)
+        i += 1
+    return ''.join(lines).encode()[:size]
+
+
+def _document_text(size):
+    rng = random.Random(2)
+    words = ("the a of and to in is that it for on with as was by this be are from at or an "
+             "system drive editor banana file text window page line paragraph chapter").split()
+    text = []
+    total = 0
+    while total < size:
+        paragraph = ' '.join(rng.choices(words, k=rng.randrange(40, 120))).capitalize() + ".\n\n"
+        text.append(paragraph)
+        total += len(paragraph)
+    return ''.join(text).encode()[:size]
+
+
+def _write(fs_manager, path, data):
+    fd = fs_manager.open(path, 'w')
+    try:
+        for start in range(0, len(data), BLOCK):
+            fs_manager.write(fd, data[start:start + BLOCK])
+    finally:
+        fs_manager.close(fd)
+
+
+def _read(fs_manager, path):
+    fd = fs_manager.open(path)
+    try:
+        while fs_manager.read(fd, BLOCK):
+            pass
+    finally:
+        fs_manager.close(fd)
+
+
+def _random_reads(fs_manager, path, size, count):
+    rng = random.Random(3)
+    fd = fs_manager.open(path)
+    try:
+        for _ in range(count):
+            fs_manager.seek(fd, rng.randrange(size))
+            fs_manager.read(fd, 4096)
+    finally:
+        fs_manager.close(fd)
+
+
+def main(megabytes=16, reads=1000):
+    size = megabytes << 20
+    files = {'server.log': _log_text(size), 'manual.txt': _document_text(size)}
+    with tempfile.TemporaryDirectory() as root:
+        session = HeadlessSession([])
+        fs_manager = session.kernel.fs_manager
+        for letter, method in DRIVES.items():
+            host_path = os.path.join(root, letter[0])
+            os.makedirs(host_path)
+            if method:
+                with open(os.path.join(host_path, 'disk.json'), 'w') as f:
+                    json.dump({'type': 'compressed', 'compression': method}, f)
+            error = fs_manager.mount(letter, host_path)
+            if error:
+                raise RuntimeError(error)
+        print(f"{len(files)} files of {megabytes} MB, {BLOCK // 1024} KiB per call, {reads} random 4 KiB reads")
+        try:
+            for name, data in files.items():
+                for letter, method in DRIVES.items():
+                    path = f"{letter}/{name}"
+                    start = time.perf_counter()
+                    _write(fs_manager, path, data)
+                    written = time.perf_counter() - start
+                    start = time.perf_counter()
+                    _read(fs_manager, path)
+                    read = time.perf_counter() - start
+                    start = time.perf_counter()
+                    _random_reads(fs_manager, path, size, reads)
+                    seeks = time.perf_counter() - start
+                    stored = os.path.getsize(os.path.join(root, letter[0], name))
+                    print(f"{name:<11} {method or 'plain':<6} ratio {size / stored:5.2f}:1   "
+                          f"write {megabytes / written:>8.1f} MB/s   read {megabytes / read:>8.1f} MB/s   "
+                          f"random {reads / seeks:>9,.0f} reads/s")
+        finally:
+            fs_manager.close_all()
+            session.kernel.aio_manager.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:3]])
@@ -0,0 +1,111 @@
+"""
+Copying files.
+
+Times 'copy /s' in a headless session on two trees, a few large files and
+many small ones, against a naive copy that walks the tree and moves the data
+through a Python read/write loop on one thread. Both copy from the same
+source into fresh directories on the same filesystem, with a warm page cache
+and nothing left to write back.
+
+First checks that a file holding CR LF and Ctrl-Z bytes comes through the
+read/write fallback unchanged, which on Windows needs O_BINARY.
+
+Run from the project root:  python -m benchmarks.copy [large MB] [small files]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from benchmarks.harness import run_script
+from devices.internal.A.apeos.system2.sys import copy_mgr
+
+LARGE_FILES = 4
+SMALL_SIZE = 4096
+FILES_PER_DIR = 100
+_sync = getattr(os, 'sync', lambda: None) # POSIX only
+
+
+def _make_large(root, megabytes):
+    os.makedirs(root)
+    block = os.urandom(1 << 20)
+    for i in range(LARGE_FILES):
+        with open(os.path.join(root, f"large{i}.bin"), 'wb') as f:
+            for _ in range(megabytes // LARGE_FILES):
+                f.write(block)
+
+
+def _make_small(root, count):
+    data = os.urandom(SMALL_SIZE)
+    for i in range(count):
+        directory = os.path.join(root, f"d{i // FILES_PER_DIR:05}")
+        if i % FILES_PER_DIR == 0:
+            os.makedirs(directory)
+        with open(os.path.join(directory, f"file{i:07}.dat"), 'wb') as f:
+            f.write(data)
+
+
+def _naive_copy(src, dst):
+    for directory, _, names in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(directory, src))
+        os.makedirs(target, exist_ok=True)
+        for name in names:
+            with open(os.path.join(directory, name), 'rb') as fsrc, open(os.path.join(target, name), 'wb') as fdst:
+                while True:
+                    data = fsrc.read(65536)
+                    if not data:
+                        break
+                    fdst.write(data)
+
+
+def _check_binary(root):
+    """Copies bytes that text mode would change through the read/write fallback and compares them."""
+    data = b'line\r\nbreak\nend\x1a\x1a\r\n\rafter\x1a' * 1000 + bytes(range(256))
+    src, dst = os.path.join(root, 'binary.bin'), os.path.join(root, 'binary.copy')
+    with open(src, 'wb') as f:
+        f.write(data)
+    fast_paths = copy_mgr._have_copy_file_range, copy_mgr._have_sendfile
+    copy_mgr._have_copy_file_range = copy_mgr._have_sendfile = False
+    try:
+        copy_mgr.copy_file(src, dst)
+    finally:
+        copy_mgr._have_copy_file_range, copy_mgr._have_sendfile = fast_paths
+    with open(dst, 'rb') as f:
+        copied = f.read()
+    if copied != data:
+        raise RuntimeError(f"the read/write fallback changed a binary file: {len(data):,} bytes in, {len(copied):,} out")
+    print("binary round trip through the read/write fallback: ok")
+
+
+def _bench(root, name):
+    src = os.path.join(root, name)
+    size = sum(os.path.getsize(os.path.join(d, n)) for d, _, names in os.walk(src) for n in names)
+    _sync() # Neither copy should pay for writing back the other's data
+    transcript = run_script([f"mount S: {root}", f"copy /s S:/{name} S:/copied_{name}"])
+    _, output, elapsed_ns = transcript[-1]
+    _sync()
+    start = time.perf_counter()
+    _naive_copy(src, os.path.join(root, f"naive_{name}"))
+    naive = time.perf_counter() - start
+    fast = elapsed_ns / 1e9
+    print(f"{name:<8} {size / (1 << 20):>9,.0f} MB   copy: {fast * 1000:>9.1f} ms   "
+          f"naive: {naive * 1000:>9.1f} ms   {naive / fast:5.1f}x")
+    if 'Error' in output:
+        print(output)
+    for copy in (f"copied_{name}", f"naive_{name}"):
+        shutil.rmtree(os.path.join(root, copy))
+
+
+def main(megabytes=512, count=20_000):
+    with tempfile.TemporaryDirectory() as root:
+        _check_binary(root)
+        _make_large(os.path.join(root, 'large'), megabytes)
+        _make_small(os.path.join(root, 'small'), count)
+        print(f"{LARGE_FILES} large files, {count:,} files of {SMALL_SIZE:,} bytes, {os.cpu_count()} CPU(s)")
+        _bench(root, 'large')
+        _bench(root, 'small')
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:3]])
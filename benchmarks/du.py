@@ -0,0 +1,77 @@
+"""
+Disk usage.
+
+Builds a tree of small files on drive A and measures it with the
+FileSystemManager API: with 'os.walk' as a baseline, on the first 'du'
+(every directory scanned, a level at a time in parallel), on a repeated
+'du' (every directory checked by its mtime, none scanned), after a file was
+written somewhere deep in the tree (one directory rescanned), after one was
+created there behind aPEOS-I's back (found by its directory's mtime) and
+with /r (every directory rescanned).
+
+Run from the project root:  python -m benchmarks.du [directories] [files per directory]
+"""
+import os
+import sys
+import time
+
+from benchmarks.harness import HeadlessSession, scratch_dir
+
+FANOUT = 10 # Subdirectories per directory
+
+
+def _build(host_path, count, files):
+    """Creates count directories FANOUT to a parent, with files small files each. Returns the deepest one."""
+    dirs = [host_path]
+    for i in range(count):
+        directory = os.path.join(dirs[i // FANOUT], f"d{i:05}")
+        os.mkdir(directory)
+        for j in range(files):
+            with open(os.path.join(directory, f"f{j:03}.txt"), 'w') as f:
+                f.write('x' * (i % 500 + 1))
+        dirs.append(directory)
+    return dirs[-1]
+
+
+def _walk(host_path):
+    total = 0
+    for directory, _, files in os.walk(host_path):
+        total += sum(os.path.getsize(os.path.join(directory, name)) for name in files)
+    return total
+
+
+def _timed(name, work, check=None):
+    start = time.perf_counter()
+    result = work()
+    elapsed = time.perf_counter() - start
+    if isinstance(result, str):
+        raise RuntimeError(result)
+    total = result if check is None else result[-1][2].bytes
+    scanned = f"   {check.scanned:,} directories scanned" if check is not None else ''
+    print(f"{name:<12} {elapsed * 1000:>9.1f} ms   {total:>14,} bytes{scanned}")
+
+
+def main(count=5000, files=10):
+    session = HeadlessSession([])
+    fs_manager = session.kernel.fs_manager
+    try:
+        with scratch_dir('du') as (path, host_path):
+            deepest = _build(host_path, count, files)
+            print(f"{count:,} directories of {files} files, {FANOUT} subdirectories per directory")
+            usage = fs_manager.usage
+            _timed('os.walk', lambda: _walk(host_path))
+            _timed('first du', lambda: fs_manager.disk_usage(path), usage)
+            _timed('repeated', lambda: fs_manager.disk_usage(path), usage)
+            deep_path = path + deepest[len(host_path):].replace(os.sep, '/')
+            fs_manager.write_file(f"{deep_path}/new.txt", 'y' * 1000)
+            _timed('after write', lambda: fs_manager.disk_usage(path), usage)
+            with open(os.path.join(deepest, 'outside.txt'), 'w') as f:
+                f.write('z' * 1000)
+            _timed('outside', lambda: fs_manager.disk_usage(path), usage)
+            _timed('du /r', lambda: fs_manager.disk_usage(path, rescan=True), usage)
+    finally:
+        session.kernel.aio_manager.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:3]])
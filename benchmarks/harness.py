@@ -0,0 +1,73 @@
+"""
+Headless driver for the kernel.
+
+Boots a Kernel on a HeadlessConsole, feeds it a script of input lines and
+collects the output and timing of every line, so sessions can be measured
+repeatably without a human at the prompt.
+
+    session = HeadlessSession(["dir", "echo hi"])
+    for line, output, elapsed_ns in session.run():
+        ...
+"""
+import os
+import shutil
+import contextlib
+import time
+
+from devices.internal.A.apeos.system2.sys.process_mgr import ProcessManager
+from devices.internal.A.apeos.system2.sys.kernel import Kernel
+from devices.internal.A.apeos.system2.sys.console import HeadlessConsole
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DRIVE_A = os.path.join(PROJECT_ROOT, 'devices', 'internal', 'A')
+
+
+class HeadlessSession:
+    """A kernel driven by a script of input lines."""
+
+    def __init__(self, script, capture=True):
+        """
+        :param script: The input lines, fed one per prompt.
+        :param capture: Keep the output of every line (see HeadlessConsole).
+        """
+        self.console = HeadlessConsole(script, capture)
+        with contextlib.redirect_stdout(self.console.output_stream):
+            self.kernel = Kernel(ProcessManager(), "bench", "bench", "bench", console=self.console)
+            commands = self.kernel.io_manager.commands
+        if not commands:
+            raise RuntimeError("the kernel booted without any commands")
+        self.wall_ns = 0
+
+    def spawn(self, app, name):
+        """Starts an app as a background process before the session runs."""
+        with contextlib.redirect_stdout(self.console.output_stream):
+            return self.kernel.proc_manager.create_process(app, name, is_foreground=False)
+
+    def run(self):
+        """Runs the kernel until the script is exhausted and returns the transcript."""
+        start = time.perf_counter_ns()
+        with contextlib.redirect_stdout(self.console.output_stream):
+            self.kernel.start()
+        self.wall_ns = time.perf_counter_ns() - start
+        return self.console.transcript
+
+
+def run_script(script, capture=True):
+    """Runs a script in a fresh session and returns its transcript."""
+    return HeadlessSession(script, capture).run()
+
+
+@contextlib.contextmanager
+def scratch_dir(name='bench'):
+    """
+    A temporary directory on drive A, removed afterwards.
+
+    :return: (path as seen from inside aPEOS-I, host path)
+    """
+    dir_name = f"{name}_{os.getpid()}"
+    host_path = os.path.join(DRIVE_A, dir_name)
+    os.makedirs(host_path)
+    try:
+        yield f"A:/{dir_name}", host_path
+    finally:
+        shutil.rmtree(host_path, ignore_errors=True)
@@ -0,0 +1,70 @@
+"""
+Background throughput while the shell is idle.
+
+Boots a kernel whose console reads from a pipe nobody writes to (a user
+sitting at the prompt), starts a background counter process and measures
+how many steps it gets per second. A second run with no processes at all
+checks that the idle kernel sleeps instead of spinning.
+
+Run from the project root:  python -m benchmarks.idle_throughput [seconds]
+"""
+import os
+import sys
+import time
+import threading
+import contextlib
+
+from devices.internal.A.apeos.system2.sys.process_mgr import ProcessManager
+from devices.internal.A.apeos.system2.sys.kernel import Kernel
+from devices.internal.A.apeos.system2.sys.console import Console
+
+
+class Counter:
+    """A background app that only counts its own steps."""
+    def __init__(self):
+        self.steps = 0
+
+    def run(self):
+        while True:
+            self.steps += 1
+            yield
+
+
+def _boot(devnull):
+    """Boots a kernel on an idle console."""
+    read_fd, write_fd = os.pipe()
+    console = Console(os.fdopen(read_fd, 'r'), devnull)
+    with contextlib.redirect_stdout(devnull):
+        kernel = Kernel(ProcessManager(), "bench", "bench", "bench", console=console)
+    return kernel, write_fd
+
+
+def _run_for(kernel, seconds, devnull):
+    """Runs the kernel loop for a fixed wall-clock time."""
+    def stop():
+        kernel.running = False
+    threading.Timer(seconds, lambda: kernel.post_event(stop)).start()
+    cpu_before = time.process_time()
+    with contextlib.redirect_stdout(devnull):
+        kernel.start()
+    return time.process_time() - cpu_before
+
+
+def main(seconds=2.0):
+    with open(os.devnull, 'w') as devnull:
+        kernel, write_fd = _boot(devnull)
+        counter = Counter()
+        with contextlib.redirect_stdout(devnull):
+            kernel.proc_manager.create_process(counter, 'counter', is_foreground=False)
+        _run_for(kernel, seconds, devnull)
+        os.close(write_fd)
+        print(f"background steps while idle: {counter.steps:,} ({counter.steps / seconds:,.0f}/s)")
+
+        kernel, write_fd = _boot(devnull)
+        cpu = _run_for(kernel, seconds, devnull)
+        os.close(write_fd)
+        print(f"cpu used by an idle kernel:  {cpu * 1000:.1f} ms over {seconds:.1f} s")
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0)
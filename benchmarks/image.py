@@ -0,0 +1,93 @@
+"""
+Disk image drives.
+
+Runs the same small-file workload through the FileSystemManager API on a
+drive backed by a host directory and on one stored in a disk image: create
+a tree of small files and write it back, list every directory, read every
+file, copy the tree with 'copy /s' semantics and delete the copy. Both
+drives live in the same temporary directory on the host.
+
+Run from the project root:  python -m benchmarks.image [files] [file size]
+"""
+import os
+import sys
+import time
+import tempfile
+
+from benchmarks.harness import HeadlessSession
+
+FILES_PER_DIR = 100
+
+
+def _timed(phases, name, work):
+    start = time.perf_counter()
+    work()
+    phases[name] = time.perf_counter() - start
+
+
+def _workload(fs_manager, drive, count, size):
+    """Seconds each phase took on a drive."""
+    data = 'x' * (size - 1) + '\n'
+    dirs = [f"{drive}/tree/d{i:05}" for i in range(-(-count // FILES_PER_DIR))]
+    files = [f"{dirs[i // FILES_PER_DIR]}/file{i:07}.txt" for i in range(count)]
+
+    def create():
+        for directory in dirs:
+            fs_manager.create_directory(directory)
+        for path in files:
+            fs_manager.write_file(path, data)
+        fs_manager.sync()
+
+    def check(result):
+        if result:
+            raise RuntimeError(result)
+
+    phases = {}
+    _timed(phases, 'create', create)
+    _timed(phases, 'list', lambda: [fs_manager.list_directory(directory) for directory in dirs])
+    _timed(phases, 'read', lambda: [fs_manager.read_file(path) for path in files])
+    _timed(phases, 'copy', lambda: check(
+        fs_manager.copy_async([f"{drive}/tree"], f"{drive}/copy", recursive=True).result()))
+    _timed(phases, 'delete', lambda: check(fs_manager.force_delete(f"{drive}/copy")))
+    fs_manager.sync()
+    return phases
+
+
+def _host_usage(root):
+    """(bytes allocated on the host, host files and directories) below root."""
+    blocks = entries = 0
+    for directory, names, files in os.walk(root):
+        for name in names + files:
+            blocks += os.lstat(os.path.join(directory, name)).st_blocks
+            entries += 1
+    return blocks * 512, entries
+
+
+def main(count=20_000, size=200):
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, 'dir'))
+        session = HeadlessSession([])
+        fs_manager = session.kernel.fs_manager
+        for letter, host_path in (('D:', os.path.join(root, 'dir')), ('I:', os.path.join(root, 'drive.img'))):
+            error = fs_manager.mount(letter, host_path)
+            if error:
+                raise RuntimeError(error)
+        try:
+            print(f"{count:,} files of {size} bytes, {FILES_PER_DIR} per directory")
+            results = {letter: _workload(fs_manager, letter, count, size) for letter in ('D:', 'I:')}
+        finally:
+            fs_manager.close_images()
+            session.kernel.aio_manager.shutdown()
+        for phase in results['D:']:
+            directory, image = results['D:'][phase], results['I:'][phase]
+            print(f"{phase:<8} directory: {directory * 1000:>9.1f} ms   image: {image * 1000:>9.1f} ms   "
+                  f"{directory / image:5.1f}x")
+        host_bytes, host_entries = _host_usage(os.path.join(root, 'dir'))
+        image_bytes, _ = _host_usage(root)
+        image_bytes -= host_bytes
+        print(f"on the host  directory: {host_bytes / (1 << 20):,.1f} MB in {host_entries:,} entries   "
+              f"image: {image_bytes / (1 << 20):,.1f} MB in 1 file")
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:3]])
@@ -0,0 +1,55 @@
+"""
+Virtual-to-host path resolution.
+
+Resolves the same set of paths over and over, the way a script touching
+thousands of files does, through the uncached resolver, the cached
+_get_host_path and the bulk resolve_paths, and compares resolutions per
+second. With more paths than the cache holds (4096 by default) the LRU
+cache can no longer help, which the second argument lets you see.
+
+Run from the project root:  python -m benchmarks.path_resolution [paths] [rounds]
+"""
+import sys
+import time
+
+from benchmarks.harness import HeadlessSession
+
+
+def _rate(resolve, paths, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        resolve(paths)
+    return len(paths) * rounds / (time.perf_counter() - start)
+
+
+def main(count=2000, rounds=20):
+    fs_manager = HeadlessSession([]).kernel.fs_manager
+    # A mix of plain names, nested relative paths and absolute paths
+    paths = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            paths.append(f"file{i}.txt")
+        elif kind == 1:
+            paths.append(f"apeos/system2/../data/file{i}.txt")
+        else:
+            paths.append(f"A:/user/docs/file{i}.txt")
+
+    uncached = _rate(lambda ps: [fs_manager._resolve_host_path(p) for p in ps], paths, rounds)
+    fs_manager._get_host_path(paths[0]) # Make sure the drive is mounted
+    cached = _rate(lambda ps: [fs_manager._get_host_path(p) for p in ps], paths, rounds)
+    bulk = _rate(fs_manager.resolve_paths, paths, rounds)
+    # The first batch of a directory, before anything is cached
+    plain = [f"new{i}.txt" for i in range(count)]
+    fs_manager._invalidate_paths()
+    bulk_cold = _rate(fs_manager.resolve_paths, plain, 1)
+
+    print(f"uncached                 {uncached:>12,.0f} paths/s")
+    print(f"cached (LRU)             {cached:>12,.0f} paths/s   {cached / uncached:5.1f}x")
+    print(f"bulk                     {bulk:>12,.0f} paths/s   {bulk / uncached:5.1f}x")
+    print(f"bulk, cold plain names   {bulk_cold:>12,.0f} paths/s   {bulk_cold / uncached:5.1f}x")
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,62 @@
+"""
+Stress test for process reaping and PID recycling.
+
+Launches many short-lived processes through a ProcessManager, runs each to
+completion and checks that traced memory and the PID range stay flat: a
+finished process must leave nothing behind but a bounded exit status.
+
+Run from the project root:  python -m benchmarks.process_churn [count]
+"""
+import os
+import sys
+import time
+import tracemalloc
+import contextlib
+
+from devices.internal.A.apeos.system2.sys.process_mgr import ProcessManager
+
+
+class ShortApp:
+    """An app that does a few steps of work and exits."""
+    def __init__(self, payload_size=256):
+        self.payload = bytearray(payload_size)
+
+    def run(self):
+        yield
+        yield
+        return 0
+
+
+def main(count=100_000, batch=100):
+    manager = ProcessManager()
+    tracemalloc.start()
+    samples = []
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for launched in range(0, count, batch):
+            for _ in range(batch):
+                manager.create_process(ShortApp(), 'short', is_foreground=False)
+            while manager.run_next():
+                pass
+            if launched % (count // 10) == 0:
+                samples.append(tracemalloc.get_traced_memory()[0])
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    warm = samples[1] if len(samples) > 1 else samples[0]
+    growth = samples[-1] - warm
+    print(f"processes launched:   {count:,} in {elapsed:.2f} s ({count / elapsed:,.0f}/s)")
+    print(f"live processes:       {len(manager.processes)}")
+    print(f"unclaimed statuses:   {len(manager.exit_statuses)} (max {manager.max_exit_statuses})")
+    print(f"highest PID issued:   {manager.next_pid - 1}")
+    print(f"traced memory:        {warm / 1024:.0f} KiB -> {samples[-1] / 1024:.0f} KiB")
+
+    if manager.processes or growth > 64 * 1024:
+        print("FAIL: memory is not flat")
+        return 1
+    print("OK: memory stays flat")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
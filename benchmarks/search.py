@@ -0,0 +1,95 @@
+"""
+File search through the per-drive index.
+
+Creates a drive of many small text files, then times 'find' and 'grep' in
+two headless sessions. In the first the drive has no index yet: the first
+query starts building it in the background, and the queries read the
+directories themselves while the build runs. The second builds the index in
+the foreground ('index /rebuild') and then times queries that only read the
+index. For comparison it also times what the same searches cost as a walk of
+the whole tree.
+
+Run from the project root:  python -m benchmarks.search [files]
+"""
+import os
+import re
+import sys
+import contextlib
+import time
+import fnmatch
+import tempfile
+
+from benchmarks.harness import PROJECT_ROOT, run_script
+from devices.internal.A.apeos.system2.sys.search_mgr import index_path
+
+FILES_PER_DIR = 100
+INDEX_DIR = os.path.join(PROJECT_ROOT, '.apeos_cache', 'index') # Where the session keeps the drive's index
+
+
+def _make_drive(root, count):
+    for i in range(count):
+        directory = os.path.join(root, f"d{i // 10000:03}", f"d{i // FILES_PER_DIR:05}")
+        if i % FILES_PER_DIR == 0:
+            os.makedirs(directory)
+        with open(os.path.join(directory, f"file{i:07}.txt"), 'w') as f:
+            f.write(f"line one of {i}\nkey_{i:07} is here\n")
+
+
+def _walk_find(root, pattern):
+    match = re.compile(fnmatch.translate(pattern), re.IGNORECASE).match
+    return [name for _, _, names in os.walk(root) for name in names if match(name)]
+
+
+def _walk_grep(root, regex):
+    found = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            with open(os.path.join(directory, name), encoding='utf-8', errors='replace') as f:
+                found += [line for line in f if regex.search(line)]
+    return found
+
+
+def _time_session(title, script):
+    print(title)
+    for line, output, elapsed_ns in run_script(script)[1:]:
+        results = sum(1 for text in output.splitlines() if text.startswith('S:/'))
+        print(f"  {line:<38} {elapsed_ns / 1e6:>10.1f} ms  {results:>3} result(s)")
+
+
+def main(count=100_000):
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        _make_drive(root, count)
+        print(f"Created {count:,} files in {time.perf_counter() - start:.1f}s")
+        target = count // 2
+        mount = f"mount S: {root}"
+        _time_session("Without an index, while it is built:", [
+            mount,
+            f"find file{target:07} S:/", # Starts building the index
+            f"find file{target + 1:07} S:/",
+            f"grep key_{target:07} S:/",
+        ])
+        _time_session("With the index:", [
+            mount,
+            "index S: /rebuild",
+            f"find file{target:07} S:/",
+            f"find file{target + 1:07} S:/",
+            f"find *{target // 10:06}?.txt S:/",
+            f"grep key_{target:07} S:/",
+            f"grep /c key_{target + 7:07} S:/",
+        ])
+
+        print("Walking the tree on the host:")
+        start = time.perf_counter()
+        _walk_find(root, f"file{target:07}")
+        print(f"  {'find by name':<38} {(time.perf_counter() - start) * 1000:>10.1f} ms")
+        start = time.perf_counter()
+        _walk_grep(root, re.compile(f"key_{target:07}"))
+        print(f"  {'grep every file':<38} {(time.perf_counter() - start) * 1000:>10.1f} ms")
+        for suffix in ('', '-wal', '-shm'):
+            with contextlib.suppress(OSError):
+                os.remove(index_path(INDEX_DIR, root) + suffix)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:2]])
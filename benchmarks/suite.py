@@ -0,0 +1,227 @@
+"""
+Performance regression suite.
+
+Runs scripted sessions through the headless driver and measures:
+
+  dispatch   shell commands dispatched per second
+  scheduler  scheduler steps per second with background processes running
+  dir        'dir' on a directory with a huge number of entries
+  type       'type' on a large file
+  editor     loading and saving a large file in the banana editor
+  startup    time from starting the interpreter to the first prompt
+
+Results are printed, can be written as JSON, and are compared against a
+stored baseline; a metric that got worse by more than the threshold is
+reported as a regression and the suite exits with status 1.
+
+Run from the project root:
+    python -m benchmarks.suite [scenario ...] [--quick] [--repeat N]
+                               [--output FILE] [--baseline FILE] [--save-baseline]
+                               [--threshold FRACTION]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+
+from benchmarks import startup
+from benchmarks.harness import HeadlessSession, run_script, scratch_dir
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Problem sizes: (full run, --quick)
+SIZES = {
+    'dispatch': (5000, 500), # commands
+    'scheduler': ((8, 1.0), (4, 0.2)), # (background processes, seconds)
+    'dir': (100_000, 5_000), # directory entries
+    'type': (32, 2), # MiB
+    'editor': (100_000, 5_000), # lines
+    'startup': (10, 3), # boots
+}
+
+
+def _metric(value, unit, higher_is_better=True):
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def _elapsed(transcript, line):
+    """Seconds it took to run a scripted line."""
+    for fed, _, elapsed_ns in transcript:
+        if fed == line:
+            return elapsed_ns / 1e9
+    raise RuntimeError(f"'{line}' was never run")
+
+
+class _Counter:
+    """A background app that only counts its own steps."""
+    def __init__(self):
+        self.steps = 0
+
+    def run(self):
+        while True:
+            self.steps += 1
+            yield
+
+
+def bench_dispatch(commands):
+    transcript = run_script(["echo hi"] * commands)
+    elapsed = sum(elapsed_ns for _, _, elapsed_ns in transcript) / 1e9
+    return {
+        'commands_per_sec': _metric(commands / elapsed, 'cmd/s'),
+        'latency_us': _metric(elapsed / commands * 1e6, 'us', higher_is_better=False),
+    }
+
+
+def bench_scheduler(size):
+    processes, seconds = size
+    line = f"sleep {seconds}"
+    session = HeadlessSession([line])
+    counters = [_Counter() for _ in range(processes)]
+    for counter in counters:
+        session.spawn(counter, 'counter')
+    elapsed = _elapsed(session.run(), line)
+    return {'steps_per_sec': _metric(sum(c.steps for c in counters) / elapsed, 'steps/s')}
+
+
+def bench_dir(entries):
+    with scratch_dir('bench_dir') as (path, host_path):
+        for i in range(entries):
+            os.close(os.open(os.path.join(host_path, f"file{i:06}.txt"), os.O_CREAT | os.O_WRONLY))
+        line = f"dir {path}"
+        elapsed = _elapsed(run_script([line], capture=False), line)
+    return {
+        'seconds': _metric(elapsed, 's', higher_is_better=False),
+        'entries_per_sec': _metric(entries / elapsed, 'entries/s'),
+    }
+
+
+def bench_type(mib):
+    with scratch_dir('bench_type') as (path, host_path):
+        row = "The quick brown fox jumps over the lazy banana. " * 2 + "\n"
+        with open(os.path.join(host_path, 'big.txt'), 'w', encoding='utf-8') as f:
+            f.write(row * (mib * 1024 * 1024 // len(row)))
+        line = f"type {path}/big.txt"
+        elapsed = _elapsed(run_script([line], capture=False), line)
+    return {'mib_per_sec': _metric(mib / elapsed, 'MiB/s')}
+
+
+def bench_editor(lines):
+    with scratch_dir('bench_editor') as (path, host_path):
+        with open(os.path.join(host_path, 'doc.txt'), 'w', encoding='utf-8') as f:
+            f.writelines(f"line {i}: some text to edit\n" for i in range(lines))
+        open_line = f"banana {path}/doc.txt"
+        transcript = run_script([open_line, "one more line", ":wq"])
+        load = _elapsed(transcript, open_line)
+        save = _elapsed(transcript, ":wq")
+        if "saved successfully" not in transcript[-1][1]:
+            raise RuntimeError(f"the editor did not save: {transcript[-1][1]!r}")
+    return {
+        'load_lines_per_sec': _metric(lines / load, 'lines/s'),
+        'save_lines_per_sec': _metric(lines / save, 'lines/s'),
+    }
+
+
+def bench_startup(boots):
+    median_ms, _ = startup.measure(boots)
+    return {'time_to_prompt_ms': _metric(median_ms, 'ms', higher_is_better=False)}
+
+
+SCENARIOS = {
+    'dispatch': bench_dispatch,
+    'scheduler': bench_scheduler,
+    'dir': bench_dir,
+    'type': bench_type,
+    'editor': bench_editor,
+    'startup': bench_startup,
+}
+
+
+def run(names, quick=False, repeat=3):
+    """Runs the scenarios, keeping the best of several repeats for every metric."""
+    results = {}
+    for name in names:
+        size = SIZES[name][1 if quick else 0]
+        best = None
+        for _ in range(repeat):
+            metrics = SCENARIOS[name](size)
+            if best is None:
+                best = metrics
+                continue
+            for key, metric in metrics.items():
+                choose = max if metric['higher_is_better'] else min
+                best[key]['value'] = choose(best[key]['value'], metric['value'])
+        results[name] = best
+        for key, metric in best.items():
+            print(f"{name:<10} {key:<20} {metric['value']:>16,.2f} {metric['unit']}")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints the change of every metric against the baseline and returns the regressions."""
+    regressions = []
+    print(f"\nCompared with the baseline (threshold {threshold:.0%}):")
+    for name, metrics in results.items():
+        for key, metric in metrics.items():
+            old = baseline.get(name, {}).get(key)
+            if old is None or not old['value']:
+                continue
+            change = (metric['value'] - old['value']) / old['value']
+            worse = -change if metric['higher_is_better'] else change
+            flag = "REGRESSION" if worse > threshold else ""
+            if flag:
+                regressions.append(f"{name}.{key}")
+            print(f"{name:<10} {key:<20} {old['value']:>16,.2f} -> {metric['value']:>16,.2f} "
+                  f"{change:>+8.1%} {flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="aPEOS-I performance regression suite")
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"one of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--quick', action='store_true', help="small problem sizes, for a smoke test")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per scenario, the best one counts")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.10, help="allowed slowdown, as a fraction")
+    options = parser.parse_args(argv)
+    unknown = [name for name in options.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    results = run(options.scenarios or list(SCENARIOS), options.quick, options.repeat)
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': options.quick,
+        },
+        'results': results,
+    }
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    if options.save_baseline:
+        with open(options.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {options.baseline}")
+    elif os.path.exists(options.baseline):
+        with open(options.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('quick') != options.quick:
+            print("\nThe baseline was recorded with different problem sizes, not comparing.")
+        else:
+            regressions = compare(results, baseline['results'], options.threshold)
+            if regressions:
+                print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
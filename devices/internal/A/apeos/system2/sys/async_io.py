@@ -0,0 +1,37 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+class AsyncIOManager:
+    """
+    Runs blocking host I/O (deleting trees, moving across devices, listing
+    huge directories) on a small, bounded thread pool.
+
+    Callers get a concurrent.futures.Future. A process parks on it with the
+    Await syscall and the kernel wakes it through the scheduler once the work
+    is done, so the kernel loop never blocks on the host filesystem.
+    """
+
+    def __init__(self, max_workers=4):
+        """
+        :param max_workers: Maximum number of I/O threads.
+        """
+        self.max_workers = max_workers
+        self._executor = None # Threads are only started when something is offloaded
+
+    def submit(self, fn, *args):
+        """Runs fn(*args) on the pool and returns a Future for its result."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="aio")
+        return self._executor.submit(fn, *args)
+
+    @staticmethod
+    def completed(result):
+        """Returns a Future that already holds result, for work that needs no thread."""
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def shutdown(self):
+        """Waits for running operations to finish and stops the pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,296 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# The buffer cache keeps whole files in memory, keyed on their host path, for
+# read_file and write_file. A write only replaces the buffer and marks it
+# dirty; dirty buffers go to the host when the scheduler's write-back runs,
+# when they are evicted, on 'sync' and at shutdown. A clean buffer is used
+# as long as the host file still has the size and mtime it had when the
+# buffer last matched it, so changes made outside aPEOS-I are picked up.
+#
+# A dirty buffer evicted to make room is written on the I/O pool rather than
+# by the thread that wrote past the budget, usually the kernel's. Until it is
+# on disk it waits in a pending map, where reads still find it; a new write
+# to its file supersedes it, and a flush writes it first.
+
+DEFAULT_BUDGET = 16 << 20 # 16 MiB
+WRITEBACK_INTERVAL = 5.0 # Seconds between two write-backs, the longest a change stays in memory only
+# A file modified this recently may change again within the same mtime tick,
+# so an unchanged mtime would not prove its buffer is still up to date
+_RACY_NS = 1_000_000_000
+
+
+class _Buffer:
+    """The cached contents of one file."""
+
+    __slots__ = ('data', 'dirty', 'stamp', 'generation', 'modified')
+
+    def __init__(self, data, dirty, stamp):
+        self.data = data # bytes
+        self.dirty = dirty
+        self.modified = time.time() # Of the last write, what a listing shows until the write-back
+        self.stamp = stamp # (size, mtime_ns) of the host file when it matched data, None if not to be trusted
+        self.generation = 0 # Bumped by every write, so a write-back knows if it wrote the latest data
+
+
+class BufferCache:
+    """
+    A write-back cache of whole files with a memory budget. Least recently
+    used buffers are evicted first, dirty ones written back on the way out.
+    Files bigger than an eighth of the budget are not cached.
+
+    Thread-safe: reads and writes come from the kernel thread, write-backs
+    usually from the I/O pool. Write-backs run one at a time.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, on_written=None, opener=open, submit=None):
+        """
+        :param budget: Bytes of file data to keep in memory at most.
+        :param on_written: Called with the host path of every file written back.
+        :param opener: Opens a host file in a binary mode, like open(), e.g. to compress it.
+        :param submit: submit(fn) runs fn on another thread, e.g. AsyncIOManager.submit.
+                       Evicted dirty buffers are written back through it; without it,
+                       by the thread that evicted them.
+        """
+        self.budget = budget
+        self.on_written = on_written
+        self.opener = opener
+        self.submit = submit
+        self.size = 0 # Bytes cached
+        self.hits = 0
+        self.misses = 0
+        self.written_back = 0 # Files written to the host
+        self.failed = [] # (host path, error message) of evicted buffers that could not be written back
+        self._buffers = OrderedDict() # host path -> _Buffer
+        self._pending = OrderedDict() # host path -> evicted dirty _Buffer, until it is written back
+        self._writing = None # Host path of the pending buffer being written
+        self._draining = False # A pending write-back was submitted and has not finished
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @property
+    def max_file_size(self):
+        return self.budget // 8
+
+    @property
+    def dirty(self):
+        """Number of buffers waiting to be written back."""
+        return sum(1 for buffer in list(self._buffers.values()) if buffer.dirty) + len(self._pending)
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def read(self, host_path):
+        """Returns the contents of a file, from its buffer if it is up to date. Raises OSError."""
+        with self._lock:
+            buffer = self._buffers.get(host_path)
+            if buffer is not None and buffer.dirty:
+                self._buffers.move_to_end(host_path)
+                self.hits += 1
+                return buffer.data
+            pending = self._pending.get(host_path)
+            if pending is not None:
+                self.hits += 1
+                return pending.data # Evicted, not on disk yet
+            stamp = buffer.stamp if buffer is not None else None
+        if stamp is not None and _stamp(os.stat(host_path)) == stamp:
+            with self._lock:
+                if self._buffers.get(host_path) is buffer:
+                    self._buffers.move_to_end(host_path)
+                self.hits += 1
+            return buffer.data
+
+        with self.opener(host_path, 'rb') as f:
+            stamp = _stamp(os.fstat(f.fileno())) # Taken first: if the file changes while read, the stamp is stale
+            data = f.read()
+        with self._lock:
+            self.misses += 1
+            current = self._buffers.get(host_path)
+            if current is not None and current.dirty:
+                return current.data # Written while we were reading
+        if len(data) <= self.max_file_size:
+            self._insert(host_path, data, False, stamp)
+        else:
+            self.discard(host_path)
+        return data
+
+    def write(self, host_path, data):
+        """
+        Replaces the contents of a file in its buffer, to be written back later.
+        Returns False, buffering nothing, if data is too big to cache; the
+        caller then writes it to the host itself.
+        """
+        if len(data) > self.max_file_size:
+            self.flush(host_path, drop=True) # An older buffer must not be written back over it later
+            return False
+        self._insert(host_path, data, True, None)
+        return True
+
+    def store(self, host_path, data):
+        """Caches data just written to the host file, as a clean buffer."""
+        if len(data) > self.max_file_size:
+            self.discard(host_path)
+            return
+        try:
+            stamp = _stamp(os.stat(host_path))
+        except OSError:
+            return
+        self._insert(host_path, data, False, stamp)
+
+    def dirty_entries(self, host_dir):
+        """The files of a host directory with unwritten changes: {name: (size, modified)}, for listings."""
+        with self._lock:
+            return {os.path.basename(path): (len(buffer.data), buffer.modified)
+                    for buffers in (self._pending, self._buffers) for path, buffer in buffers.items()
+                    if buffer.dirty and os.path.dirname(path) == host_dir}
+
+    def _insert(self, host_path, data, dirty, stamp):
+        with self._lock:
+            self._pending.pop(host_path, None) # Older data, which must not be written over this
+            buffer = self._buffers.get(host_path)
+            if buffer is None:
+                buffer = self._buffers[host_path] = _Buffer(data, dirty, stamp)
+            else:
+                self.size -= len(buffer.data)
+                buffer.data, buffer.dirty, buffer.stamp = data, dirty, stamp
+                self._buffers.move_to_end(host_path)
+                if dirty:
+                    buffer.modified = time.time()
+            buffer.generation += 1
+            self.size += len(data)
+        self._evict()
+
+    def set_budget(self, budget):
+        """Changes the memory budget, evicting buffers right away if it shrank."""
+        self.budget = budget
+        self._evict()
+
+    def _evict(self):
+        """
+        Drops the least recently used buffers until the cache fits its budget.
+        The dirty ones go to the pending map, to be written back on the I/O pool.
+        """
+        with self._lock:
+            while self.size > self.budget and self._buffers:
+                path, victim = self._buffers.popitem(last=False)
+                self.size -= len(victim.data)
+                if victim.dirty:
+                    self._pending[path] = victim
+            if not self._pending or self._draining:
+                return
+            self._draining = True
+        if self.submit is not None:
+            try:
+                self.submit(self._drain)
+                return
+            except RuntimeError:
+                pass # The pool is shut down
+        self._drain()
+
+    def _drain(self):
+        """Writes back the pending buffers."""
+        with self._write_lock:
+            with self._lock:
+                self._draining = False
+            self._write_pending(None)
+
+    def _write_pending(self, host_path):
+        """
+        Writes back the pending buffers of the files at or below a host path (all
+        if None), failures to be reported by the next flush. Called with the write lock held.
+        """
+        prefix = None if host_path is None else os.path.join(host_path, '')
+        while True:
+            with self._lock:
+                path = next((path for path in self._pending
+                             if prefix is None or path == host_path or path.startswith(prefix)), None)
+                if path is None:
+                    return
+                buffer = self._pending[path]
+                self._writing = path
+            try:
+                self._write(path, buffer.data)
+            except OSError as e:
+                self.failed.append((path, e.strerror or str(e)))
+            finally:
+                with self._lock:
+                    self._writing = None
+                    if self._pending.get(path) is buffer: # Else written to again meanwhile
+                        del self._pending[path]
+
+    def flush(self, host_path=None, drop=False):
+        """
+        Writes back the dirty buffers, all of them or those of the files at
+        or below a host path. A buffer that cannot be written is dropped,
+        since every later write-back would fail the same way.
+        Blocking, meant for the I/O pool (or for a few files, any thread).
+
+        :param drop: Also forget the buffers, e.g. before the files are moved.
+        :return: (number of files written, [(host path, error message)])
+        """
+        prefix = None if host_path is None else os.path.join(host_path, '')
+        written = 0
+        with self._write_lock:
+            self._write_pending(host_path) # Before the newer data of any buffer
+            errors, self.failed = self.failed, [] # Evictions report through the next flush
+            with self._lock:
+                chosen = [(path, buffer, buffer.data, buffer.generation) for path, buffer in self._buffers.items()
+                          if prefix is None or path == host_path or path.startswith(prefix)]
+            for path, buffer, data, generation in chosen:
+                if not buffer.dirty:
+                    continue
+                try:
+                    stamp = self._write(path, data)
+                except OSError as e:
+                    errors.append((path, e.strerror or str(e)))
+                    self._remove(path, buffer)
+                    continue
+                written += 1
+                with self._lock:
+                    if buffer.generation == generation: # Not written to again meanwhile
+                        buffer.dirty = False
+                        buffer.stamp = stamp
+            if drop:
+                for path, buffer, _, _ in chosen:
+                    self._remove(path, buffer)
+        return written, errors
+
+    def discard(self, host_path=None):
+        """Forgets the buffers of the files at or below a host path (all if None), dirty or not, e.g. before they are deleted."""
+        prefix = None if host_path is None else os.path.join(host_path, '')
+        matches = lambda path: prefix is None or path == host_path or path.startswith(prefix)
+        with self._lock:
+            for path in [path for path in self._buffers if matches(path)]:
+                self.size -= len(self._buffers.pop(path).data)
+            for path in [path for path in self._pending if matches(path)]:
+                del self._pending[path]
+            writing = self._writing is not None and matches(self._writing)
+        if writing:
+            with self._write_lock:
+                pass # Let the write finish, so it cannot bring the file back afterwards
+
+    def _remove(self, host_path, buffer):
+        with self._lock:
+            if self._buffers.get(host_path) is buffer:
+                del self._buffers[host_path]
+                self.size -= len(buffer.data)
+
+    def _write(self, host_path, data):
+        """Writes data over a host file. Called with the write lock held. Returns the file's new stamp."""
+        with self.opener(host_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            stamp = _stamp(os.fstat(f.fileno()))
+        self.written_back += 1
+        if self.on_written is not None:
+            self.on_written(host_path)
+        return stamp
+
+
+def _stamp(stat):
+    """What identifies a version of a file: its size and mtime, or None if it is too recent to tell."""
+    if time.time_ns() - stat.st_mtime_ns < _RACY_NS:
+        return None
+    return stat.st_size, stat.st_mtime_ns
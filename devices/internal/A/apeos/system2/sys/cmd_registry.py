@@ -0,0 +1,160 @@
+import os
+import csv
+import marshal
+import importlib
+
+# Built-in commands register themselves with the @command decorator in
+# sys_cmd_exec; apps are listed in the sys_apps.csv manifest. The manifest
+# is compiled into a marshal cache under .apeos_cache and only re-parsed
+# when the CSV changes.
+
+_BUILTINS = {} # name -> Command, filled in by @command when sys_cmd_exec is imported
+_CACHE_FORMAT = 1
+
+class Command:
+    """A command the shell can run: a built-in handler or an app."""
+
+    __slots__ = ('name', 'alias', 'level', 'desc', 'category', 'handler', 'background', 'stream',
+                 'app_module', 'app_class', 'exec_mode')
+
+    def __init__(self, name, alias=None, level=1, desc='', category='utility', handler=None,
+                 background=False, stream=None, app_module=None, app_class=None, exec_mode=None):
+        """
+        :param handler: The handler function of a built-in that prints its output.
+        :param background: True if the command honours a trailing '&'.
+        :param stream: A function (args, kernel, io_manager, stdin) returning an
+                       iterator of output text, used in pipelines. The text comes
+                       in chunks of one or more whole lines; an empty chunk lets the
+                       kernel run before the command goes on with a long search.
+                       stdin is the previous stage's output in the same form, or
+                       None at the start of a pipeline.
+        :param app_module: App module, relative to the 'apeos.system2' package.
+        :param app_class: The app class inside that module.
+        :param exec_mode: 'worker' to run the app on a host worker process.
+        """
+        self.name = name
+        self.alias = alias
+        self.level = level
+        self.desc = desc
+        self.category = category
+        self.handler = handler
+        self.background = background
+        self.stream = stream
+        self.app_module = app_module
+        self.app_class = app_class
+        self.exec_mode = exec_mode
+
+    @property
+    def is_app(self):
+        return self.app_module is not None
+
+
+def command(name, alias=None, level=1, category='utility', background=False, stream=False):
+    """
+    Registers a function as a built-in command. Its docstring's first line is the description.
+
+    :param background: The handler takes an is_background argument and honours '&'.
+    :param stream: The function is a text generator (see Command) rather than a handler that prints.
+    """
+    def register(fn):
+        desc = (fn.__doc__ or '').strip().split('\n')[0]
+        if stream:
+            _BUILTINS[name] = Command(name, alias, level, desc, category, background=background, stream=fn)
+        else:
+            _BUILTINS[name] = Command(name, alias, level, desc, category, fn, background)
+        return fn
+    return register
+
+
+def pipe_form(name):
+    """Registers a generator as the form of an already registered built-in used in pipelines."""
+    def register(fn):
+        _BUILTINS[name].stream = fn
+        return fn
+    return register
+
+
+class CommandRegistry:
+    """
+    All commands known to the shell.
+
+    'lookup' maps every command name and alias to its Command, so resolving
+    what was typed is a single dict lookup.
+    """
+
+    def __init__(self, manifest_path, cache_path):
+        """
+        :param manifest_path: The CSV listing the apps.
+        :param cache_path: Where the compiled manifest is cached.
+        """
+        self.manifest_path = manifest_path
+        self.cache_path = cache_path
+        self.commands = {} # name -> Command
+        self.lookup = {} # name or alias -> Command
+
+    def load(self):
+        """Builds the registry from the built-ins and the app manifest. Raises OSError if the manifest is missing."""
+        from . import sys_cmd_exec # Importing it registers the built-ins
+        commands = dict(_BUILTINS)
+        for row in self._load_manifest():
+            app = Command(row['command'], row['alias'] or None, int(row['level'] or 1), row['desc'],
+                          row['category'] or 'app', background=row['allow_bg'].lower() == 'true',
+                          app_module=row['app_module'], app_class=row['app_class'],
+                          exec_mode=row['exec_mode'] or None)
+            commands[app.name] = app
+
+        lookup = {}
+        for cmd in commands.values():
+            if cmd.alias:
+                lookup[cmd.alias] = cmd
+        lookup.update(commands) # A command name always wins over an alias
+        self.commands, self.lookup = commands, lookup
+
+    def reload(self):
+        """
+        Re-imports the built-in command handlers and re-reads the manifest,
+        so changed commands take effect without restarting the kernel.
+        The old registry stays in place if anything fails.
+        """
+        from . import sys_cmd_exec
+        previous = dict(_BUILTINS)
+        _BUILTINS.clear()
+        try:
+            importlib.reload(sys_cmd_exec)
+            self.load()
+        except BaseException:
+            _BUILTINS.clear()
+            _BUILTINS.update(previous)
+            raise
+
+    def _load_manifest(self):
+        """Returns the manifest rows, from the cache if it is still up to date."""
+        stat = os.stat(self.manifest_path)
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        try:
+            with open(self.cache_path, 'rb') as f:
+                cache = marshal.load(f)
+            if cache['format'] == _CACHE_FORMAT and cache['stamp'] == stamp:
+                return cache['rows']
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            pass # Missing, stale or written by another Python version
+
+        rows = self._parse_manifest()
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, 'wb') as f:
+                marshal.dump({'format': _CACHE_FORMAT, 'stamp': stamp, 'rows': rows}, f)
+        except OSError as e:
+            print(f"Command Manager Warning: Could not write the command cache: {e}")
+        return rows
+
+    def _parse_manifest(self):
+        """Parses the CSV manifest into a list of plain dicts."""
+        rows = []
+        with open(self.manifest_path, mode='r', newline='', encoding='utf-8') as csvfile:
+            for row in csv.DictReader(csvfile):
+                # skip empty rows which can cause KeyErrors
+                if not row or not row.get('command'):
+                    continue
+                rows.append({k.strip(): (v or '').strip() for k, v in row.items() if k})
+        return rows
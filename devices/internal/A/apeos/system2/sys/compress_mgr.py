@@ -0,0 +1,487 @@
+import io
+import os
+import lzma
+import zlib
+import errno
+import shutil
+import struct
+from stat import S_ISDIR
+
+from .filesys_mgr import DirRecord
+
+# A compressed drive is a host directory like any other, but the files
+# written through aPEOS-I are stored compressed:
+#
+#   header   MAGIC, version, chunk size, crc32 of the index, size of the
+#            contents, where the index is
+#   frames   the contents cut into chunks of chunk size bytes, each
+#            compressed on its own, anywhere after the header
+#   index    (offset, stored length, method) of every chunk, in order
+#
+# Since every chunk is a frame of its own, a read only decompresses the
+# chunks it touches. A rewritten chunk is appended as a new frame, then a
+# new index, and the header, written last, is pointed at it; until then the
+# old index still describes the old contents. The space of the frames and
+# indexes left behind is reclaimed by rewriting the file once more than
+# half of it is garbage.
+#
+# A file without the header, e.g. one copied onto the drive's folder on the
+# host, is read as it is and compressed when it is first opened for writing.
+
+MAGIC = b'APEOSZ'
+VERSION = 1
+DEFAULT_CHUNK = 64 * 1024
+MAX_DIRTY = 16 # Chunks a writer holds before it compresses them
+SIZE_CACHE_MAX = 65536
+_HEADER = struct.Struct('<6sHIIQQ') # magic, version, chunk size, index crc32, size, index offset
+_ENTRY = struct.Struct('<QIB') # offset, stored length, method
+HOLE, STORED, ZLIB, LZMA = range(4) # How a chunk is stored; a hole is all zeros and takes no space
+METHODS = {'zlib': ZLIB, 'lzma': LZMA}
+_NO_FRAME = (0, 0, HOLE)
+
+
+class Codec:
+    """How the files of a compressed drive are compressed."""
+
+    __slots__ = ('method', 'level', 'chunk_size')
+
+    def __init__(self, method='zlib', level=None, chunk_size=DEFAULT_CHUNK):
+        """Raises ValueError for an unknown method or a chunk size that is not positive."""
+        if method not in METHODS:
+            raise ValueError(f"unknown compression method '{method}', use 'zlib' or 'lzma'")
+        if chunk_size <= 0:
+            raise ValueError("the chunk size must be positive")
+        self.method = METHODS[method]
+        self.level = level
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        The codec a drive's disk.json asks for with 'compression' ('zlib', the
+        default, or 'lzma'), 'level' and 'chunk_kb'. Raises ValueError.
+        """
+        level = config.get('level')
+        return cls(config.get('compression', 'zlib'), None if level is None else int(level),
+                   int(config.get('chunk_kb', DEFAULT_CHUNK // 1024)) * 1024)
+
+    def compress(self, chunk):
+        """(method, payload) of a chunk. A chunk that does not shrink is stored as it is."""
+        if chunk.count(0) == len(chunk):
+            return HOLE, b''
+        if self.method == ZLIB:
+            payload = zlib.compress(chunk, 6 if self.level is None else self.level)
+        else:
+            payload = lzma.compress(chunk, preset=6 if self.level is None else self.level)
+        if len(payload) >= len(chunk):
+            return STORED, bytes(chunk)
+        return self.method, payload
+
+
+def _decompress(method, payload):
+    if method == ZLIB:
+        return zlib.decompress(payload)
+    if method == LZMA:
+        return lzma.decompress(payload)
+    if method == STORED:
+        return payload
+    return b''
+
+
+class CompressedFile(io.RawIOBase):
+    """
+    An open file of a compressed drive ('rb', 'wb', 'ab' or 'r+b'). Written
+    chunks are held in memory until more than MAX_DIRTY are, or until flush
+    or close, which leave a complete file on the host.
+    """
+
+    def __init__(self, host_path, mode, codec):
+        super().__init__()
+        if mode not in ('rb', 'wb', 'ab', 'r+b'):
+            raise ValueError(f"invalid mode {mode!r}")
+        self.name = host_path
+        self.mode = mode
+        self._codec = codec
+        self._frames = [] # (offset, stored length, method) of the chunks stored so far
+        self._dirty = {} # Chunk number -> bytearray, written but not compressed yet
+        self._cached = (None, b'') # The chunk decompressed last
+        self._index = None # (offset, length) of the index the header points at
+        self._garbage = 0 # Bytes of frames and indexes nothing points at any more
+        self._changed = False # Since the last flush
+        self._plain = False
+        self._pos = 0
+        if mode == 'wb' or (mode == 'ab' and not os.path.exists(host_path)):
+            host_mode = 'w+b'
+        else:
+            host_mode = 'rb' if mode == 'rb' else 'r+b' # Appending reads the index and the last chunk
+        self._file = open(host_path, host_mode)
+        try:
+            self._load()
+        except BaseException:
+            self._file.close()
+            raise
+
+    def _load(self):
+        f = self._file
+        raw = f.read(_HEADER.size)
+        end = os.fstat(f.fileno()).st_size
+        if len(raw) == _HEADER.size and raw[:len(MAGIC)] == MAGIC:
+            _, version, self.chunk_size, crc, self.size, index_offset = _HEADER.unpack(raw)
+            if version != VERSION:
+                raise OSError(errno.EINVAL, "Unsupported compressed file version", self.name)
+            f.seek(index_offset)
+            index = f.read(-(-self.size // self.chunk_size) * _ENTRY.size)
+            if len(index) != -(-self.size // self.chunk_size) * _ENTRY.size or zlib.crc32(index) != crc:
+                raise OSError(errno.EIO, "Corrupt compressed file index", self.name)
+            self._frames = list(_ENTRY.iter_unpack(index))
+            self._index = (index_offset, len(index))
+            self._end = end
+            self._garbage = end - _HEADER.size - len(index) - sum(length for _, length, _ in self._frames)
+            return
+        if self.mode == 'rb':
+            self._plain = True # Read through
+            self.size = end
+            f.seek(0)
+            return
+        # Compressed from now on: its contents become the first chunks
+        f.seek(0)
+        data = f.read()
+        self.chunk_size = self._codec.chunk_size
+        self.size = 0
+        self._end = _HEADER.size
+        if data:
+            self._convert(data)
+
+    def _convert(self, data):
+        """
+        Replaces the plain host file with a compressed one holding data. Written
+        to a temporary file first, so a crash leaves one version or the other.
+        """
+        temp_path = self.name + '.convert~'
+        self._file.close()
+        self._file = open(temp_path, 'w+b')
+        try:
+            self._write(data)
+            self.flush()
+            self._file.close()
+            os.replace(temp_path, self.name)
+        except BaseException:
+            self._file.close()
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self._file = open(self.name, 'r+b')
+
+    # --- READING ---
+
+    def readable(self):
+        return self.mode in ('rb', 'r+b')
+
+    def writable(self):
+        return self.mode != 'rb'
+
+    def seekable(self):
+        return True
+
+    def _chunk(self, i):
+        """The contents of chunk i, which may be shorter than the chunk; the rest is zeros."""
+        chunk = self._dirty.get(i)
+        if chunk is not None:
+            return chunk
+        if self._cached[0] == i:
+            return self._cached[1]
+        if i >= len(self._frames):
+            return b''
+        offset, length, method = self._frames[i]
+        if method == HOLE:
+            return b''
+        self._file.seek(offset)
+        try:
+            data = _decompress(method, self._file.read(length))
+        except (zlib.error, lzma.LZMAError) as e:
+            raise OSError(errno.EIO, f"Corrupt compressed data in chunk {i}", self.name) from e
+        self._cached = (i, data)
+        return data
+
+    def readinto(self, buffer):
+        if not self.readable():
+            raise io.UnsupportedOperation("not readable")
+        if self._plain:
+            return self._file.readinto(buffer)
+        view = memoryview(buffer).cast('B')
+        done = 0
+        while done < len(view) and self._pos < self.size:
+            i, offset = divmod(self._pos, self.chunk_size)
+            n = min(len(view) - done, self.chunk_size - offset, self.size - self._pos)
+            part = self._chunk(i)[offset:offset + n]
+            view[done:done + len(part)] = part
+            if len(part) < n:
+                view[done + len(part):done + n] = bytes(n - len(part))
+            done += n
+            self._pos += n
+        return done
+
+    def readall(self):
+        if self._plain:
+            return self._file.read()
+        buffer = bytearray(max(self.size - self._pos, 0))
+        return bytes(buffer[:self.readinto(buffer)])
+
+    def getbuffer(self):
+        """A read-only view of the whole contents, what mmap() of a host file would give."""
+        pos = self.tell()
+        self.seek(0)
+        data = self.readall()
+        self.seek(pos)
+        return memoryview(data).toreadonly()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if self._plain:
+            return self._file.seek(offset, whence)
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise OSError(errno.EINVAL, "negative seek position")
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._file.tell() if self._plain else self._pos
+
+    def fileno(self):
+        return self._file.fileno()
+
+    # --- WRITING ---
+
+    def write(self, data):
+        if not self.writable():
+            raise io.UnsupportedOperation("not writable")
+        if self.mode == 'ab':
+            self._pos = self.size
+        return self._write(data)
+
+    def _write(self, data):
+        view = memoryview(data).cast('B')
+        size = self.chunk_size
+        done = 0
+        while done < len(view):
+            i, offset = divmod(self._pos, size)
+            n = min(size - offset, len(view) - done)
+            chunk = self._dirty.get(i)
+            if chunk is None:
+                # A chunk written over whole is not read first
+                chunk = self._dirty[i] = bytearray() if n == size else bytearray(self._chunk(i))
+            if len(chunk) < offset:
+                chunk.extend(bytes(offset - len(chunk)))
+            chunk[offset:offset + n] = view[done:done + n]
+            done += n
+            self._pos += n
+        self.size = max(self.size, self._pos)
+        self._changed = True
+        if len(self._dirty) > MAX_DIRTY:
+            self._spill(keep=(self._pos - 1) // size)
+        return len(view)
+
+    def _spill(self, keep=None):
+        """Compresses the written chunks, but the one a writer is still in, and appends them as frames."""
+        f = self._file
+        f.seek(self._end)
+        frames = self._frames
+        for i in sorted(self._dirty):
+            if i == keep:
+                continue
+            method, payload = self._codec.compress(self._dirty.pop(i))
+            frames.extend([_NO_FRAME] * (i + 1 - len(frames)))
+            self._garbage += frames[i][1]
+            if method == HOLE:
+                frames[i] = _NO_FRAME
+            else:
+                f.write(payload)
+                frames[i] = (self._end, len(payload), method)
+                self._end += len(payload)
+            if self._cached[0] == i:
+                self._cached = (None, b'')
+
+    def _index_bytes(self, frames):
+        count = -(-self.size // self.chunk_size)
+        frames = frames[:count] + [_NO_FRAME] * (count - len(frames))
+        return b''.join(_ENTRY.pack(*frame) for frame in frames)
+
+    def _header(self, index, index_offset):
+        return _HEADER.pack(MAGIC, VERSION, self.chunk_size, zlib.crc32(index), self.size, index_offset)
+
+    def flush(self):
+        """Compresses what was written and writes a new index, then the header, so the host file is complete."""
+        if self.closed or not self._changed:
+            return
+        self._spill()
+        index = self._index_bytes(self._frames)
+        f = self._file
+        f.seek(self._end)
+        f.write(index)
+        f.flush()
+        if self._index is not None:
+            self._garbage += self._index[1]
+        self._index = (self._end, len(index))
+        self._end += len(index)
+        f.seek(0)
+        f.write(self._header(index, self._index[0]))
+        f.flush()
+        self._changed = False
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+            if self.writable() and self._garbage > self._end // 2:
+                self._compact()
+        finally:
+            self._file.close()
+            super().close()
+
+    def _compact(self):
+        """Rewrites the file with its live frames only."""
+        temp_path = self.name + '.compact~'
+        frames = []
+        with open(temp_path, 'wb') as out:
+            out.seek(_HEADER.size)
+            for offset, length, method in self._frames:
+                if method == HOLE:
+                    frames.append(_NO_FRAME)
+                    continue
+                self._file.seek(offset)
+                frames.append((out.tell(), length, method))
+                out.write(self._file.read(length))
+            index = self._index_bytes(frames)
+            index_offset = out.tell()
+            out.write(index)
+            out.seek(0)
+            out.write(self._header(index, index_offset))
+        self._file.close()
+        os.replace(temp_path, self.name)
+
+
+def logical_size(host_path):
+    """The size of the contents of a compressed file, or None if it is stored as it is."""
+    try:
+        with open(host_path, 'rb') as f:
+            raw = f.read(_HEADER.size)
+    except OSError:
+        return None
+    if len(raw) < _HEADER.size or raw[:len(MAGIC)] != MAGIC:
+        return None
+    return _HEADER.unpack(raw)[4]
+
+
+class CompressedStore:
+    """
+    A mounted compressed drive: its codec and the sizes of its files.
+
+    It also has the interface of an ImageVolume (paths relative to the
+    root, '/'-separated), through which copy_mgr copies files in and out
+    of the drive, decompressing or compressing them on the way.
+    """
+
+    def __init__(self, root, codec):
+        self.root = root
+        self.codec = codec
+        self._sizes = {} # Host path -> ((size, mtime_ns) on the host, logical size)
+
+    def open_file(self, host_path, mode):
+        """Opens a file of the drive by its host path, as a binary CompressedFile."""
+        return CompressedFile(host_path, mode, self.codec)
+
+    def logical_size(self, host_path, stat):
+        """The size of a file's contents given its os.stat, read from its header once per version of the file."""
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        cached = self._sizes.get(host_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        size = logical_size(host_path)
+        if size is None:
+            size = stat.st_size
+        if len(self._sizes) >= SIZE_CACHE_MAX:
+            self._sizes.clear()
+        self._sizes[host_path] = (stamp, size)
+        return size
+
+    # --- THE IMAGEVOLUME INTERFACE ---
+
+    def _host(self, path):
+        path = path.strip('/')
+        return os.path.join(self.root, *path.split('/')) if path else self.root
+
+    def kind(self, path):
+        host_path = self._host(path)
+        if os.path.isdir(host_path):
+            return 'dir'
+        return 'file' if os.path.isfile(host_path) else None
+
+    def stat(self, path):
+        """(is_dir, size, mtime_ns) of what is at a path. Raises FileNotFoundError."""
+        host_path = self._host(path)
+        stat = os.stat(host_path)
+        is_dir = S_ISDIR(stat.st_mode)
+        return is_dir, 0 if is_dir else self.logical_size(host_path, stat), stat.st_mtime_ns
+
+    def scan(self, path):
+        """The entries of a directory as DirRecords, with their logical and stored sizes."""
+        records = []
+        with os.scandir(self._host(path)) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                    stat = entry.stat()
+                except OSError:
+                    continue # Vanished or a dangling link
+                if is_dir:
+                    records.append(DirRecord(entry.name, True, 0, stat.st_mtime))
+                else:
+                    records.append(DirRecord(entry.name, False, self.logical_size(entry.path, stat),
+                                             stat.st_mtime, stat.st_size))
+        return records
+
+    def read_bytes(self, path):
+        with self.open_file(self._host(path), 'rb') as f:
+            return f.readall()
+
+    def write_bytes(self, path, data, overwrite=True):
+        """Creates or replaces a file. Returns False, writing nothing, if it exists and overwrite is False."""
+        host_path = self._host(path)
+        if os.path.isdir(host_path):
+            raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+        if not overwrite and os.path.exists(host_path):
+            return False
+        with self.open_file(host_path, 'wb') as f:
+            f.write(data)
+        return True
+
+    def mkdir(self, path, parents=False, exist_ok=False):
+        host_path = self._host(path)
+        if parents:
+            os.makedirs(host_path, exist_ok=exist_ok)
+            return
+        try:
+            os.mkdir(host_path)
+        except FileExistsError:
+            if not (exist_ok and os.path.isdir(host_path)):
+                raise
+
+    def remove(self, path):
+        """Removes a file, or a directory with everything below it."""
+        host_path = self._host(path)
+        if os.path.isdir(host_path) and not os.path.islink(host_path):
+            shutil.rmtree(host_path)
+        else:
+            os.remove(host_path)
+
+    def rename(self, src, dst, overwrite=False):
+        dst_path = self._host(dst)
+        if os.path.exists(dst_path) and (not overwrite or os.path.isdir(dst_path)):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        os.replace(self._host(src), dst_path)
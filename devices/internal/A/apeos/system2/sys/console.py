@@ -0,0 +1,173 @@
+import io
+import os
+import time
+import sys
+import selectors
+import threading
+
+class Console:
+    """
+    The terminal device of aPEOS-I.
+
+    Reads the host's standard input without ever blocking the kernel loop.
+    Complete lines are handed to the kernel as input events, so the kernel
+    can keep running processes while the user is idle at the prompt.
+    """
+
+    def __init__(self, input_stream=None, output_stream=None):
+        """
+        Initializes the console.
+
+        :param input_stream: The host stream to read input from (defaults to stdin).
+        :param output_stream: The host stream to write output to (defaults to stdout).
+        """
+        self.input_stream = input_stream or sys.stdin
+        self.output_stream = output_stream or sys.stdout
+        self.encoding = getattr(self.input_stream, 'encoding', None) or 'utf-8'
+        self.kernel = None
+        self._fd = None
+        self._partial = b''  # Bytes of a line that has not been terminated yet
+        self._reader_thread = None
+
+    def attach(self, kernel):
+        """Registers the console as an event source of the kernel loop."""
+        self.kernel = kernel
+        self._fd = self.input_stream.fileno()
+        if os.name != 'nt':
+            try:
+                kernel.selector.register(self._fd, selectors.EVENT_READ, self._on_readable)
+                return
+            except (OSError, ValueError):
+                pass # E.g. stdin redirected from a regular file, which epoll refuses
+        # Windows can only select() on sockets, so there, and for any input
+        # that cannot be selected on, a reader thread feeds complete lines
+        # into the kernel's event queue instead.
+        self._reader_thread = threading.Thread(target=self._reader_loop, name="console-reader", daemon=True)
+        self._reader_thread.start()
+
+    def detach(self):
+        """Unregisters the console from the kernel loop."""
+        if self.kernel and self._reader_thread is None:
+            try:
+                self.kernel.selector.unregister(self._fd)
+            except (KeyError, ValueError):
+                pass
+        self.kernel = None
+
+    def _on_readable(self):
+        """Called by the kernel loop when the input file descriptor has data."""
+        data = os.read(self._fd, 4096)
+        if not data:
+            # End of input: deliver a trailing unterminated line, then EOF
+            if self._partial:
+                self.kernel.on_input(self._partial.decode(self.encoding, errors='replace'))
+                self._partial = b''
+            self.detach_input()
+            return
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self.kernel.on_input(line.decode(self.encoding, errors='replace').rstrip('\r'))
+
+    def detach_input(self):
+        """Stops watching the input and tells the kernel no more input will come."""
+        kernel = self.kernel
+        self.detach()
+        kernel.on_input_eof()
+
+    def _reader_loop(self):
+        """Blocking reader used where the input cannot be selected on."""
+        kernel = self.kernel
+        for line in iter(self.input_stream.readline, ''):
+            text = line.rstrip('\r\n')
+            kernel.post_event(lambda text=text: kernel.on_input(text))
+        kernel.post_event(kernel.on_input_eof)
+
+    def prompt(self, text):
+        """Shows a prompt; the answer arrives later as an input event."""
+        if text:
+            self.write(text)
+
+    def write(self, text):
+        """Writes text to the terminal immediately."""
+        self.output_stream.write(text)
+        self.output_stream.flush()
+
+
+class HeadlessConsole(Console):
+    """
+    A console driven by a script instead of a human, for benchmarks and
+    automated sessions.
+
+    Each time the kernel asks for input, the next scripted line is fed and
+    the output of the previous one is collected, together with the time it
+    took from the line being fed until the next prompt. When the script runs
+    out, the console reports EOF and the kernel shuts down.
+    """
+
+    def __init__(self, script, capture=True):
+        """
+        :param script: An iterable of input lines.
+        :param capture: Keep the output of every line. Without it, output is
+                        only counted, which keeps huge outputs cheap.
+
+        The kernel prints with print(), so the caller must point sys.stdout at
+        output_stream while the kernel runs.
+        """
+        super().__init__(io.StringIO(), io.StringIO() if capture else _CountingSink())
+        self.script = iter(script)
+        self.capture = capture
+        # (line, output, elapsed_ns) for every line fed; output is a character count without capture
+        self.transcript = []
+        self._line = None # The line currently being executed
+        self._fed_ns = 0
+
+    def attach(self, kernel):
+        """Nothing to watch: input is fed from prompt()."""
+        self.kernel = kernel
+
+    def detach(self):
+        self.kernel = None
+
+    def prompt(self, text):
+        """Finishes the previous line and feeds the next one."""
+        now = time.perf_counter_ns()
+        if self._line is not None:
+            self.transcript.append((self._line, self._take_output(), now - self._fed_ns))
+        else:
+            self._take_output() # Output printed before the first line (boot messages)
+        line = next(self.script, None)
+        self._line = line
+        if line is None:
+            self.kernel.on_input_eof()
+            return
+        self._fed_ns = time.perf_counter_ns()
+        self.kernel.on_input(line)
+
+    def _take_output(self):
+        """Returns and clears everything written since the last call."""
+        stream = self.output_stream
+        if not self.capture:
+            return stream.reset()
+        output = stream.getvalue()
+        stream.seek(0)
+        stream.truncate()
+        return output
+
+
+class _CountingSink:
+    """A write-only stream that only counts the characters written to it."""
+
+    def __init__(self):
+        self.count = 0
+
+    def write(self, text):
+        self.count += len(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def reset(self):
+        count, self.count = self.count, 0
+        return count
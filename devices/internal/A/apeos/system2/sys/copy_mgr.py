@@ -0,0 +1,433 @@
+import os
+import errno
+import shutil
+import time
+import threading
+from operator import itemgetter
+from stat import S_IMODE
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# The data of a file is copied by the host kernel, never through Python
+# buffers: copy_file_range (which a copy-on-write filesystem turns into a
+# reflink), else sendfile, and a plain read/write loop only when neither
+# works for the pair of files. A tree is planned first, with one scandir walk,
+# then its files are shared out to worker threads. The workers only bump the
+# counters of a CopyProgress; the thread waiting for them is the one that
+# reports progress, once a second.
+
+CHUNK = 64 << 20 # Bytes per kernel call, and how often a big file reports its progress
+WORKERS = 4 # Threads copying the files of a tree
+REPORT_INTERVAL = 1.0 # Seconds between two progress reports
+_BUFFER = 1 << 20 # Bytes per read of the read/write fallback
+# copy_file_range or sendfile cannot do this pair of files, the next method might
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                errno.ENOTSOCK, errno.EBADF, errno.ETXTBSY}
+_FD_TIMES = os.utime in os.supports_fd
+_FLAGS = getattr(os, 'O_BINARY', 0) | getattr(os, 'O_CLOEXEC', 0)
+_READ = os.O_RDONLY | _FLAGS
+_WRITE = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | _FLAGS
+_CREATE = os.O_WRONLY | os.O_CREAT | os.O_EXCL | _FLAGS
+_have_copy_file_range = hasattr(os, 'copy_file_range')
+_have_sendfile = hasattr(os, 'sendfile') and os.name == 'posix'
+
+
+class CopyProgress:
+    """The counters of a copy or move, updated by its workers and read by whoever reports on it."""
+
+    __slots__ = ('files_total', 'bytes_total', 'files_done', 'bytes_done', 'skipped', 'errors',
+                 'cancelled', 'started', '_lock')
+
+    def __init__(self):
+        self.files_total = 0
+        self.bytes_total = 0
+        self.files_done = 0
+        self.bytes_done = 0
+        self.skipped = [] # Host paths of the files left alone because they exist
+        self.errors = [] # (host path, message)
+        self.cancelled = False
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, files, size):
+        with self._lock:
+            self.files_done += files
+            self.bytes_done += size
+
+    def skip(self, host_path):
+        with self._lock:
+            self.skipped.append(host_path)
+
+    def fail(self, host_path, message):
+        with self._lock:
+            self.errors.append((host_path, message))
+
+    def cancel(self):
+        """Stops the copy after the files being copied, e.g. at shutdown."""
+        self.cancelled = True
+
+    @property
+    def seconds(self):
+        return time.monotonic() - self.started
+
+    def describe(self):
+        """A one-line report, e.g. 'Copying: 1,200 of 5,000 files, 310.0 of 1,024.0 MB (30%) at 95.1 MB/s'."""
+        mb_done = self.bytes_done / (1 << 20)
+        mb_total = self.bytes_total / (1 << 20)
+        percent = 100 * self.bytes_done // self.bytes_total if self.bytes_total else 100
+        return (f"Copying: {self.files_done:,} of {self.files_total:,} files, {mb_done:,.1f} of "
+                f"{mb_total:,.1f} MB ({percent}%) at {mb_done / max(self.seconds, 1e-6):,.1f} MB/s")
+
+
+class CopyPlan:
+    """What a copy will do: the directories to create, parents first, and every file as (source, destination, size)."""
+
+    __slots__ = ('dirs', 'files', 'size')
+
+    def __init__(self):
+        self.dirs = []
+        self.files = []
+        self.size = 0
+
+    def add_file(self, src, dst, size):
+        self.files.append((src, dst, size))
+        self.size += size
+
+    def add_tree(self, src, dst):
+        """Adds a directory and everything below it. Raises OSError if src cannot be read."""
+        self.dirs.append(dst)
+        stack = [(src, dst)]
+        first = True
+        while stack:
+            src_dir, dst_dir = stack.pop()
+            try:
+                entries = os.scandir(src_dir)
+            except OSError:
+                if first:
+                    raise
+                continue # Unreadable below the top; its files are simply missing from the copy
+            first = False
+            with entries:
+                for entry in entries:
+                    target = os.path.join(dst_dir, entry.name)
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            self.dirs.append(target)
+                            stack.append((entry.path, target))
+                        elif entry.is_file(): # Links to files are copied as files
+                            self.add_file(entry.path, target, entry.stat().st_size)
+                    except OSError:
+                        pass # Vanished or a dangling link
+
+
+def copy_file(src, dst, overwrite=True, progress=None):
+    """
+    Copies a file's data, permission bits (those the umask allows, for a new
+    file) and times. Returns the number of bytes copied.
+    Raises OSError; FileExistsError if dst exists and overwrite is False.
+
+    :param progress: A CopyProgress to count the file in.
+    """
+    # Plain descriptors rather than file objects: for a small file, setting
+    # those up would cost more than copying it
+    infd = os.open(src, _READ)
+    try:
+        st = os.fstat(infd)
+        outfd = os.open(dst, _WRITE if overwrite else _CREATE, S_IMODE(st.st_mode))
+        try:
+            big = progress is not None and st.st_size > CHUNK
+            copied = _copy_data(infd, outfd, st.st_size, progress if big else None)
+            if _FD_TIMES:
+                os.utime(outfd, ns=(st.st_atime_ns, st.st_mtime_ns))
+        finally:
+            os.close(outfd)
+    finally:
+        os.close(infd)
+    if not _FD_TIMES:
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+    if progress is not None:
+        progress.add(1, 0 if big else copied) # A big file counted its bytes as it went
+    return copied
+
+
+def _copy_data(infd, outfd, size, progress):
+    """Copies from the current offset of infd to that of outfd, by the fastest method that works."""
+    global _have_copy_file_range, _have_sendfile
+    copied = 0
+    if _have_copy_file_range:
+        try:
+            while copied < size:
+                sent = os.copy_file_range(infd, outfd, min(CHUNK, size - copied))
+                if not sent:
+                    return copied # The file shrank
+                copied += sent
+                if progress is not None:
+                    progress.add(0, sent)
+            return copied
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            if e.errno == errno.ENOSYS:
+                _have_copy_file_range = False
+    if _have_sendfile:
+        try:
+            while copied < size:
+                sent = os.sendfile(outfd, infd, None, min(CHUNK, size - copied))
+                if not sent:
+                    return copied
+                copied += sent
+                if progress is not None:
+                    progress.add(0, sent)
+            return copied
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            if e.errno == errno.ENOSYS:
+                _have_sendfile = False
+
+    while True:
+        data = os.read(infd, _BUFFER)
+        if not data:
+            return copied
+        view = memoryview(data)
+        while view:
+            view = view[os.write(outfd, view):]
+        copied += len(data)
+        if progress is not None:
+            progress.add(0, len(data))
+
+
+def run(plan, progress, overwrite=False, report=None, workers=WORKERS):
+    """
+    Creates the plan's directories, then copies its files on worker threads.
+    Blocking, meant for the I/O pool. Failures are collected in progress, not raised.
+
+    :param overwrite: Replace files that exist, instead of skipping them.
+    :param report: Called from this thread with progress.describe() about once a second.
+    """
+    with progress._lock:
+        progress.files_total += len(plan.files)
+        progress.bytes_total += plan.size
+    for directory in plan.dirs:
+        try:
+            os.mkdir(directory)
+        except FileExistsError:
+            if not os.path.isdir(directory):
+                progress.fail(directory, "A file has that name")
+        except OSError as e:
+            progress.fail(directory, e.strerror)
+    if not plan.files:
+        return
+
+    # The biggest files first, so one of them cannot be left to a single thread at the end
+    files = iter(sorted(plan.files, key=itemgetter(2), reverse=True))
+    files_lock = threading.Lock()
+
+    def worker():
+        while not progress.cancelled:
+            with files_lock:
+                item = next(files, None)
+            if item is None:
+                return
+            src, dst, _ = item
+            try:
+                copy_file(src, dst, overwrite, progress)
+            except FileExistsError:
+                progress.skip(dst)
+            except OSError as e:
+                progress.fail(src, e.strerror or str(e))
+
+    count = min(workers, len(plan.files))
+    if count == 1 and plan.size <= CHUNK:
+        worker() # Not worth a thread
+        return
+    with ThreadPoolExecutor(count, thread_name_prefix="copy") as pool:
+        futures = [pool.submit(worker) for _ in range(count)]
+        while wait(futures, timeout=REPORT_INTERVAL).not_done:
+            if report is not None:
+                report(progress.describe())
+    for future in futures:
+        future.result()
+
+
+def move(src, dst, progress, overwrite=False, report=None, workers=WORKERS):
+    """
+    Moves a file or directory: a rename on the same filesystem, else a copy
+    then a delete, which leaves the source in place if any of it failed.
+    Blocking, meant for the I/O pool. Raises OSError if the rename fails
+    for a reason other than crossing filesystems.
+    """
+    is_dir = os.path.isdir(src) and not os.path.islink(src)
+    try:
+        if overwrite and not is_dir:
+            os.replace(src, dst)
+        elif os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        else:
+            os.rename(src, dst)
+        progress.add(1, 0)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    plan = CopyPlan()
+    if is_dir:
+        plan.add_tree(src, dst)
+    else:
+        plan.add_file(src, dst, os.path.getsize(src))
+    failed = len(progress.errors) + len(progress.skipped)
+    run(plan, progress, overwrite, report, workers)
+    if len(progress.errors) + len(progress.skipped) > failed or progress.cancelled:
+        return # Keep the source; part of it did not make it
+    if is_dir:
+        shutil.rmtree(src)
+    else:
+        os.remove(src)
+
+
+# --- DISK IMAGES ---
+# A copy from, into or inside a disk image (see image_mgr) cannot use the
+# host's copy calls: its files are not host files. The data goes through
+# memory instead, a file at a time, which costs little since an image's
+# files are in memory already.
+
+class _Side:
+    """One end of a copy_across: a disk image, or the host if volume is None."""
+
+    __slots__ = ('volume',)
+
+    def __init__(self, volume):
+        self.volume = volume
+
+    def join(self, path, name):
+        if self.volume is None:
+            return os.path.join(path, name)
+        return f"{path}/{name}" if path else name
+
+    def is_dir(self, path):
+        if self.volume is None:
+            return os.path.isdir(path)
+        return self.volume.kind(path) == 'dir'
+
+    def size(self, path):
+        if self.volume is None:
+            return os.path.getsize(path)
+        return self.volume.stat(path)[1]
+
+    def entries(self, path):
+        """(name, is_dir, size) of the files and directories in a directory."""
+        if self.volume is not None:
+            return [(record.name, record.is_dir, record.size) for record in self.volume.scan(path)]
+        found = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        found.append((entry.name, True, 0))
+                    elif entry.is_file():
+                        found.append((entry.name, False, entry.stat().st_size))
+                except OSError:
+                    pass # Vanished or a dangling link
+        return found
+
+    def read(self, path):
+        if self.volume is not None:
+            return self.volume.read_bytes(path)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def write(self, path, data, overwrite):
+        """Returns False if the file exists and overwrite is False."""
+        if self.volume is not None:
+            return self.volume.write_bytes(path, data, overwrite)
+        try:
+            with open(path, 'wb' if overwrite else 'xb') as f:
+                f.write(data)
+        except FileExistsError:
+            return False
+        return True
+
+    def mkdir(self, path):
+        if self.volume is not None:
+            self.volume.mkdir(path, exist_ok=True)
+        else:
+            os.makedirs(path, exist_ok=True)
+
+    def remove(self, path):
+        if self.volume is not None:
+            self.volume.remove(path)
+        elif os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+def copy_across(src, dst, progress, overwrite=False, report=None, src_volume=None, dst_volume=None):
+    """
+    Copies a file or directory tree from, into or inside a disk image.
+    Blocking, meant for the I/O pool. Failures are collected in progress, not raised.
+
+    :param src: The path inside src_volume, or a host path if src_volume is None.
+    :param dst: The path inside dst_volume, or a host path if dst_volume is None.
+    :param report: Called from this thread with progress.describe() about once a second.
+    """
+    source, target = _Side(src_volume), _Side(dst_volume)
+    dirs, files = [], [] # What a CopyPlan holds, with paths of either side
+    try:
+        if source.is_dir(src):
+            stack = [(src, dst)]
+            while stack:
+                src_dir, dst_dir = stack.pop()
+                dirs.append((src_dir, dst_dir))
+                for name, is_dir, size in source.entries(src_dir):
+                    pair = (source.join(src_dir, name), target.join(dst_dir, name))
+                    if is_dir:
+                        stack.append(pair)
+                    else:
+                        files.append(pair + (size,))
+        else:
+            files.append((src, dst, source.size(src)))
+    except OSError as e:
+        progress.fail(src, e.strerror or str(e))
+        return
+    with progress._lock:
+        progress.files_total += len(files)
+        progress.bytes_total += sum(size for _, _, size in files)
+
+    for src_dir, dst_dir in dirs:
+        try:
+            target.mkdir(dst_dir)
+        except OSError as e:
+            progress.fail(src_dir, "A file has that name" if isinstance(e, FileExistsError) else e.strerror or str(e))
+    reported = time.monotonic()
+    for src_file, dst_file, _ in files:
+        if progress.cancelled:
+            return
+        try:
+            data = source.read(src_file)
+            if target.write(dst_file, data, overwrite):
+                progress.add(1, len(data))
+            else:
+                progress.skip(dst_file)
+        except OSError as e:
+            progress.fail(src_file, e.strerror or str(e))
+        if report is not None and time.monotonic() - reported >= REPORT_INTERVAL:
+            report(progress.describe())
+            reported = time.monotonic()
+
+
+def move_across(src, dst, progress, overwrite=False, report=None, src_volume=None, dst_volume=None):
+    """
+    Moves a file or directory from, into or inside a disk image: a rename
+    inside one image, else a copy_across then a delete, which leaves the
+    source in place if any of it failed. Raises OSError if the rename fails.
+    """
+    if src_volume is not None and src_volume is dst_volume:
+        src_volume.rename(src, dst, overwrite)
+        progress.add(1, 0)
+        return
+    failed = len(progress.errors) + len(progress.skipped)
+    copy_across(src, dst, progress, overwrite, report, src_volume, dst_volume)
+    if len(progress.errors) + len(progress.skipped) > failed or progress.cancelled:
+        return # Keep the source; part of it did not make it
+    _Side(src_volume).remove(src)
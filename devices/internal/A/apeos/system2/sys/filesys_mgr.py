@@ -1,7 +1,62 @@
 import os
+import re
 import json
+import mmap
+import codecs
+import io
+import fnmatch
 import shutil
-from datetime import datetime
+import time
+import threading
+from collections import OrderedDict, namedtuple
+from stat import S_ISDIR
+from .buffer_mgr import BufferCache, WRITEBACK_INTERVAL
+
+# --- ERRORS ---
+# The message of every error is ready to be shown to the user, e.g. print(e).
+
+class FileSystemError(Exception):
+    """Base class of the errors raised by the FileSystemManager."""
+
+class InvalidPathError(FileSystemError):
+    """The path is malformed, on an unknown drive or escapes its drive."""
+
+class PathNotFoundError(FileSystemError):
+    """Nothing exists at the path."""
+
+class NotAFileError(FileSystemError):
+    """The path is a directory where a file was expected."""
+
+class NotADirError(FileSystemError):
+    """The path is a file where a directory was expected."""
+
+class BadFileDescriptorError(FileSystemError):
+    """The file descriptor is not open, or not open for this operation."""
+
+class TooManyOpenFilesError(FileSystemError):
+    """The file descriptor table is full."""
+
+class FileAccessError(FileSystemError):
+    """The host refused or failed the operation."""
+
+
+# An entry of a directory listing. A plain tuple underneath, so a listing of
+# 100k entries stays small and sorts quickly. 'stored' is the size a file
+# takes on the host, for the files of compressed drives, else None.
+DirRecord = namedtuple('DirRecord', ('name', 'is_dir', 'size', 'modified', 'stored'), defaults=(None,))
+
+
+class _OpenFile:
+    """An entry of the file descriptor table."""
+
+    __slots__ = ('path', 'mode', 'file', 'mapping')
+
+    def __init__(self, path, mode, file):
+        self.path = path # The virtual path it was opened with
+        self.mode = mode
+        self.file = file # The host file object, always binary
+        self.mapping = None # mmap of the file, created on the first mmap() call
+
 
 class FileSystemManager:
     """
@@ -23,28 +78,66 @@ class FileSystemManager:
         # Use 'devices' folder at project root as the source for drives
         self.disks_path = os.path.join(self.project_root, 'devices')
         self.mounted_drives = {}  # e.g., {'A:': {'path': '...', 'type': '...'}}
+        # Every drive that can be mounted, e.g., {'A:': '/.../devices/internal/A'}.
+        # A drive is only mounted (its disk.json read) on first access.
+        self.drive_table = {}
+        self._attached = set() # Letters of the drives mounted from a host path this session, not in the table
+        self.cache_path = os.path.join(self.project_root, '.apeos_cache', 'drives.json')
+        self.index_dir = os.path.join(self.project_root, '.apeos_cache', 'index') # Search indexes, see search_mgr
         self.current_drive = None
         self.current_path = '/'  # Path relative to the current drive
         self.trashbin_path = None # Will be initialized after mounting
+        self.open_files = {} # The file descriptor table: fd -> _OpenFile
+        # Resolved host paths, keyed on (current drive, current path, virtual path).
+        # Least recently used entries are evicted first.
+        self._path_cache = OrderedDict()
+        self.path_cache_size = 4096
+        # What exists at each host path: host path -> (kind, mtime_ns, parent mtime_ns, checked at).
+        # See _path_kind. Least recently used entries are evicted first.
+        self._stat_cache = OrderedDict()
+        self._stat_lock = threading.Lock() # Mutations on the I/O pool invalidate entries
+        self.stat_cache_size = 4096
+        self.stat_cache_ttl = 1.0 # Seconds an entry is trusted before it is revalidated
+        self.stat_cache_hits = 0
+        self.stat_cache_misses = 0
+        self.max_open_files = 256
+        # Whole files read and written by read_file and write_file. Writes stay
+        # in memory until the periodic write-back, 'sync' or shutdown.
+        self.buffers = BufferCache(on_written=self._path_changed, opener=self._open_host,
+                                   submit=lambda fn: self.kernel.aio_manager.submit(fn))
+        self._writeback = None # Timer of the periodic write-back, once something was buffered
+        self._writeback_future = None
+        self._search = None
+        self._indexed = None # Whether any drive had a search index at the first change, see _search_to_notify
+        self._trash = None
+        self._usage = None
+        self._transfers = set() # CopyProgress of the copies and moves running on the I/O pool
+        # The mounted drives stored in a disk image, keyed on their root: the
+        # host path of the image file, under which the paths of their files are
+        # made up as if it were a directory. See image_mgr.
+        self._volumes = {}
+        # The CompressedStore of every mounted compressed drive, keyed on its
+        # host folder. See compress_mgr.
+        self._compressed = {}
 
-        self._mount_drives()
+        self._load_drive_table()
 
-        if 'A:' in self.mounted_drives:
+        if 'A:' in self.drive_table:
             self.current_drive = 'A:'
-        elif self.mounted_drives:
+        elif self.drive_table:
             # Fallback to the first available drive if A: is not found
-            self.current_drive = sorted(self.mounted_drives.keys())[0]
+            self.current_drive = sorted(self.drive_table.keys())[0]
         else:
             print("FSManager Warning: No drives found in 'devices' directory.")
         
         # Initialize trashbin on drive A: if it exists
-        if 'A:' in self.mounted_drives:
+        if 'A:' in self.drive_table:
             self.trashbin_path = self._get_host_path('A:/user/trashbin')
 
-    def _mount_drives(self):
+    def _load_drive_table(self):
         """
-        Scans the 'disks' directory and mounts found drives.
-        A drive is a subdirectory in the 'disks' folder.
+        Fills the drive table, from the cache if the 'devices' folders have
+        not changed since it was written, otherwise by scanning them.
         """
         if not os.path.isdir(self.disks_path):
             print(f"FSManager Info: 'devices' directory not found at {self.disks_path}. Creating it.")
@@ -54,22 +147,235 @@ class FileSystemManager:
                 print(f"FSManager FATAL: Could not create 'devices' directory: {e}")
                 return
 
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            # Adding or removing a drive folder changes the mtime of its parent
+            if all(os.stat(path).st_mtime_ns == mtime for path, mtime in cache['mtimes'].items()):
+                self.drive_table = cache['drives']
+                return
+        except (OSError, ValueError, KeyError, TypeError):
+            pass # Missing, corrupt or stale: rescan
+
+        self._scan_drives()
+
+    def _scan_drives(self):
+        """
+        Scans the 'devices' directory for drives and caches the result.
+        A drive is a subdirectory of a device type folder, e.g., 'devices/internal/A'.
+        """
+        self.drive_table = {}
+        self._invalidate_paths()
+        mtimes = {self.disks_path: os.stat(self.disks_path).st_mtime_ns}
         # Scan subdirectories within 'devices' (like 'internal', 'external')
-        for device_type_folder in os.listdir(self.disks_path):
-            device_type_path = os.path.join(self.disks_path, device_type_folder)
-            if os.path.isdir(device_type_path):
+        with os.scandir(self.disks_path) as device_types:
+            for device_type in device_types:
+                if not device_type.is_dir():
+                    continue
+                mtimes[device_type.path] = device_type.stat().st_mtime_ns
                 # Now scan for actual drives (like 'A', 'B') inside the type folder
-                for drive_name in os.listdir(device_type_path):
-                    drive_path = os.path.join(device_type_path, drive_name)
-                    if os.path.isdir(drive_path):
-                        drive_letter = f"{drive_name.upper()}:"
-                        drive_info = self._read_drive_config(drive_path)
-                        self.mounted_drives[drive_letter] = {
-                            'path': drive_path,
-                            'type': drive_info.get('type', 'generic'),
-                            'label': drive_info.get('label', 'No Label')
-                        }
-                        print(f"FSManager: Mounted drive {drive_letter} ({drive_info.get('type', 'generic')})")
+                with os.scandir(device_type.path) as drives:
+                    for drive in drives:
+                        if drive.is_dir():
+                            self.drive_table[f"{drive.name.upper()}:"] = drive.path
+
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, 'w', encoding='utf-8') as f:
+                json.dump({'mtimes': mtimes, 'drives': self.drive_table}, f)
+        except OSError as e:
+            print(f"FSManager Warning: Could not write the drive table cache: {e}")
+
+    def _get_drive(self, drive_letter):
+        """
+        Returns the info of a drive, mounting it on first access.
+        Returns None if there is no such drive.
+        """
+        drive = self.mounted_drives.get(drive_letter)
+        if drive is None:
+            drive_path = self.drive_table.get(drive_letter)
+            if drive_path is None:
+                return None
+            if os.path.isfile(drive_path) or (drive_path.lower().endswith('.img') and not os.path.isdir(drive_path)):
+                # An image file mounted with 'mount X: file.img', formatted if new
+                drive_info = {'type': 'image', 'image': drive_path}
+            elif os.path.isdir(drive_path):
+                drive_info = self._read_drive_config(drive_path)
+            else:
+                # The folder went away since the table was cached
+                del self.drive_table[drive_letter]
+                self._invalidate_paths()
+                return None
+            drive = {
+                'path': drive_path,
+                'type': drive_info.get('type', 'generic'),
+                'label': drive_info.get('label', 'No Label')
+            }
+            if drive['type'] == 'image':
+                drive['path'] = self._open_image(drive_letter, os.path.join(drive_path, drive_info.get('image', 'disk.img')))
+                if drive['path'] is None:
+                    return None
+            elif drive['type'] == 'compressed':
+                from .compress_mgr import Codec, CompressedStore
+                try:
+                    codec = Codec.from_config(drive_info)
+                except (TypeError, ValueError) as e:
+                    print(f"FSManager Warning: Bad compression settings for drive {drive_letter}: {e}")
+                    return None
+                self._compressed[drive_path] = CompressedStore(drive_path, codec)
+            self.mounted_drives[drive_letter] = drive
+            print(f"FSManager: Mounted drive {drive_letter} ({drive['type']})")
+        return drive
+
+    def _open_image(self, drive_letter, image_path):
+        """
+        Opens the disk image of a drive, formatting a new one if the file does
+        not exist yet. Returns the image path, the root of the drive's host
+        paths, or None if it cannot be opened.
+        """
+        from .image_mgr import ImageVolume
+        image_path = os.path.abspath(image_path)
+        try:
+            if os.path.exists(image_path):
+                volume = ImageVolume(image_path)
+            else:
+                volume = ImageVolume.create(image_path)
+                print(f"FSManager: Formatted a new disk image for drive {drive_letter}")
+        except OSError as e:
+            print(f"FSManager Warning: Could not open the disk image of drive {drive_letter}: {e}")
+            return None
+        self._volumes[image_path] = volume
+        self._schedule_write_back() # Which also commits the images
+        return image_path
+
+    def _volume_of(self, host_path):
+        """The ImageVolume a host path is on and the path inside it, or (None, None) for a plain host path."""
+        return _find_root(self._volumes, host_path)
+
+    def _compressed_of(self, host_path):
+        """
+        The CompressedStore of the drive a host path is on and the path inside
+        it, or (None, None). The drive's disk.json is always stored as it is.
+        """
+        store, inner = _find_root(self._compressed, host_path)
+        if inner == 'disk.json':
+            return None, None
+        return store, inner
+
+    def _store_of(self, host_path):
+        """
+        What copies a file to or from a host path other than byte for byte:
+        (ImageVolume or CompressedStore, path inside it), or (None, None).
+        """
+        found = self._volume_of(host_path)
+        if found[0] is None and self._compressed:
+            found = self._compressed_of(host_path)
+        return found
+
+    def _open_host(self, host_path, mode):
+        """Opens the file at a host path in a binary mode, through the disk image or compressed drive it is on."""
+        volume, inner = self._volume_of(host_path)
+        if volume is not None:
+            return volume.open(inner, mode, host_path)
+        store = self._compressed_of(host_path)[0] if self._compressed else None
+        if store is not None:
+            return store.open_file(host_path, mode)
+        return open(host_path, mode)
+
+    def is_compressed(self, path):
+        """True if a virtual path is on a compressed drive."""
+        host_path = self._get_host_path(path)
+        return host_path is not None and self._compressed_of(host_path)[0] is not None
+
+    def mount(self, drive_letter, host_path=None):
+        """
+        Mounts a drive. With a host path, attaches that directory or disk
+        image as a new drive for this session (a missing '.img' file is
+        formatted as a new, empty image); without one, mounts a drive from
+        the table.
+        Returns an error message string on failure, None on success.
+        """
+        drive_letter = drive_letter.upper()
+        if not (len(drive_letter) == 2 and drive_letter[0].isalpha() and drive_letter[1] == ':'):
+            return f"Error: '{drive_letter}' is not a drive letter, e.g., 'B:'."
+        if host_path is not None:
+            if drive_letter in self.drive_table:
+                return f"Error: Drive '{drive_letter}' already exists."
+            host_path = os.path.abspath(host_path)
+            if os.path.isfile(host_path):
+                from .image_mgr import is_image
+                if not is_image(host_path):
+                    return f"Error: '{host_path}' is not a disk image."
+            elif not os.path.isdir(host_path) and not host_path.lower().endswith('.img'):
+                return f"Error: '{host_path}' is not a directory on the host."
+            self.drive_table[drive_letter] = host_path
+            self._attached.add(drive_letter)
+            self._invalidate_paths()
+        elif drive_letter in self.mounted_drives:
+            return f"Error: Drive '{drive_letter}' is already mounted."
+        if self._get_drive(drive_letter) is None:
+            if host_path is not None:
+                self.drive_table.pop(drive_letter, None)
+                self._attached.discard(drive_letter)
+            return f"Error: Drive '{drive_letter}' not found."
+        return None
+
+    def unmount(self, drive_letter):
+        """
+        Unmounts a drive. A drive of the devices table stays in it and can be
+        mounted again with 'mount X:'; one attached from a host path this
+        session is forgotten. Refused while files of the drive are open.
+        Returns an error message string on failure, None on success.
+        """
+        drive_letter = drive_letter.upper()
+        if drive_letter not in self.drive_table:
+            return f"Error: Drive '{drive_letter}' not found."
+        if drive_letter == self.current_drive:
+            return f"Error: Cannot unmount the current drive '{drive_letter}'."
+        if drive_letter == 'A:':
+            return "Error: Cannot unmount the system drive 'A:'."
+        if drive_letter not in self.mounted_drives and drive_letter not in self._attached:
+            return f"Error: Drive '{drive_letter}' is not mounted."
+        root = self.mounted_drives[drive_letter]['path'] if drive_letter in self.mounted_drives else None
+        if root is not None:
+            # Their files would lose the disk image or compressed store they write through
+            prefix = os.path.join(root, '')
+            busy = sorted(fd for fd, entry in self.open_files.items()
+                          if entry.file.name == root or str(entry.file.name).startswith(prefix))
+            if busy:
+                return (f"Error: Drive '{drive_letter}' is in use by {len(busy)} open file(s) "
+                        f"(descriptor {', '.join(map(str, busy))}), close them first.")
+        drive = self.mounted_drives.pop(drive_letter, None)
+        if drive:
+            # Written back while the drive's files are still compressed on the way
+            for message in self._flush_buffers(drive['path'], drop=True):
+                print(message)
+            self._compressed.pop(drive['path'], None)
+        volume = self._volumes.pop(drive['path'], None) if drive else None
+        if volume is not None:
+            try:
+                volume.close()
+            except OSError as e:
+                print(f"FSManager Warning: Could not write the disk image of drive {drive_letter}: {e}")
+        if drive_letter in self._attached:
+            del self.drive_table[drive_letter]
+            self._attached.discard(drive_letter)
+        self._invalidate_paths()
+        return None
+
+    def list_drives(self):
+        """Returns a list of dictionaries with 'letter', 'path', 'mounted', 'type' and 'label' for every drive."""
+        drives = []
+        for letter in sorted(self.drive_table):
+            info = self.mounted_drives.get(letter)
+            drives.append({
+                'letter': letter,
+                'path': self.drive_table[letter],
+                'mounted': info is not None,
+                'type': info['type'] if info else None,
+                'label': info['label'] if info else None,
+            })
+        return drives
 
     def _read_drive_config(self, drive_path):
         """
@@ -85,6 +391,47 @@ class FileSystemManager:
                 print(f"FSManager Warning: Could not read or parse {config_path}: {e}")
         return {}
 
+    @property
+    def search(self):
+        """The SearchManager with the search indexes of the drives, created on first use."""
+        if self._search is None:
+            from .search_mgr import SearchManager
+            with self._stat_lock: # Changes on the I/O pool may get here first
+                if self._search is None:
+                    self._search = SearchManager(self)
+        return self._search
+
+    def _search_to_notify(self):
+        """
+        The SearchManager to tell about a change, or None if there is none and
+        no drive has an index, so that changes do not load search for nothing.
+        """
+        if self._search is None:
+            if self._indexed is None:
+                try:
+                    self._indexed = any(name.endswith('.db') for name in os.listdir(self.index_dir))
+                except OSError:
+                    self._indexed = False
+            if not self._indexed:
+                return None
+        return self.search
+
+    def _locate(self, host_path):
+        """The drive letter and '/'-separated relative path of a host path on a mounted drive, or (None, None)."""
+        found = None, None
+        longest = -1
+        for letter, drive in list(self.mounted_drives.items()):
+            root = drive['path'] # A drive may be mounted inside another one; the innermost wins
+            if len(root) > longest and (host_path == root or host_path.startswith(root + os.sep)):
+                found = letter, host_path[len(root) + 1:].replace(os.sep, '/')
+                longest = len(root)
+        return found
+
+    def _virtual_path(self, host_path):
+        """The absolute virtual path of a host path, e.g. 'A:/docs/x.txt', or None if it is on no drive."""
+        letter, rel_path = self._locate(host_path)
+        return None if letter is None else f"{letter}/{rel_path}"
+
     def get_full_current_path(self):
         """Returns the full virtual path, e.g., 'A:\system'."""
         if not self.current_drive:
@@ -96,6 +443,293 @@ class FileSystemManager:
         Converts a virtual path (e.g., 'A:\system') to a real host OS path.
         Returns None if the path is invalid.
         """
+        key = (self.current_drive, self.current_path, virtual_path)
+        cache = self._path_cache
+        host_path = cache.get(key)
+        if host_path is not None:
+            cache.move_to_end(key)
+            return host_path
+        host_path = self._resolve_host_path(virtual_path)
+        if host_path is not None: # Rejected paths are rare and print a warning, so they are not cached
+            cache[key] = host_path
+            if len(cache) > self.path_cache_size:
+                cache.popitem(last=False)
+        return host_path
+
+    def resolve_paths(self, virtual_paths):
+        """
+        Converts many virtual paths at once. The cache is looked up directly,
+        and plain names relative to the current directory are joined to it
+        without the full resolution, so a big batch of files in one directory
+        is cheap even the first time.
+        Returns a list of host paths, with None for invalid paths.
+        """
+        base = self._get_host_path('.')
+        drive, current_path = self.current_drive, self.current_path
+        cache = self._path_cache
+        get = cache.get
+        join = os.path.join
+        resolve = self._get_host_path
+        results = []
+        append = results.append
+        for virtual_path in virtual_paths:
+            host_path = get((drive, current_path, virtual_path))
+            if host_path is None:
+                if (base is not None and virtual_path and virtual_path not in ('.', '..')
+                        and '/' not in virtual_path and '\\' not in virtual_path and ':' not in virtual_path):
+                    host_path = cache[(drive, current_path, virtual_path)] = join(base, virtual_path)
+                else:
+                    host_path = resolve(virtual_path)
+            append(host_path)
+        # Keep the cache bounded; recency is not refreshed for a bulk lookup
+        while len(cache) > self.path_cache_size:
+            cache.popitem(last=False)
+        return results
+
+    def _invalidate_paths(self):
+        """Forgets all resolved paths, after the drives changed."""
+        self._path_cache.clear()
+
+    # --- DENTRY CACHE ---
+    # Existence and type checks go through _path_kind, which remembers what it
+    # found. An entry is trusted for stat_cache_ttl seconds; after that it stays
+    # valid as long as its parent directory's mtime has not changed, since
+    # creating, deleting or renaming anything in a directory changes its mtime.
+    # The parent's mtime is itself cached, so the entries of one directory are
+    # revalidated with a single stat. Changes made through the FileSystemManager
+    # invalidate their entries right away.
+
+    # A directory modified this recently may change again within the same
+    # timestamp tick, so an unchanged mtime would not prove anything
+    _RACY_NS = 1_000_000_000
+
+    def _path_kind(self, host_path):
+        """Returns 'dir' or 'file' for what exists at a host path (following symlinks), or None."""
+        if self._volumes:
+            volume, inner = self._volume_of(host_path)
+            if volume is not None:
+                return volume.kind(inner) # Already in memory, nothing to cache
+        now = time.monotonic()
+        with self._stat_lock:
+            entry = self._stat_cache.get(host_path)
+            if entry is not None:
+                kind, mtime, parent_mtime, checked = entry
+                if now - checked < self.stat_cache_ttl or (
+                        parent_mtime is not None
+                        and self._dir_mtime(os.path.dirname(host_path), now) == parent_mtime):
+                    if now - checked >= self.stat_cache_ttl:
+                        self._stat_cache[host_path] = (kind, mtime, parent_mtime, now)
+                    self._stat_cache.move_to_end(host_path)
+                    self.stat_cache_hits += 1
+                    return kind
+            self.stat_cache_misses += 1
+            parent = os.path.dirname(host_path)
+            parent_mtime = self._dir_mtime(parent, now) if parent != host_path else None
+            return self._stat_path(host_path, parent_mtime, now)[0]
+
+    def _dir_mtime(self, host_path, now):
+        """The mtime of a directory, re-read once it is older than stat_cache_ttl. None if it is gone."""
+        entry = self._stat_cache.get(host_path)
+        if entry is None or now - entry[3] >= self.stat_cache_ttl:
+            # The directory's own parent does not change when its entries do, so it is stat'ed directly
+            entry = self._stat_path(host_path, entry[2] if entry else None, now)
+        return entry[1] if entry[0] == 'dir' else None
+
+    def _stat_path(self, host_path, parent_mtime, now):
+        """Stats a host path and caches the result. Called with the lock held."""
+        try:
+            stat = os.stat(host_path)
+        except (OSError, ValueError):
+            kind, mtime = None, None
+        else:
+            kind = 'dir' if S_ISDIR(stat.st_mode) else 'file'
+            mtime = stat.st_mtime_ns
+        if parent_mtime is not None and time.time_ns() - parent_mtime < self._RACY_NS:
+            parent_mtime = None # Always re-stat this one when the TTL is up
+        entry = (kind, mtime, parent_mtime, now)
+        cache = self._stat_cache
+        cache[host_path] = entry
+        cache.move_to_end(host_path)
+        if len(cache) > self.stat_cache_size:
+            cache.popitem(last=False)
+        return entry
+
+    def _path_changed(self, host_path):
+        """
+        Called after something at a host path was created, changed or removed:
+        forgets what is known about it, everything below it and its parent
+        directory, and tells the search index.
+        """
+        if self._volumes and self._volume_of(host_path)[0] is not None:
+            return # Neither cached nor indexed
+        search = self._search_to_notify()
+        if search is not None:
+            search.notify(host_path)
+        if self._usage is not None:
+            self._usage.notify(host_path)
+        with self._stat_lock:
+            cache = self._stat_cache
+            entry = cache.pop(host_path, None)
+            cache.pop(os.path.dirname(host_path), None)
+            if entry is None or entry[0] == 'dir':
+                prefix = os.path.join(host_path, '')
+                for path in [path for path in cache if path.startswith(prefix)]:
+                    del cache[path]
+
+    def _paths_changed(self, host_paths):
+        """Like _path_changed for many paths, e.g. everything a copy created, with a single pass over the cache."""
+        changed = set(host_paths)
+        if self._volumes:
+            changed = {path for path in changed if self._volume_of(path)[0] is None}
+        if len(changed) <= 1:
+            for host_path in changed:
+                self._path_changed(host_path)
+            return
+        search = self._search_to_notify()
+        for host_path in changed:
+            if search is not None:
+                search.notify(host_path)
+            if self._usage is not None:
+                self._usage.notify(host_path)
+        with self._stat_lock:
+            cache = self._stat_cache
+            for host_path in changed:
+                cache.pop(host_path, None)
+                cache.pop(os.path.dirname(host_path), None)
+            stale = []
+            for path in cache:
+                parent, child = os.path.dirname(path), path
+                while parent != child and parent not in changed:
+                    parent, child = os.path.dirname(parent), parent
+                if parent != child:
+                    stale.append(path)
+            for path in stale:
+                del cache[path]
+
+    def clear_caches(self):
+        """Forgets all resolved paths, cached directory entries, subtree sizes and file buffers (writing back their changes first)."""
+        self._invalidate_paths()
+        with self._stat_lock:
+            self._stat_cache.clear()
+        if self._usage is not None:
+            self._usage.clear()
+        for message in self._flush_buffers(drop=True):
+            print(message)
+
+    def cache_stats(self):
+        """Returns the sizes and hit counters of the path and dentry caches as a dict."""
+        return {
+            'paths': len(self._path_cache),
+            'paths_max': self.path_cache_size,
+            'entries': len(self._stat_cache),
+            'entries_max': self.stat_cache_size,
+            'hits': self.stat_cache_hits,
+            'misses': self.stat_cache_misses,
+            'buffers': len(self.buffers),
+            'buffer_bytes': self.buffers.size,
+            'buffer_budget': self.buffers.budget,
+            'buffer_dirty': self.buffers.dirty,
+            'buffer_hits': self.buffers.hits,
+            'buffer_misses': self.buffers.misses,
+            'written_back': self.buffers.written_back,
+            'usage_dirs': len(self._usage) if self._usage is not None else 0,
+        }
+
+    # --- BUFFER CACHE ---
+    # Anything that uses a host file directly rather than through read_file
+    # and write_file (file handles, copies, moves, deletes) first writes back
+    # the buffered changes at or below its path, or drops them.
+
+    def shutdown(self):
+        """
+        Brings the filesystem to rest when the system shuts down. Buffered
+        changes go to disk first; then the background index sweeps, trash
+        purges and copies are stopped, and the I/O pool is waited for. The
+        open files are closed after that, and the disk images last, after
+        the files that may still be open on them.
+        """
+        self.sync()
+        if self._search is not None:
+            self._search.close_all()
+        if self._trash is not None:
+            self._trash.close()
+        self.cancel_transfers()
+        self.kernel.aio_manager.shutdown()
+        self.close_all()
+        self.close_images()
+
+    def sync(self):
+        """Writes back every buffered change and commits the disk images on the calling thread, e.g. at shutdown."""
+        for message in self._flush_buffers() + self._commit_images():
+            print(message)
+
+    def sync_async(self):
+        """
+        Writes back every buffered change and commits the disk images on the
+        I/O thread pool. Returns a Future of (number of files written, [error message]).
+        """
+        def op():
+            written, errors = self.buffers.flush()
+            return written, self._write_back_errors(errors) + self._commit_images()
+        return self.kernel.aio_manager.submit(op)
+
+    def _commit_images(self):
+        """Commits the changes to the mounted disk images. Returns the messages of those that failed."""
+        messages = []
+        for root, volume in list(self._volumes.items()):
+            try:
+                volume.commit()
+            except OSError as e:
+                messages.append(f"FSManager Warning: Could not write the disk image '{root}': {e}.")
+        return messages
+
+    def close_images(self):
+        """Commits and closes the mounted disk images, e.g. at shutdown, after the files open on them."""
+        for message in self._commit_images():
+            print(message)
+        for volume in self._volumes.values():
+            try:
+                volume.close()
+            except OSError:
+                pass # Reported by the commit
+        self._volumes.clear()
+
+    def _flush_buffers(self, host_path=None, drop=False):
+        """
+        Writes back the buffered changes at or below a host path (all if None)
+        on the calling thread. Returns the messages of those that failed.
+        """
+        if not len(self.buffers) and not self.buffers.dirty and not self.buffers.failed:
+            return []
+        return self._write_back_errors(self.buffers.flush(host_path, drop)[1])
+
+    def _post_messages(self, messages):
+        """Prints messages from the I/O pool, through the kernel loop."""
+        if messages:
+            self.kernel.post_event(lambda: print('\n'.join(messages)))
+
+    def _write_back_errors(self, errors):
+        return [f"FSManager Warning: Could not write back '{self._virtual_path(host_path) or host_path}', "
+                f"its changes are lost: {message}." for host_path, message in errors]
+
+    def _schedule_write_back(self):
+        """Starts the periodic write-back, which also commits the disk images."""
+        if self._writeback is None:
+            self._writeback = self.kernel.scheduler.call_every(
+                WRITEBACK_INTERVAL, self._write_back, name="buffer write-back")
+
+    def _write_back(self):
+        """The periodic write-back: writes the dirty buffers on the I/O pool, unless the last write-back still runs."""
+        if self._writeback_future is not None and not self._writeback_future.done():
+            return
+        if not self.buffers.dirty and not self.buffers.failed and not any(
+                volume.changed for volume in self._volumes.values()):
+            return
+        self._writeback_future = future = self.sync_async()
+        future.add_done_callback(lambda future: future.exception() or self._post_messages(future.result()[1]))
+
+    def _resolve_host_path(self, virtual_path):
+        """The uncached work of _get_host_path."""
         # An absolute path starts with a drive letter, e.g., "A:/..." or "A:"
         # A relative path does not.
         if not (len(virtual_path) > 1 and virtual_path[1] == ':' and virtual_path[0].isalpha()):
@@ -123,10 +757,11 @@ class FileSystemManager:
 
         drive_letter = f"{drive.upper()}:"
 
-        if drive_letter not in self.mounted_drives:
+        drive = self._get_drive(drive_letter)
+        if drive is None:
             return None # Invalid drive
 
-        drive_root_path = self.mounted_drives[drive_letter]['path']
+        drive_root_path = drive['path']
 
         # Normalize the path and prevent directory traversal attacks (e.g., '..')
         # The path part starts with '\', so we strip it for os.path.join
@@ -145,77 +780,381 @@ class FileSystemManager:
         Lists contents of a directory, providing details for each item.
         Returns a list of dictionaries, each with 'name', 'type', 'size', 'modified'.
         """
+        return self._run_now(self._list_directory_op(path))
+
+    def list_directory_async(self, path='.'):
+        """Like list_directory, but the listing runs on the I/O thread pool. Returns a Future."""
+        return self._run_async(self._list_directory_op(path))
+
+    def _list_directory_op(self, path):
         host_path = self._get_host_path(path)
-        if not host_path or not os.path.isdir(host_path):
-            if host_path and not os.path.isdir(host_path):
+        kind = self._path_kind(host_path) if host_path else None
+        if kind != 'dir':
+            if kind:
                 return f"Error: '{path}' is not a directory."
             return f"Error: Directory '{path}' not found."
 
-        detailed_contents = []
-        for item_name in os.listdir(host_path):
-            item_path = os.path.join(host_path, item_name)
+        def op():
+            return [{'name': record.name, 'type': '<DIR>' if record.is_dir else '',
+                     'size': record.size, 'modified': record.modified}
+                    for record in self._scan(host_path, path, self.buffers.dirty_entries(host_path))]
+        return op
+
+    def scan_directory(self, path='.'):
+        """
+        Streams the entries of a directory as DirRecord tuples, in the order
+        the host returns them, so the first entries of a huge directory are
+        available right away.
+
+        :raises FileSystemError: If the path is not a directory (before the first entry is read).
+        """
+        host_path = self._resolve_directory(path)
+        return self._scan(host_path, path, self.buffers.dirty_entries(host_path))
+
+    def scan_directory_async(self, path='.'):
+        """
+        Reads all the entries of a directory on the I/O thread pool.
+        Returns a Future of a list of DirRecord tuples.
+
+        :raises FileSystemError: If the path is not a directory.
+        """
+        host_path = self._resolve_directory(path)
+        dirty = self.buffers.dirty_entries(host_path)
+        return self.kernel.aio_manager.submit(lambda: list(self._scan(host_path, path, dirty)))
+
+    def _resolve_directory(self, path):
+        """Returns the host path of an existing directory, raising a FileSystemError otherwise."""
+        host_path = self._get_host_path(path)
+        kind = self._path_kind(host_path) if host_path else None
+        if kind is None:
+            raise PathNotFoundError(f"Error: Directory '{path}' not found.")
+        if kind != 'dir':
+            raise NotADirError(f"Error: '{path}' is not a directory.")
+        return host_path
+
+    def _scan(self, host_path, path, dirty=None):
+        """
+        Yields a DirRecord for every entry of a host directory. scandir reports
+        the entry type along with the name, so each entry costs one stat at most.
+
+        :param dirty: {name: (size, modified)} of the files whose changes are still
+                      in the buffer cache, shown instead of what is on the host.
+        """
+        volume, inner = self._volume_of(host_path)
+        store = self._compressed_of(host_path)[0] if self._compressed else None
+        try:
+            if volume is not None:
+                yield from volume.scan(inner)
+                return
+            entries = os.scandir(host_path)
+        except OSError as e:
+            raise FileAccessError(f"Error listing '{path}': {e}") from e
+        with entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                    stat = entry.stat()
+                except OSError:
+                    # Could be a broken symlink or permission error, skip it
+                    continue
+                if store is not None and not is_dir:
+                    # The size of the contents is in the file's header, the host's is what it takes
+                    if dirty and entry.name in dirty:
+                        yield DirRecord(entry.name, False, *dirty[entry.name], stat.st_size)
+                    else:
+                        yield DirRecord(entry.name, False, store.logical_size(entry.path, stat),
+                                        stat.st_mtime, stat.st_size)
+                    continue
+                if dirty and entry.name in dirty:
+                    yield DirRecord(entry.name, is_dir, *dirty[entry.name])
+                    continue
+                yield DirRecord(entry.name, is_dir, stat.st_size, stat.st_mtime)
+
+    def _resolve_file(self, path):
+        """Returns the host path of an existing file, raising a FileSystemError otherwise."""
+        host_path = self._get_host_path(path)
+        kind = self._path_kind(host_path) if host_path else None
+        if kind is None:
+            raise PathNotFoundError(f"Error: File '{path}' not found.")
+        if kind == 'dir':
+            raise NotAFileError(f"Error: '{path}' is a directory, not a file.")
+        return host_path
+
+    def read_file(self, path, binary=False):
+        """
+        Reads a whole file in the virtual file system. For big files, use
+        read_chunks() or the file handle API instead.
+
+        :param binary: Return the raw bytes instead of decoded text.
+        :raises FileSystemError: If the file cannot be read.
+        """
+        host_path = self._resolve_file(path)
+        volume, inner = self._volume_of(host_path)
+        try:
+            data = volume.read_bytes(inner) if volume is not None else self.buffers.read(host_path)
+        except OSError as e:
+            raise FileAccessError(f"Error reading file '{path}': {e}") from e
+        if binary:
+            return data
+        text = data.decode('utf-8', errors='replace')
+        if '\r' in text: # Universal newlines, as a text mode read would give
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+
+    def read_chunks(self, path, size=65536):
+        """
+        Streams a text file, so large files are never loaded whole.
+        Returns a generator of chunks of about 'size' characters that always
+        end at a line break (except at the end of the file, or for a line too
+        long to buffer).
+
+        :raises FileSystemError: If the file does not exist (before the first chunk is read).
+        """
+        # Resolved now: the chunks may be pulled after a 'cd', by a background or piped command
+        host_path = self._resolve_file(path)
+        return self._chunks(self._virtual_path(host_path) or path, host_path, size)
+
+    def _chunks(self, path, host_path, size=65536):
+        """read_chunks() for a file already resolved to its host path."""
+        def chunks():
+            fd = self._open_resolved(path, host_path, 'r')
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            pending = ''
             try:
-                stat = os.stat(item_path)
-                item_type = '<DIR>' if os.path.isdir(item_path) else ''
-                detailed_contents.append({
-                    'name': item_name,
-                    'type': item_type,
-                    'size': stat.st_size,
-                    'modified': stat.st_mtime
-                })
-            except OSError:
-                # Could be a broken symlink or permission error, skip it
-                continue
-        return detailed_contents
+                while True:
+                    data = self.read(fd, size)
+                    text = pending + decoder.decode(data, final=not data)
+                    if not data:
+                        break
+                    cut = text.rfind('\n') + 1
+                    if cut == 0 and len(text) < 16 * size:
+                        pending = text # Wait for the end of the line
+                        continue
+                    cut = cut or len(text)
+                    pending = text[cut:]
+                    yield text[:cut]
+                if text:
+                    yield text
+            finally:
+                self.close(fd)
+        return chunks()
+
+    # --- FILE HANDLES ---
+    # A file opened with open() is known by a small integer, its file
+    # descriptor, until it is closed. Handles are binary: read() returns bytes.
+
+    _MODES = {'r': 'rb', 'w': 'wb', 'a': 'ab', 'r+': 'r+b'}
+
+    def open(self, path, mode='r'):
+        """
+        Opens a file and returns its file descriptor.
+
+        :param mode: 'r' (read), 'w' (create or truncate), 'a' (append) or 'r+' (read and write).
+        :raises FileSystemError: If the file cannot be opened.
+        """
+        if mode not in self._MODES:
+            raise ValueError(f"invalid mode {mode!r}")
+        if mode in ('r', 'r+'):
+            host_path = self._resolve_file(path)
+        else:
+            host_path = self._get_host_path(path)
+            if not host_path:
+                raise InvalidPathError(f"Error: Invalid path '{path}'.")
+            if self._path_kind(host_path) == 'dir':
+                raise NotAFileError(f"Error: Cannot write to '{path}', it is a directory.")
+        return self._open_resolved(path, host_path, mode)
+
+    def _open_resolved(self, path, host_path, mode):
+        """open() for a path already resolved to its host path."""
+        if len(self.open_files) >= self.max_open_files:
+            raise TooManyOpenFilesError(f"Error: Too many open files ({self.max_open_files}).")
+        host_mode = self._MODES[mode]
+        for message in self._flush_buffers(host_path, drop=mode != 'r'):
+            print(message)
+        try:
+            file = self._open_host(host_path, host_mode)
+        except OSError as e:
+            raise FileAccessError(f"Error opening file '{path}': {e}") from e
+        if mode in ('w', 'a'):
+            self._path_changed(host_path) # It may have just been created
+
+        # Like a POSIX kernel: the lowest free descriptor, 0-2 being the console
+        fd = 3
+        while fd in self.open_files:
+            fd += 1
+        self.open_files[fd] = _OpenFile(path, mode, file)
+        return fd
+
+    def _open_file(self, fd):
+        entry = self.open_files.get(fd)
+        if entry is None:
+            raise BadFileDescriptorError(f"Error: Bad file descriptor {fd}.")
+        return entry
+
+    def read(self, fd, size=-1):
+        """Reads up to 'size' bytes (everything if negative) from the current position. Returns b'' at the end."""
+        entry = self._open_file(fd)
+        try:
+            return entry.file.read(size)
+        except (OSError, ValueError) as e:
+            raise BadFileDescriptorError(f"Error: Cannot read from '{entry.path}': {e}") from e
+
+    def write(self, fd, data):
+        """Writes bytes (or text, encoded as UTF-8) at the current position and returns the number of bytes written."""
+        entry = self._open_file(fd)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        try:
+            return entry.file.write(data)
+        except (OSError, ValueError) as e:
+            raise BadFileDescriptorError(f"Error: Cannot write to '{entry.path}': {e}") from e
+
+    def seek(self, fd, offset, whence=os.SEEK_SET):
+        """Moves the position of a file descriptor and returns the new position."""
+        entry = self._open_file(fd)
+        try:
+            return entry.file.seek(offset, whence)
+        except (OSError, ValueError) as e:
+            raise FileAccessError(f"Error: Cannot seek in '{entry.path}': {e}") from e
+
+    def tell(self, fd):
+        """Returns the current position of a file descriptor."""
+        return self._open_file(fd).file.tell()
+
+    def mmap(self, fd):
+        """
+        Maps an open file into memory and returns a read-only memoryview of
+        its contents, so big files can be sliced and searched without copying
+        them. The view is valid until the file is closed.
+        """
+        entry = self._open_file(fd)
+        getbuffer = getattr(entry.file, 'getbuffer', None)
+        if getbuffer is not None: # A file of a disk image or a compressed drive, not mappable as it is
+            return getbuffer()
+        if entry.mapping is None:
+            entry.file.flush()
+            if os.fstat(entry.file.fileno()).st_size == 0:
+                return memoryview(b'') # Empty files cannot be mapped
+            try:
+                entry.mapping = mmap.mmap(entry.file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                raise FileAccessError(f"Error: Cannot map '{entry.path}': {e}") from e
+        return memoryview(entry.mapping)
 
-    def read_file(self, path):
-        """Reads the content of a file in the virtual file system."""
+    def close(self, fd):
+        """Closes a file descriptor."""
+        entry = self.open_files.pop(fd, None)
+        if entry is None:
+            raise BadFileDescriptorError(f"Error: Bad file descriptor {fd}.")
+        if entry.mapping is not None:
+            try:
+                entry.mapping.close()
+            except BufferError:
+                pass # A view is still alive, the mapping goes away with it
+        entry.file.close()
+        if entry.mode != 'r':
+            self._path_changed(entry.file.name)
+
+    def close_all(self):
+        """Closes every open file descriptor, e.g. at shutdown."""
+        for fd in list(self.open_files):
+            self.close(fd)
+
+    def open_for_write(self, path, append=False):
+        """
+        Opens a text file for writing a stream into it.
+        Returns an error message string, or a file object the caller must close.
+        """
         host_path = self._get_host_path(path)
-        if not host_path or not os.path.exists(host_path):
-            return f"Error: File '{path}' not found."
-        if os.path.isdir(host_path):
-            return f"Error: '{path}' is a directory, not a file."
+        if not host_path:
+            return f"Error: Invalid path '{path}'."
+        if self._path_kind(host_path) == 'dir':
+            return f"Error: Cannot write to '{path}', it is a directory."
+        for message in self._flush_buffers(host_path, drop=True):
+            print(message)
         try:
-            with open(host_path, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
+            if self._store_of(host_path)[0] is not None:
+                file = io.TextIOWrapper(io.BufferedWriter(self._open_host(host_path, 'ab' if append else 'wb')),
+                                        encoding='utf-8')
+            else:
+                file = open(host_path, 'a' if append else 'w', encoding='utf-8')
         except IOError as e:
-            return f"Error reading file '{path}': {e}"
+            return f"Error writing to file '{path}': {e}"
+        self._path_changed(host_path)
+        return file
 
     def write_file(self, path, content):
-        """Writes content to a file in the virtual file system, overwriting it."""
+        """
+        Writes content to a file in the virtual file system, overwriting it.
+        An existing file is only rewritten in the buffer cache; the host file
+        follows at the next write-back.
+        """
         host_path = self._get_host_path(path)
         if not host_path:
             return f"Error: Invalid path '{path}'."
-        if os.path.isdir(host_path):
+        kind = self._path_kind(host_path)
+        if kind == 'dir':
             return f"Error: Cannot write to '{path}', it is a directory."
-        
-        try:
-            with open(host_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+        if os.linesep != '\n':
+            content = content.replace('\n', os.linesep) # As a text mode write would
+        data = content.encode('utf-8')
+        volume, inner = self._volume_of(host_path)
+        if volume is not None: # Already in memory until the next commit
+            try:
+                volume.write_bytes(inner, data)
+            except OSError as e:
+                return f"Error writing to file '{path}': {e}"
             return None # Success
+        if kind == 'file' and self.buffers.write(host_path, data):
+            self._schedule_write_back()
+            return None # Success
+
+        # A new file is created right away, so listings and host tools see it
+        try:
+            with self._open_host(host_path, 'wb') as f:
+                f.write(data)
         except IOError as e:
             return f"Error writing to file '{path}': {e}"
+        self._path_changed(host_path)
+        self.buffers.store(host_path, data)
+        return None # Success
 
     def create_directory(self, path):
         """Creates a new directory."""
         host_path = self._get_host_path(path)
         if not host_path:
             return f"Error: Invalid path '{path}'."
-        if os.path.exists(host_path):
+        if self._path_kind(host_path) is not None:
             return f"Error: Directory or file '{path}' already exists."
+        volume, inner = self._volume_of(host_path)
         try:
-            os.makedirs(host_path)
+            if volume is not None:
+                volume.mkdir(inner, parents=True)
+            else:
+                os.makedirs(host_path)
             return None # Success
         except OSError as e:
             return f"Error creating directory '{path}': {e}"
+        finally:
+            # makedirs may have created parents that were cached as missing
+            parent = os.path.dirname(host_path)
+            while self._stat_cache.get(parent, ('dir',))[0] != 'dir' and parent != os.path.dirname(parent):
+                self._path_changed(parent)
+                parent = os.path.dirname(parent)
+            self._path_changed(host_path)
 
     def remove_directory(self, path):
         """Removes an empty directory."""
         host_path = self._get_host_path(path)
-        if not host_path or not os.path.isdir(host_path):
+        if not host_path or self._path_kind(host_path) != 'dir':
             return f"Error: '{path}' is not a directory."
+        volume, inner = self._volume_of(host_path)
         try:
-            os.rmdir(host_path)
+            if volume is not None:
+                volume.rmdir(inner)
+            else:
+                os.rmdir(host_path)
+            self._path_changed(host_path)
             return None # Success
         except OSError:
             # This can fail if the directory is not empty
@@ -223,49 +1162,392 @@ class FileSystemManager:
 
     def move_to_trash(self, path):
         """Moves a file or directory to the trashbin."""
-        if not self.trashbin_path:
+        return self._run_now(self._move_to_trash_op(path))
+
+    def move_to_trash_async(self, path):
+        """Like move_to_trash, but the move runs on the I/O thread pool. Returns a Future."""
+        return self._run_async(self._move_to_trash_op(path))
+
+    def _move_to_trash_op(self, path):
+        trash = self.trash
+        if trash is None:
             return "Error: Trashbin is not configured."
 
         host_path = self._get_host_path(path)
-        if not host_path or not os.path.exists(host_path):
+        if not host_path or self._path_kind(host_path) is None:
             return f"Error: File or directory '{path}' not found."
+        if os.path.commonpath([host_path, trash.path]) in (host_path, trash.path):
+            return f"Error: '{path}' is or holds the trashbin, use 'trash purge' to empty it."
+        origin = self._virtual_path(host_path)
+        mover = self._move_across if self._store_of(host_path)[0] is not None else shutil.move
+
+        def op():
+            self._post_messages(self._flush_buffers(host_path, drop=True))
+            result = trash.move_in(host_path, origin, mover)
+            if result is None and trash.total_size > trash.max_bytes:
+                trash.enforce_quotas()
+            return result
+        return op
+
+    def restore_from_trash_async(self, entry_id, path=None):
+        """
+        Moves an item out of the trashbin on the I/O thread pool. Returns a Future.
+
+        :param path: Where to put it, instead of where it was deleted from.
+        """
+        return self._run_async(self._restore_from_trash_op(entry_id, path))
+
+    def _restore_from_trash_op(self, entry_id, path):
+        trash = self.trash
+        if trash is not None and not trash.loading.done():
+            return "Error: The trashbin is still loading, try again in a moment."
+        if trash is None:
+            return "Error: Trashbin is not configured."
+        entry = trash.get(entry_id)
+        if entry is None:
+            return f"Error: There is no item {entry_id} in the trash."
+        path = path or entry.origin
+        if path is None:
+            return f"Error: Where item {entry_id} came from is unknown. Use 'trash restore {entry_id} <path>'."
+        host_path = self._get_host_path(path)
+        if not host_path:
+            return f"Error: Invalid path '{path}'."
+        if self._path_kind(host_path) is not None:
+            return f"Error: '{path}' already exists. Use 'trash restore {entry_id} <path>' to restore it elsewhere."
+        mover = self._move_across if self._store_of(host_path)[0] is not None else None
+        return lambda: trash.restore(entry_id, host_path, mover)
+
+    def _move_across(self, src, dst):
+        """
+        Moves a file or directory between two host paths either of which may
+        be on a disk image or a compressed drive, creating the missing
+        directories of dst. Raises OSError if any of it could not be moved.
+        """
+        from . import copy_mgr
+        src_volume, src_inner = self._store_of(src)
+        dst_volume, dst_inner = self._store_of(dst)
+        if dst_volume is not None:
+            dst_volume.mkdir(dst_inner.rpartition('/')[0], parents=True, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+        progress = copy_mgr.CopyProgress()
+        copy_mgr.move_across(src_inner if src_volume else src, dst_inner if dst_volume else dst, progress,
+                             src_volume=src_volume, dst_volume=dst_volume)
+        if progress.errors:
+            raise OSError(progress.errors[0][1])
+
+    @property
+    def trash(self):
+        """
+        The TrashManager of the trashbin, or None if there is no drive A:.
+        Created on first use, which starts loading it on the I/O pool (see
+        TrashManager.loading) and schedules its periodic quota check.
+        """
+        if self._trash is None and self.trashbin_path:
+            from .trash_mgr import TrashManager, PURGE_INTERVAL
+            trash = self._trash = TrashManager(self, self.trashbin_path)
+
+            def loaded(future):
+                error = future.exception()
+                if error is not None:
+                    self._post_messages([f"FSManager Warning: Could not open the trashbin: {error}"])
+                else:
+                    self.kernel.post_event(trash.enforce_quotas)
+            trash.loading.add_done_callback(loaded)
+            self.kernel.scheduler.call_every(PURGE_INTERVAL, trash.enforce_quotas, name="trash quotas")
+        return self._trash
+
+    # --- DISK USAGE ---
+
+    @property
+    def usage(self):
+        """The UsageManager with the cached subtree sizes of the host drives, created on first use."""
+        if self._usage is None:
+            from .usage_mgr import UsageManager
+            with self._stat_lock: # Changes on the I/O pool may get here first
+                if self._usage is None:
+                    self._usage = UsageManager()
+        return self._usage
+
+    def disk_usage(self, path='.', depth=0, rescan=False):
+        """
+        Adds up the sizes of the files below a directory.
+        Returns an error message string on failure, else a list of
+        (virtual path, level, UsageTotals): the subdirectories up to depth
+        levels below it, each before the directory it is in, path itself last.
+
+        :param rescan: Scan every directory again instead of trusting the cached sizes.
+        """
+        return self._run_now(self._disk_usage_op(path, depth, rescan))
+
+    def disk_usage_async(self, path='.', depth=0, rescan=False):
+        """Like disk_usage, but the walk runs on the I/O thread pool. Returns a Future."""
+        return self._run_async(self._disk_usage_op(path, depth, rescan))
 
-        # Create trashbin if it doesn't exist
-        if not os.path.exists(self.trashbin_path):
+    def _disk_usage_op(self, path, depth, rescan):
+        host_path = self._get_host_path(path)
+        kind = self._path_kind(host_path) if host_path else None
+        if kind != 'dir':
+            if kind:
+                return f"Error: '{path}' is not a directory."
+            return f"Error: Directory '{path}' not found."
+        usage = self.usage
+
+        def op():
+            # Buffered changes count as soon as they are on the host
+            self._post_messages(self._flush_buffers(host_path))
             try:
-                os.makedirs(self.trashbin_path)
+                report = self._measure(host_path, depth, rescan, usage)
             except OSError as e:
-                return f"Error: Could not create trashbin directory: {e}"
+                return f"Error reading '{path}': {e}"
+            return [(self._virtual_path(host) or host, level, totals) for host, level, totals in report]
+        return op
 
-        # Create a unique name for the trashed item to avoid conflicts
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        base_name = os.path.basename(host_path)
-        trash_name = f"{base_name}.{timestamp}"
-        destination_path = os.path.join(self.trashbin_path, trash_name)
+    def _measure(self, host_path, depth, rescan, usage):
+        """UsageManager.measure, for a host directory on any kind of drive. Raises OSError."""
+        volume, inner = self._volume_of(host_path)
+        if volume is not None:
+            return _image_usage(volume, host_path, inner, depth)
+        store = self._compressed_of(host_path)[0] if self._compressed else None
+        return usage.measure(host_path, depth, store.logical_size if store else None, rescan)
 
-        try:
-            shutil.move(host_path, destination_path)
-            return None # Success
-        except OSError as e:
-            return f"Error moving '{path}' to trash: {e}"
+    def drive_usage(self):
+        """
+        What the mounted drives use, without walking them: a list of dicts with
+        'letter', 'type', 'used' and 'files' (None until 'du' measured the whole
+        drive, the totals it found since checked on every 'du') and 'free', the
+        bytes that can still be stored (None if the host could not tell).
+        A disk image keeps its own counts, always current.
+        """
+        found = []
+        for letter, drive in sorted(self.mounted_drives.items()):
+            root = drive['path']
+            volume = self._volumes.get(root)
+            used = files = free = None
+            try:
+                if volume is not None:
+                    stats = volume.usage()
+                    used, files = stats['data'], stats['files']
+                    # The image grows into the free space of the host as it fills
+                    free = stats['free'] + shutil.disk_usage(os.path.dirname(root)).free
+                else:
+                    totals = self._usage.cached(root) if self._usage is not None else None
+                    if totals is not None:
+                        used, files = totals.bytes, totals.files
+                    free = shutil.disk_usage(root).free
+            except OSError:
+                pass
+            found.append({'letter': letter, 'type': drive['type'], 'used': used, 'files': files, 'free': free})
+        return found
 
     def force_delete(self, path):
         """Permanently deletes a file or directory."""
+        return self._run_now(self._force_delete_op(path))
+
+    def force_delete_async(self, path):
+        """Like force_delete, but the deletion runs on the I/O thread pool. Returns a Future."""
+        return self._run_async(self._force_delete_op(path))
+
+    def _force_delete_op(self, path):
         host_path = self._get_host_path(path)
-        if not host_path or not os.path.exists(host_path):
+        if not host_path or self._path_kind(host_path) is None:
             return f"Error: File or directory '{path}' not found."
 
-        try:
-            if os.path.isfile(host_path) or os.path.islink(host_path):
-                os.remove(host_path)
-            elif os.path.isdir(host_path):
-                shutil.rmtree(host_path)
-            else:
-                return f"Error: '{path}' is not a file or directory."
-            return None # Success
-        except OSError as e:
-            return f"Error deleting '{path}': {e}"
+        volume, inner = self._volume_of(host_path)
+
+        def op():
+            self.buffers.discard(host_path)
+            try:
+                if volume is not None:
+                    volume.remove(inner)
+                elif os.path.isfile(host_path) or os.path.islink(host_path):
+                    os.remove(host_path)
+                elif os.path.isdir(host_path):
+                    shutil.rmtree(host_path)
+                else:
+                    return f"Error: '{path}' is not a file or directory."
+                return None # Success
+            except OSError as e:
+                return f"Error deleting '{path}': {e}"
+            finally:
+                self._path_changed(host_path)
+        return op
+
+    def copy_async(self, sources, destination, recursive=False, overwrite=False, progress=None, report=None):
+        """
+        Copies files and directories on the I/O thread pool. Returns a Future
+        of an error message string, or None on success; files skipped because
+        they exist are listed in progress.skipped.
+
+        :param sources: Virtual paths. The last part of each may hold wildcards, e.g. 'docs/*.txt'.
+        :param destination: A directory to copy into or, for a single source, the path of the copy.
+        :param recursive: Copy directories too, with everything below them.
+        :param overwrite: Replace the files that exist at the destination instead of skipping them.
+        :param progress: A copy_mgr.CopyProgress the copy updates, to report on it.
+        :param report: Called on the pool with a progress line about once a second.
+        """
+        return self._run_async(self._transfer_op(sources, destination, recursive, overwrite,
+                                                 progress, report, moving=False))
+
+    def move_async(self, sources, destination, overwrite=False, progress=None, report=None):
+        """
+        Moves files and directories on the I/O thread pool: a rename on one
+        filesystem, a copy then a delete across filesystems. Returns a Future
+        like copy_async, whose arguments these are.
+        """
+        return self._run_async(self._transfer_op(sources, destination, True, overwrite,
+                                                 progress, report, moving=True))
+
+    def cancel_transfers(self):
+        """Stops the running copies and moves after the files they are copying, e.g. at shutdown."""
+        for progress in list(self._transfers):
+            progress.cancel()
+
+    def _transfer_op(self, sources, destination, recursive, overwrite, progress, report, moving):
+        from . import copy_mgr
+        from .compress_mgr import CompressedStore
+        verb = 'move' if moving else 'copy'
+        dst_host = self._get_host_path(destination)
+        if not dst_host:
+            return f"Error: Invalid path '{destination}'."
+        into_dir = self._path_kind(dst_host) == 'dir'
+        if not into_dir and self._path_kind(os.path.dirname(dst_host)) != 'dir':
+            return f"Error: The directory of '{destination}' does not exist."
+
+        items = [] # (virtual path, host path, name filter or None)
+        for source in sources:
+            directory, pattern = split_wildcard(source)
+            host_path = self._get_host_path(directory if pattern else source)
+            if not host_path:
+                return f"Error: Invalid path '{source}'."
+            kind = self._path_kind(host_path)
+            if kind is None or (pattern and kind != 'dir'):
+                return f"Error: File or directory '{source}' not found."
+            if kind == 'dir' and not pattern and not recursive:
+                return f"Error: '{source}' is a directory. Use /s to copy it with everything below it."
+            items.append((source, host_path, pattern))
+        if not items:
+            return f"Error: Nothing to {verb}."
+        if (len(items) > 1 or items[0][2]) and not into_dir:
+            return f"Error: '{destination}' is not a directory."
+
+        progress = progress or copy_mgr.CopyProgress()
+        self._transfers.add(progress)
+        trash_path = self.trashbin_path
+
+        def op():
+            for _, host_path, _ in items:
+                self._post_messages(self._flush_buffers(host_path, drop=moving))
+            self._post_messages(self._flush_buffers(dst_host, drop=True)) # Files about to be overwritten
+            pairs = [] # (source, target) host paths
+            for source, host_path, pattern in items:
+                if pattern:
+                    volume, inner = self._volume_of(host_path)
+                    try:
+                        if volume is not None:
+                            matches = sorted((os.path.join(host_path, record.name), record.is_dir)
+                                             for record in volume.scan(inner) if pattern(record.name))
+                        else:
+                            with os.scandir(host_path) as entries:
+                                matches = sorted((entry.path, entry.is_dir()) for entry in entries
+                                                 if pattern(entry.name))
+                    except OSError as e:
+                        progress.fail(host_path, e.strerror)
+                        continue
+                    if not matches:
+                        progress.fail(os.path.join(host_path, ''), f"Nothing matches '{source}'")
+                else:
+                    matches = [(host_path, self._path_kind(host_path) == 'dir')]
+                for path, is_dir in matches:
+                    if is_dir and not recursive:
+                        continue # 'copy *' copies the files only, as DOS does
+                    target = os.path.join(dst_host, os.path.basename(path)) if into_dir else dst_host
+                    if target == path:
+                        progress.fail(path, f"Cannot {verb} it onto itself")
+                    elif is_dir and target.startswith(os.path.join(path, '')):
+                        progress.fail(path, f"Cannot {verb} a directory into itself")
+                    elif moving and trash_path and os.path.commonpath([path, trash_path]) == path:
+                        progress.fail(path, "It is or holds the trashbin")
+                    else:
+                        pairs.append((path, target, is_dir))
 
+            try:
+                if self._volumes or self._compressed:
+                    # Those from, into or inside a disk image go through memory,
+                    # as do those in or out of a compressed drive, to be
+                    # compressed or decompressed on the way
+                    host_pairs = []
+                    for path, target, is_dir in pairs:
+                        src_volume, src_inner = self._store_of(path)
+                        dst_volume, dst_inner = self._store_of(target)
+                        if (src_volume is None and dst_volume is None) or (
+                                isinstance(src_volume, CompressedStore) and isinstance(dst_volume, CompressedStore)):
+                            host_pairs.append((path, target, is_dir)) # The frames are copied as they are
+                            continue
+                        transfer = copy_mgr.move_across if moving else copy_mgr.copy_across
+                        try:
+                            transfer(src_inner if src_volume else path, dst_inner if dst_volume else target,
+                                     progress, overwrite, report, src_volume, dst_volume)
+                        except FileExistsError:
+                            progress.skip(target)
+                        except OSError as e:
+                            progress.fail(path, e.strerror or str(e))
+                else:
+                    host_pairs = pairs
+                if moving:
+                    for path, target, _ in host_pairs:
+                        try:
+                            copy_mgr.move(path, target, progress, overwrite, report)
+                        except FileExistsError:
+                            progress.skip(target)
+                        except OSError as e:
+                            progress.fail(path, e.strerror or str(e))
+                else:
+                    plan = copy_mgr.CopyPlan()
+                    for path, target, is_dir in host_pairs:
+                        try:
+                            if is_dir:
+                                plan.add_tree(path, target)
+                            else:
+                                plan.add_file(path, target, os.path.getsize(path))
+                        except OSError as e:
+                            progress.fail(path, e.strerror)
+                    copy_mgr.run(plan, progress, overwrite, report)
+            finally:
+                changed = [target for _, target, _ in pairs]
+                if moving:
+                    changed += [path for path, _, _ in pairs]
+                self._paths_changed(changed)
+                self._transfers.discard(progress)
+            return self._transfer_errors(progress, verb)
+        return op
+
+    def _transfer_errors(self, progress, verb):
+        """The error message of a finished copy or move, None if nothing failed."""
+        if not progress.errors:
+            return None
+        shown = 5
+        lines = [f"Error: Could not {verb} '{self._virtual_path(host_path.rstrip(os.sep)) or host_path}': {message}."
+                 for host_path, message in progress.errors[:shown]]
+        if len(progress.errors) > shown:
+            lines.append(f"... and {len(progress.errors) - shown:,} more error(s).")
+        return '\n'.join(lines)
+
+    # --- BLOCKING OPERATIONS ---
+    # The *_op methods check the virtual path on the calling (kernel) thread,
+    # since that depends on the current drive and directory. They return either
+    # an error string or a function doing the pure host work, which can run
+    # right away or on the kernel's I/O thread pool.
+
+    def _run_now(self, op):
+        """Runs a prepared operation on the calling thread."""
+        return op() if callable(op) else op
+
+    def _run_async(self, op):
+        """Runs a prepared operation on the I/O thread pool and returns a Future."""
+        if callable(op):
+            return self.kernel.aio_manager.submit(op)
+        return self.kernel.aio_manager.completed(op)
 
     def change_directory(self, path):
         """
@@ -278,7 +1560,7 @@ class FileSystemManager:
         # Handle drive change, e.g., 'cd A:'
         if len(path) == 2 and path.endswith(':'):
             drive_letter = path.upper()
-            if drive_letter in self.mounted_drives:
+            if self._get_drive(drive_letter) is not None:
                 self.current_drive = drive_letter
                 # Optional: could also change current_path to root of new drive
                 # self.current_path = '\\'
@@ -292,16 +1574,61 @@ class FileSystemManager:
         if new_host_path is None:
             return f"Error: Path '{path}' is invalid or not found."
         
-        if not os.path.isdir(new_host_path):
+        if self._path_kind(new_host_path) != 'dir':
             return f"Error: '{path}' is not a directory."
 
         # If we got a valid directory, update the current path
         # We need to convert the host path back to a virtual path
-        drive_root_path = self.mounted_drives[self.current_drive]['path']
+        drive_root_path = self._get_drive(self.current_drive)['path']
         relative_path = os.path.relpath(new_host_path, drive_root_path)
 
         # Format for aPEOS: use backslashes and start with one
         self.current_path = '/' + relative_path.replace('\\', '/')
         if self.current_path == '/.': # relpath can return '.' for the root
             self.current_path = '/'
-        return None
\ No newline at end of file
+        return None
+
+
+def _find_root(stores, host_path):
+    """The store of the root a host path is at or below and the '/'-separated path inside it, or (None, None)."""
+    for root, store in stores.items():
+        if host_path.startswith(root) and (len(host_path) == len(root) or host_path[len(root)] == os.sep):
+            return store, host_path[len(root) + 1:].replace(os.sep, '/')
+    return None, None
+
+
+def _image_usage(volume, host_path, inner, depth):
+    """
+    UsageManager.measure for a directory of a disk image. Its directories are
+    in memory already, so they are walked every time rather than cached.
+    """
+    from .usage_mgr import UsageTotals
+    report = []
+
+    def walk(host, path, level):
+        size = files = dirs = 0
+        for record in volume.scan(path):
+            if record.is_dir:
+                totals = walk(os.path.join(host, record.name), f"{path}/{record.name}" if path else record.name, level + 1)
+                size += totals.bytes
+                files += totals.files
+                dirs += totals.dirs + 1
+            else:
+                size += record.size
+                files += 1
+        totals = UsageTotals(size, files, dirs)
+        if level <= depth:
+            report.append((host, level, totals))
+        return totals
+    walk(host_path, inner, 0)
+    return report
+
+
+def split_wildcard(path):
+    """Splits 'docs/*.txt' into ('docs/', name filter). (path, None) if its last part holds no wildcards."""
+    head, sep, tail = path.replace('\\', '/').rpartition('/')
+    if not sep and ':' in tail:
+        head, sep, tail = tail.partition(':')
+    if '*' not in tail and '?' not in tail:
+        return path, None
+    return head + sep or '.', re.compile(fnmatch.translate(tail), re.IGNORECASE).match
@@ -0,0 +1,742 @@
+import io
+import os
+import mmap
+import time
+import zlib
+import errno
+import struct
+import marshal
+import threading
+from bisect import bisect_left, bisect_right
+
+from .filesys_mgr import DirRecord
+
+# A disk image keeps a whole drive in one host file, mapped into memory, so
+# a tree of many small files costs no host inodes and no syscalls per file.
+#
+# The image is an array of 4 KiB blocks:
+#
+#   block 0, 1   Two superblocks, written alternately. Each points at a
+#                complete, consistent state of the drive; the valid one with
+#                the highest generation wins when the image is opened.
+#   the rest     Directory tree nodes, file data and the free list, wherever
+#                the allocator put them.
+#
+# Every file and directory is an entry of one B+tree, keyed on (inode number
+# of its parent directory, name), so the entries of a directory are
+# neighbours and listing one is a range scan. The value is the entry's
+# record: (inode, is_dir, size, mtime_ns, data), where data is the file's
+# contents for files up to INLINE_MAX bytes, or its extents as a flat tuple
+# (start block, block count, start, count, ...). The root directory is the
+# entry (0, '').
+#
+# Nothing is overwritten in place: changed tree nodes and file data go to
+# newly allocated blocks, and the blocks they replace are only freed once a
+# commit has written a superblock that no longer refers to them. A crash
+# therefore loses at most the changes since the last commit, never the
+# consistency of the image.
+
+BLOCK_SIZE = 4096
+MAGIC = b'APEOSIMG'
+VERSION = 1
+INLINE_MAX = 256 # Files up to this size live inside their tree entry
+LEAF_MAX = 64 # Entries of a leaf node before it splits
+NODE_MAX = 128 # Keys of an inner node before it splits
+INITIAL_BLOCKS = 256 # 1 MiB
+GROW_MAX = 16384 # The image grows by doubling, but by 64 MiB at most at a time
+ROOT_INO = 1
+_ROOT_KEY = (0, '')
+_SUPERBLOCK = struct.Struct('<8sIIQQQ QIII QIII QQQ')
+_NO_PTR = (0, 0, 0, 0) # (start block, blocks, bytes, crc32) of nothing
+
+
+class _Node:
+    """A node of the directory tree. A leaf has values; an inner node has children."""
+
+    __slots__ = ('keys', 'values', 'children', 'ptr', 'dirty')
+
+    def __init__(self, keys, values=None, children=None, ptr=None):
+        self.keys = keys
+        self.values = values
+        self.children = children # _Node, or the pointer of a node not read yet
+        self.ptr = ptr # Where it is stored, None if it never was
+        self.dirty = ptr is None
+
+
+class ImageVolume:
+    """
+    A drive stored in a single image file. Paths are relative to the drive's
+    root and '/'-separated, '' being the root itself. Errors are raised as
+    the OSError subclasses the host would raise for the same mistake.
+
+    Changes are kept in memory and in newly written blocks until commit(),
+    which the FileSystemManager calls periodically, on 'sync' and at unmount.
+    Thread-safe.
+    """
+
+    def __init__(self, path):
+        """Opens an existing image. Raises OSError if it cannot be read or is not an image."""
+        self.path = path
+        self._lock = threading.RLock()
+        self._file = open(path, 'r+b')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0)
+            self._load_superblock()
+        except (OSError, ValueError):
+            self._file.close()
+            raise
+        self._dirs = {} # Directory path -> (inode, key), the path lookups so far
+        self._forget_dirs()
+        self._pending_free = [] # Extents to free once the next commit made them unreachable
+        self._changed = False
+
+    @classmethod
+    def create(cls, path, blocks=INITIAL_BLOCKS):
+        """Formats a new, empty image at path and opens it."""
+        now = time.time_ns()
+        with open(path, 'xb') as f:
+            f.truncate(blocks * BLOCK_SIZE)
+            # Generation 0 points at nothing; the first commit writes the tree
+            f.write(_pack_superblock(0, blocks, ROOT_INO + 1, _NO_PTR, _NO_PTR, 0, 0, 0))
+        volume = cls(path)
+        volume._insert(_ROOT_KEY, (ROOT_INO, True, 0, now, ()))
+        volume.commit()
+        return volume
+
+    # --- SUPERBLOCK ---
+
+    def _load_superblock(self):
+        best = None
+        for slot in (0, 1):
+            raw = self._map[slot * BLOCK_SIZE:slot * BLOCK_SIZE + _SUPERBLOCK.size + 4]
+            if len(raw) < _SUPERBLOCK.size + 4 or raw[:8] != MAGIC:
+                continue
+            if zlib.crc32(raw[:-4]) != struct.unpack('<I', raw[-4:])[0]:
+                continue # Torn by a crash while it was written
+            fields = _SUPERBLOCK.unpack(raw[:-4])
+            if fields[1] != VERSION or fields[2] != BLOCK_SIZE:
+                raise OSError(errno.EINVAL, "Unsupported disk image version", self.path)
+            if best is None or fields[3] > best[3]:
+                best = fields
+        if best is None:
+            raise OSError(errno.EINVAL, "Not a disk image", self.path)
+        (_, _, _, self.generation, self.block_count, self.next_ino,
+         *root_ptr_and_rest) = best
+        root_ptr = tuple(root_ptr_and_rest[0:4])
+        self._free_ptr = tuple(root_ptr_and_rest[4:8])
+        self.files, self.dirs, self.data_bytes = root_ptr_and_rest[8:11]
+        self._root = self._read_node(root_ptr) if root_ptr != _NO_PTR else _Node([], [])
+        self._starts, self._counts = [], [] # Free runs, sorted and merged
+        self.free_blocks = 0
+        if self._free_ptr != _NO_PTR:
+            starts, counts = marshal.loads(self._read_blob(self._free_ptr))
+            self._starts, self._counts = list(starts), list(counts)
+            self.free_blocks = sum(counts)
+        elif root_ptr == _NO_PTR:
+            self._free(2, self.block_count - 2) # Freshly formatted
+        self._cursor = 0 # Where the next allocation starts looking
+
+    def commit(self):
+        """
+        Makes every change so far durable: writes the changed tree nodes and
+        the free list, flushes the image, then writes the other superblock.
+        Returns False if there was nothing to commit.
+        """
+        with self._lock:
+            if not self._changed:
+                return False
+            root_ptr = self._write_node(self._root)
+            free_ptr = self._write_free_list()
+            self._map.flush()
+            self.generation += 1
+            superblock = _pack_superblock(self.generation, self.block_count, self.next_ino, root_ptr, free_ptr,
+                                          self.files, self.dirs, self.data_bytes)
+            slot = self.generation % 2
+            self._map[slot * BLOCK_SIZE:slot * BLOCK_SIZE + len(superblock)] = superblock
+            self._map.flush()
+            # The old tree is unreachable now, its blocks can be reused
+            for start, count in self._pending_free:
+                self._free(start, count)
+            self._pending_free = []
+            self._free_ptr = free_ptr
+            self._changed = False
+            return True
+
+    @property
+    def changed(self):
+        """True if there are changes not committed yet."""
+        return self._changed
+
+    def close(self):
+        """Commits and closes the image."""
+        with self._lock:
+            self.commit()
+            try:
+                self._map.close()
+            except BufferError:
+                pass # A file's memoryview is still alive; the mapping goes away with it
+            self._file.close()
+
+    # --- ALLOCATOR ---
+    # Free space is a sorted list of runs of free blocks, kept merged.
+    # Allocations are first fit, starting where the last one left off.
+
+    def _alloc_run(self, count):
+        """Allocates count contiguous blocks, growing the image if no free run is long enough. Returns the first."""
+        counts = self._counts
+        n = len(counts)
+        for k in range(n):
+            i = (self._cursor + k) % n
+            if counts[i] >= count:
+                start = self._starts[i]
+                if counts[i] == count:
+                    del self._starts[i], counts[i]
+                else:
+                    self._starts[i] += count
+                    counts[i] -= count
+                self._cursor = i
+                self.free_blocks -= count
+                return start
+        self._grow(count)
+        return self._alloc_run(count)
+
+    def _alloc(self, count):
+        """Allocates count blocks for file data, in one run if possible. Returns the flat extent tuple."""
+        if count == 0:
+            return ()
+        if self.free_blocks >= 2 * count and max(self._counts, default=0) < count:
+            # Fragmented: gather runs rather than grow the image
+            extents = []
+            while count:
+                take = min(count, self._counts[0])
+                extents += (self._alloc_run(take), take)
+                count -= take
+            return tuple(extents)
+        return self._alloc_run(count), count
+
+    def _free(self, start, count):
+        starts, counts = self._starts, self._counts
+        i = bisect_left(starts, start)
+        if i > 0 and starts[i - 1] + counts[i - 1] == start:
+            i -= 1
+            counts[i] += count
+        else:
+            starts.insert(i, start)
+            counts.insert(i, count)
+        if i + 1 < len(starts) and starts[i] + counts[i] == starts[i + 1]:
+            counts[i] += counts[i + 1]
+            del starts[i + 1], counts[i + 1]
+        self.free_blocks += count
+
+    def _release(self, extents):
+        """Frees extents once they are unreachable, i.e. after the next commit."""
+        for i in range(0, len(extents), 2):
+            self._pending_free.append((extents[i], extents[i + 1]))
+
+    def _grow(self, count):
+        new_count = max(self.block_count + count, min(2 * self.block_count, self.block_count + GROW_MAX))
+        self._file.truncate(new_count * BLOCK_SIZE)
+        old_map = self._map
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        try:
+            old_map.close()
+        except BufferError:
+            pass # Still viewed by an open file; it is closed when the view goes
+        self._free(self.block_count, new_count - self.block_count)
+        self.block_count = new_count
+
+    # --- BLOBS AND NODES ---
+
+    def _write_blob(self, payload):
+        count = -(-len(payload) // BLOCK_SIZE)
+        start = self._alloc_run(count)
+        self._map[start * BLOCK_SIZE:start * BLOCK_SIZE + len(payload)] = payload
+        return start, count, len(payload), zlib.crc32(payload)
+
+    def _read_blob(self, ptr):
+        start, _, length, crc = ptr
+        payload = self._map[start * BLOCK_SIZE:start * BLOCK_SIZE + length]
+        if zlib.crc32(payload) != crc:
+            raise OSError(errno.EIO, f"Corrupt metadata at block {start}", self.path)
+        return payload
+
+    def _read_node(self, ptr):
+        is_leaf, keys, items = marshal.loads(self._read_blob(ptr))
+        keys = [tuple(key) for key in keys]
+        if is_leaf:
+            return _Node(keys, list(items), ptr=ptr)
+        return _Node(keys, children=[tuple(child) for child in items], ptr=ptr)
+
+    def _write_node(self, node):
+        """Writes a changed node and the changed nodes below it to new blocks. Returns its pointer."""
+        if not node.dirty:
+            return node.ptr
+        if node.children is None:
+            payload = marshal.dumps((True, node.keys, node.values), 4)
+        else:
+            pointers = [child if type(child) is tuple else self._write_node(child) for child in node.children]
+            payload = marshal.dumps((False, node.keys, pointers), 4)
+        if node.ptr is not None:
+            self._pending_free.append(node.ptr[:2])
+        node.ptr = self._write_blob(payload)
+        node.dirty = False
+        return node.ptr
+
+    def _write_free_list(self):
+        if self._free_ptr != _NO_PTR:
+            self._pending_free.append(self._free_ptr[:2])
+        # Room for the list is taken from the list itself, so reserve it first, with a run to spare
+        reserve = -(-(len(self._starts) + len(self._pending_free) + 2) * 24 // BLOCK_SIZE)
+        start = self._alloc_run(reserve)
+        # Blocks freed by this commit are free in the state it writes
+        starts, counts = self._starts, self._counts
+        self._starts, self._counts, free_blocks = list(starts), list(counts), self.free_blocks
+        for run in self._pending_free:
+            self._free(*run)
+        payload = marshal.dumps((self._starts, self._counts), 4)
+        self._starts, self._counts, self.free_blocks = starts, counts, free_blocks
+        if len(payload) > reserve * BLOCK_SIZE:
+            self._free(start, reserve)
+            return self._write_free_list()
+        self._map[start * BLOCK_SIZE:start * BLOCK_SIZE + len(payload)] = payload
+        return start, reserve, len(payload), zlib.crc32(payload)
+
+    def _child(self, node, i):
+        child = node.children[i]
+        if type(child) is tuple:
+            child = node.children[i] = self._read_node(child)
+        return child
+
+    # --- DIRECTORY TREE ---
+
+    def _lookup(self, key):
+        node = self._root
+        while node.children is not None:
+            node = self._child(node, bisect_right(node.keys, key))
+        i = bisect_left(node.keys, key)
+        if i < len(node.keys) and node.keys[i] == key:
+            return node.values[i]
+        return None
+
+    def _insert(self, key, value):
+        """Adds or replaces an entry."""
+        split = self._insert_into(self._root, key, value)
+        if split is not None:
+            separator, right = split
+            self._root = _Node([separator], children=[self._root, right])
+        self._changed = True
+
+    def _insert_into(self, node, key, value):
+        node.dirty = True
+        if node.children is None:
+            i = bisect_left(node.keys, key)
+            if i < len(node.keys) and node.keys[i] == key:
+                node.values[i] = value
+                return None
+            node.keys.insert(i, key)
+            node.values.insert(i, value)
+            if len(node.keys) <= LEAF_MAX:
+                return None
+            mid = len(node.keys) // 2
+            right = _Node(node.keys[mid:], node.values[mid:])
+            del node.keys[mid:], node.values[mid:]
+            return right.keys[0], right
+        i = bisect_right(node.keys, key)
+        split = self._insert_into(self._child(node, i), key, value)
+        if split is None:
+            return None
+        separator, new_child = split
+        node.keys.insert(i, separator)
+        node.children.insert(i + 1, new_child)
+        if len(node.keys) <= NODE_MAX:
+            return None
+        mid = len(node.keys) // 2
+        separator = node.keys[mid]
+        right = _Node(node.keys[mid + 1:], children=node.children[mid + 1:])
+        del node.keys[mid:], node.children[mid + 1:]
+        return separator, right
+
+    def _delete(self, key):
+        """Removes an entry and returns its value, None if there is none. Emptied nodes are dropped."""
+        path = []
+        node = self._root
+        while node.children is not None:
+            i = bisect_right(node.keys, key)
+            path.append((node, i))
+            node = self._child(node, i)
+        i = bisect_left(node.keys, key)
+        if i == len(node.keys) or node.keys[i] != key:
+            return None
+        for parent, _ in path:
+            parent.dirty = True
+        node.dirty = True
+        del node.keys[i]
+        value = node.values.pop(i)
+        while path and not (node.keys if node.children is None else node.children):
+            parent, i = path.pop()
+            if node.ptr is not None:
+                self._pending_free.append(node.ptr[:2])
+            del parent.children[i]
+            if parent.keys:
+                del parent.keys[max(i - 1, 0)]
+            node = parent
+        while self._root.children is not None and len(self._root.children) == 1:
+            if self._root.ptr is not None:
+                self._pending_free.append(self._root.ptr[:2])
+            self._root = self._child(self._root, 0)
+            self._root.dirty = True
+        if self._root.children is not None and not self._root.children:
+            self._root = _Node([], [])
+        self._changed = True
+        return value
+
+    def _range(self, ino):
+        """The (key, value) entries of the directory with inode ino, sorted by name."""
+        found = []
+        self._range_into(self._root, (ino, ''), (ino + 1, ''), found)
+        return found
+
+    def _range_into(self, node, low, high, found):
+        keys = node.keys
+        if node.children is None:
+            i = bisect_left(keys, low)
+            j = bisect_left(keys, high)
+            found += zip(keys[i:j], node.values[i:j])
+            return
+        for i in range(bisect_right(keys, low), bisect_left(keys, high) + 1):
+            self._range_into(self._child(node, i), low, high, found)
+
+    # --- PATHS ---
+
+    def _dir(self, path):
+        """(inode, key) of the directory at a path. Raises FileNotFoundError or NotADirectoryError."""
+        found = self._dirs.get(path)
+        if found is not None:
+            return found
+        parent_path, _, name = path.rpartition('/')
+        ino, _ = self._dir(parent_path)
+        key = (ino, name)
+        record = self._lookup(key)
+        if record is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        if not record[1]:
+            raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+        found = self._dirs[path] = (record[0], key)
+        return found
+
+    def _forget_dirs(self):
+        """Empties the path lookups, after directories were moved or removed."""
+        self._dirs.clear()
+        self._dirs[''] = (ROOT_INO, _ROOT_KEY)
+
+    def _entry(self, path):
+        """(key, record or None, parent's key) of a path, which need not exist. Raises if its directory does not."""
+        path = path.strip('/')
+        if not path:
+            return _ROOT_KEY, self._lookup(_ROOT_KEY), None
+        parent_path, _, name = path.rpartition('/')
+        ino, parent_key = self._dir(parent_path)
+        key = (ino, name)
+        return key, self._lookup(key), parent_key
+
+    def _existing(self, path):
+        key, record, parent_key = self._entry(path)
+        if record is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        return key, record, parent_key
+
+    def _touch(self, key, now):
+        """Updates the mtime of a directory, after its entries changed."""
+        if key is None:
+            return
+        record = self._lookup(key)
+        if record is not None:
+            self._insert(key, record[:3] + (now,) + record[4:])
+
+    # --- FILES AND DIRECTORIES ---
+
+    def kind(self, path):
+        """'dir', 'file' or None."""
+        with self._lock:
+            try:
+                record = self._entry(path)[1]
+            except OSError:
+                return None
+        if record is None:
+            return None
+        return 'dir' if record[1] else 'file'
+
+    def stat(self, path):
+        """(is_dir, size, mtime_ns) of what is at a path. Raises FileNotFoundError."""
+        with self._lock:
+            record = self._existing(path)[1]
+        return record[1], record[2], record[3]
+
+    def scan(self, path):
+        """The entries of a directory as DirRecords, sorted by name."""
+        with self._lock:
+            key, record, _ = self._existing(path)
+            if not record[1]:
+                raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+            entries = self._range(record[0])
+        return [DirRecord(key[1], value[1], value[2], value[3] / 1e9) for key, value in entries]
+
+    def read_bytes(self, path):
+        with self._lock:
+            record = self._existing(path)[1]
+            if record[1]:
+                raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+            return self._read_data(record)
+
+    def _read_data(self, record):
+        data = record[4]
+        if type(data) is bytes:
+            return data
+        size = record[2]
+        if len(data) == 2:
+            start = data[0] * BLOCK_SIZE
+            return self._map[start:start + size]
+        parts = []
+        for i in range(0, len(data), 2):
+            start = data[i] * BLOCK_SIZE
+            parts.append(self._map[start:start + min(size, data[i + 1] * BLOCK_SIZE)])
+            size -= data[i + 1] * BLOCK_SIZE
+        return b''.join(parts)
+
+    def write_bytes(self, path, data, overwrite=True):
+        """
+        Creates or replaces a file. Returns False, writing nothing, if it
+        exists and overwrite is False.
+        """
+        data = bytes(data)
+        with self._lock:
+            key, record, parent_key = self._entry(path)
+            if record is not None:
+                if record[1]:
+                    raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+                if not overwrite:
+                    return False
+            now = time.time_ns()
+            if len(data) <= INLINE_MAX:
+                stored = data
+            else:
+                stored = self._alloc(-(-len(data) // BLOCK_SIZE))
+                offset = 0
+                for i in range(0, len(stored), 2):
+                    start, length = stored[i] * BLOCK_SIZE, stored[i + 1] * BLOCK_SIZE
+                    self._map[start:start + min(length, len(data) - offset)] = data[offset:offset + length]
+                    offset += length
+            if record is None:
+                ino = self.next_ino
+                self.next_ino += 1
+                self.files += 1
+            else:
+                ino = record[0]
+                self.data_bytes -= record[2]
+                if type(record[4]) is not bytes:
+                    self._release(record[4])
+            self.data_bytes += len(data)
+            self._insert(key, (ino, False, len(data), now, stored))
+            if record is None:
+                self._touch(parent_key, now)
+            return True
+
+    def mkdir(self, path, parents=False, exist_ok=False):
+        with self._lock:
+            path = path.strip('/')
+            if parents and path:
+                parent_path = path.rpartition('/')[0]
+                if self.kind(parent_path) is None:
+                    self.mkdir(parent_path, parents=True, exist_ok=True)
+            key, record, parent_key = self._entry(path)
+            if record is not None:
+                if exist_ok and record[1]:
+                    return
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+            now = time.time_ns()
+            self._insert(key, (self.next_ino, True, 0, now, ()))
+            self.next_ino += 1
+            self.dirs += 1
+            self._touch(parent_key, now)
+
+    def rmdir(self, path):
+        """Removes an empty directory."""
+        with self._lock:
+            key, record, parent_key = self._existing(path)
+            if not record[1]:
+                raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+            if parent_key is None:
+                raise PermissionError(errno.EPERM, "Cannot remove the root directory", path)
+            if self._range(record[0]):
+                raise OSError(errno.ENOTEMPTY, os.strerror(errno.ENOTEMPTY), path)
+            self._delete(key)
+            self.dirs -= 1
+            self._forget_dirs()
+            self._touch(parent_key, time.time_ns())
+
+    def remove(self, path):
+        """Removes a file, or a directory with everything below it."""
+        with self._lock:
+            key, record, parent_key = self._existing(path)
+            if parent_key is None:
+                raise PermissionError(errno.EPERM, "Cannot remove the root directory", path)
+            self._remove_entry(key, record)
+            self._touch(parent_key, time.time_ns())
+            if record[1]:
+                self._forget_dirs()
+
+    def _remove_entry(self, key, record):
+        stack = [(key, record)]
+        while stack:
+            key, record = stack.pop()
+            self._delete(key)
+            if record[1]:
+                self.dirs -= 1
+                stack += self._range(record[0])
+            else:
+                self.files -= 1
+                self.data_bytes -= record[2]
+                if type(record[4]) is not bytes:
+                    self._release(record[4])
+
+    def rename(self, src, dst, overwrite=False):
+        """
+        Moves a file or directory inside the image. Only its entry moves: the
+        entries below a directory are keyed on its inode, which stays the same.
+        """
+        with self._lock:
+            src, dst = src.strip('/'), dst.strip('/')
+            src_key, record, src_parent = self._existing(src)
+            if src_parent is None or dst == src or dst.startswith(src + '/'):
+                raise OSError(errno.EINVAL, "Cannot move a directory into itself", src)
+            dst_key, existing, dst_parent = self._entry(dst)
+            if existing is not None:
+                if not overwrite or record[1] or existing[1]:
+                    raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+                self._remove_entry(dst_key, existing)
+            self._delete(src_key)
+            self._insert(dst_key, record)
+            now = time.time_ns()
+            self._touch(src_parent, now)
+            self._touch(dst_parent, now)
+            if record[1]:
+                self._forget_dirs()
+
+    def open(self, path, mode, name=None):
+        """
+        Opens a file as a binary file object ('rb', 'wb', 'ab' or 'r+b').
+        Its contents are held in memory and written back on flush or close.
+
+        :param name: What the file object's 'name' is, e.g. the pseudo host path.
+        """
+        with self._lock:
+            if mode == 'wb':
+                self.write_bytes(path, b'')
+                data = b''
+            else:
+                try:
+                    data = self.read_bytes(path)
+                except FileNotFoundError:
+                    if mode != 'ab':
+                        raise
+                    self.write_bytes(path, b'')
+                    data = b''
+        return ImageFile(self, path, mode, data, name or path)
+
+    def usage(self):
+        """The space the image uses, as a dict of sizes in bytes and entry counts."""
+        with self._lock:
+            return {
+                'capacity': self.block_count * BLOCK_SIZE,
+                'free': (self.free_blocks + sum(count for _, count in self._pending_free)) * BLOCK_SIZE,
+                'data': self.data_bytes,
+                'files': self.files,
+                'dirs': self.dirs,
+                'image': os.fstat(self._file.fileno()).st_size,
+            }
+
+
+class ImageFile(io.RawIOBase):
+    """An open file of a disk image. Reads and writes go to a copy in memory, written back on flush and close."""
+
+    def __init__(self, volume, path, mode, data, name):
+        super().__init__()
+        self.volume = volume
+        self.path = path
+        self.mode = mode
+        self.name = name
+        self._data = bytearray(data) if mode != 'rb' else data
+        self._pos = len(data) if mode == 'ab' else 0
+        self._changed = False
+
+    def readable(self):
+        return self.mode in ('rb', 'r+b')
+
+    def writable(self):
+        return self.mode != 'rb'
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.readable():
+            raise io.UnsupportedOperation("not readable")
+        chunk = self._data[self._pos:self._pos + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def write(self, data):
+        if not self.writable():
+            raise io.UnsupportedOperation("not writable")
+        if self.mode == 'ab':
+            self._pos = len(self._data)
+        end = self._pos + len(data)
+        if self._pos > len(self._data):
+            self._data.extend(bytes(self._pos - len(self._data)))
+        self._data[self._pos:end] = data
+        self._pos = end
+        self._changed = True
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += len(self._data)
+        if offset < 0:
+            raise OSError(errno.EINVAL, "negative seek position")
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        if self._changed and not self.closed:
+            self.volume.write_bytes(self.path, self._data)
+            self._changed = False
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+        super().close()
+
+    def getbuffer(self):
+        """A read-only view of the contents, what mmap() of a host file would give."""
+        return memoryview(self._data).toreadonly()
+
+
+def _pack_superblock(generation, blocks, next_ino, root_ptr, free_ptr, files, dirs, data_bytes):
+    raw = _SUPERBLOCK.pack(MAGIC, VERSION, BLOCK_SIZE, generation, blocks, next_ino,
+                           *root_ptr, *free_ptr, files, dirs, data_bytes)
+    return raw + struct.pack('<I', zlib.crc32(raw))
+
+
+def is_image(host_path):
+    """True if a host file starts like a disk image."""
+    try:
+        with open(host_path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
@@ -1,34 +1,38 @@
-import csv
+import os
+import re
 from . import sys_cmd_exec
+from .cmd_registry import CommandRegistry
+
+# '>>', '>' and '|' are tokens of their own, even without spaces around them
+_PIPELINE_TOKEN = re.compile(r'>>|[|>]|[^\s|>]+')
 
 class IOManager:
     """Handles user input, command parsing, and delegation."""
 
     def __init__(self, kernel):
         self.kernel = kernel
-        self.commands = {}
-        self.aliases = {}
+        self.registry = CommandRegistry(
+            os.path.join(os.path.dirname(__file__), 'sys_apps.csv'),
+            os.path.join(kernel.project_root, '.apeos_cache', 'commands.marshal'))
         self._load_commands()
 
+    @property
+    def commands(self):
+        """Every command by name."""
+        return self.registry.commands
+
+    @property
+    def lookup(self):
+        """Every command by name and by alias."""
+        return self.registry.lookup
+
     def _load_commands(self):
-        """Loads command definitions from the CSV file."""
+        """Loads the built-in commands and the apps listed in the manifest."""
         try:
-            path = 'c:/Users/ahfuba/Desktop/aPEOSI/devices/internal/A/apeos/system2/sys/sys_cmd.csv'
-            with open(path, mode='r', newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    # skip empty rows which can cause KeyErrors
-                    if not row or not row.get('command'):
-                        continue
-
-                    command_name = row.get('command', '').strip()
-                    alias_name = row.get('alias', '').strip()
-                    self.commands[command_name] = {k.strip(): v.strip() for k, v in row.items()}
-                    if alias_name and command_name:
-                        self.aliases[alias_name] = command_name
+            self.registry.load()
             print("Command Manager: Commands loaded successfully.")
         except FileNotFoundError:
-            print(f"FATAL: Command CSV not found at {path}")
+            print(f"FATAL: App manifest not found at {self.registry.manifest_path}")
             self.kernel.running = False
         except Exception as e:
             print(f"FATAL: Error loading commands: {e}")
@@ -36,6 +40,10 @@ class IOManager:
 
     def handle_input(self, command_line: str):
         """Parses and executes a command."""
+        if '|' in command_line or '>' in command_line:
+            self._handle_pipeline(command_line)
+            return
+
         parts = command_line.strip().split()
         if not parts:
             return
@@ -49,13 +57,46 @@ class IOManager:
         command_name = parts[0].lower()
         args = parts[1:]
 
-        # resolve alias if used
-        actual_command = self.aliases.get(command_name, command_name)
-        cmd_info = self.commands.get(actual_command)
+        # One lookup resolves both names and aliases
+        cmd = self.registry.lookup.get(command_name)
 
-        if cmd_info:
+        if cmd:
             # Delegate execution to the command executor.
             # sys_cmd_exec will determine if it's a built-in or an app.
-            sys_cmd_exec.execute_command(actual_command, args, self.kernel, self, is_background)
+            sys_cmd_exec.run_command(cmd, args, self.kernel, self, is_background)
         else:
             print(f"Unknown command: '{command_name}'. Type 'help' for a list of commands.")
+
+    def _handle_pipeline(self, command_line):
+        """Parses 'command args | command args > file' and runs it as a pipeline."""
+        tokens = _PIPELINE_TOKEN.findall(command_line)
+        is_background = bool(tokens) and tokens[-1] == '&'
+        if is_background:
+            tokens.pop()
+
+        redirect = None
+        if len(tokens) >= 2 and tokens[-2] in ('>', '>>'):
+            redirect = (tokens[-1], tokens[-2] == '>>')
+            tokens = tokens[:-2]
+
+        stages = []
+        current = []
+        for token in tokens + ['|']:
+            if token in ('>', '>>'):
+                print(f"Syntax error: '{token}' must be followed by a file name at the end of the command.")
+                return
+            if token != '|':
+                current.append(token)
+                continue
+            if not current:
+                print("Syntax error: A pipeline stage is missing a command.")
+                return
+            command_name = current[0].lower()
+            cmd = self.registry.lookup.get(command_name)
+            if cmd is None:
+                print(f"Unknown command: '{command_name}'. Type 'help' for a list of commands.")
+                return
+            stages.append((cmd, current[1:]))
+            current = []
+
+        sys_cmd_exec.run_pipeline(stages, redirect, self.kernel, self, is_background)
@@ -1,79 +1,248 @@
 import os
+import time
+import socket
+import selectors
+from collections import deque
 from .process_mgr import ProcessManager, ProcessState
 from .time_mgr import *
-from .io_mgr import IOManager
 from .filesys_mgr import FileSystemManager
+from .schedule_mgr import ScheduleManager
+from .console import Console
+from .syscalls import ReadInput, Sleep, WaitPid, Await
+from .worker_host import WorkerPool
+from .async_io import AsyncIOManager
+from .trace_mgr import Tracer
 
 class Kernel:
     """The core of the OS, handling process scheduling and system calls."""
 
-    def __init__(self, proc_manager: ProcessManager, apeos_version: str, os_name: str, os_version: str):
+    def __init__(self, proc_manager: ProcessManager, apeos_version: str, os_name: str, os_version: str = None,
+                 console=None, boot_timer=None):
+        """
+        :param os_version: The host OS version. Looked up on first use if not given,
+                           it can be slow to query on some hosts.
+        :param boot_timer: The BootTimer started by the boot sequence, if any.
+        """
         self.proc_manager = proc_manager
-        
+        self.boot_timer = boot_timer or BootTimer()
+        self.show_boot_times = False # Print the boot timing breakdown before the first prompt
+
         # Determine project root to find the 'disks' directory
         # Assumes kernel.py is at aPEOSI/devices/internal/A/apeos/system2/sys/
-        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', '..', '..'))
-        
-        self.fs_manager = FileSystemManager(self, project_root)
-        self.io_manager = IOManager(self) # Handles command parsing
-        
+        self.project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', '..', '..'))
+
+        # Mounting the drives and loading the command table both touch the
+        # disk, so they happen on first use instead of before the prompt.
+        self._fs_manager = None
+        self._io_manager = None
+        self.scheduler = ScheduleManager() # Timers: one-shot and periodic tasks
+        self.worker_pool = WorkerPool(self) # Host processes for apps with exec_mode 'worker'
+        self.aio_manager = AsyncIOManager() # Thread pool for blocking filesystem work
+        self.tracer = Tracer(self) # Off until 'trace on'
+        self.console = console or Console()
+
+        # --- EVENT LOOP STATE ---
+        # Every event source (console, wakeups from other threads) is a
+        # selector registration whose data is the callback to run.
+        self.selector = selectors.DefaultSelector()
+        self._events = deque() # Callbacks posted from other threads
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self.selector.register(self._wakeup_recv, selectors.EVENT_READ, self._drain_wakeups)
+
+        self._input_lines = deque() # Lines typed ahead, waiting for a reader
+        self._input_eof = False
+        self._prompt_shown = False
+
+        self.proc_manager.syscall_handler = self._handle_syscall
+
         self.running = False
         self.apeos_version = apeos_version
         self.os_name = os_name
-        self.os_version = os_version
+        self._os_version = os_version
+        self.boot_timer.mark("kernel init")
+
+    @property
+    def fs_manager(self):
+        """The filesystem, mounted on first use."""
+        if self._fs_manager is None:
+            self._fs_manager = FileSystemManager(self, self.project_root)
+            self.boot_timer.mark("filesystem")
+        return self._fs_manager
+
+    @property
+    def io_manager(self):
+        """The command parser, which loads the command table on first use."""
+        if self._io_manager is None:
+            from .io_mgr import IOManager
+            self._io_manager = IOManager(self)
+            self.boot_timer.mark("command table")
+        return self._io_manager
+
+    @property
+    def os_version(self):
+        if self._os_version is None:
+            import platform
+            self._os_version = platform.version()
+        return self._os_version
 
     def _get_prompt(self):
         """Determines the correct prompt to display."""
         foreground_process = self.proc_manager.get_foreground_process()
         if foreground_process and foreground_process.state == ProcessState.WAITING_FOR_INPUT:
             # If an app is waiting for input, it controls the prompt
-            return "" # The app itself will print a prompt if it has one
-        
+            return foreground_process.syscall.prompt
+
         # Otherwise, show the default shell prompt
         full_path = self.fs_manager.get_full_current_path()
         if full_path.endswith('/') and len(full_path) > 1:
             full_path = full_path[:-1]
         return f"aPEOS_{self.apeos_version} {full_path}> "
 
+    # --- EVENT SOURCES ---
+
+    def post_event(self, callback):
+        """
+        Queues a callback to run on the kernel loop. Safe to call from any thread.
+
+        :param callback: A function taking no arguments.
+        """
+        self._events.append(callback)
+        try:
+            self._wakeup_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass # The loop is already due to wake up
+
+    def _drain_wakeups(self):
+        """Empties the wakeup socket; the posted callbacks run right after."""
+        try:
+            while self._wakeup_recv.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def on_input(self, line):
+        """Called by the console for every complete line of input."""
+        self._input_lines.append(line)
+
+    def on_input_eof(self):
+        """Called by the console when its input has been closed."""
+        self._input_eof = True
+
+    # --- SYSTEM CALLS ---
+
+    def _handle_syscall(self, process, request):
+        """Parks a process on a blocking request until it can be satisfied."""
+        proc_manager = self.proc_manager
+        if isinstance(request, ReadInput):
+            # Woken by _dispatch_input with the line as the result
+            proc_manager.block(process, ProcessState.WAITING_FOR_INPUT, request)
+        elif isinstance(request, Sleep):
+            proc_manager.block(process, ProcessState.SLEEPING, request)
+            self.scheduler.call_later(request.ms / 1000, lambda: proc_manager.wake(process),
+                                      name=f"wake {process.name} [{process.pid}]")
+        elif isinstance(request, WaitPid):
+            proc_manager.block(process, ProcessState.WAITING_FOR_PROCESS, request)
+            if not proc_manager.wait(request.pid, lambda exit_code: proc_manager.wake(process, exit_code)):
+                proc_manager.wake(process, None) # No such process
+        elif isinstance(request, Await):
+            proc_manager.block(process, ProcessState.WAITING_FOR_IO, request)
+            # Done callbacks may run on any thread, so the wakeup goes through the event queue
+            request.future.add_done_callback(
+                lambda future: self.post_event(lambda: self._finish_await(process, future)))
+        else:
+            raise TypeError(f"unknown system call {request!r}")
+
+    def _finish_await(self, process, future):
+        """Wakes a process parked on Await with the outcome of its future."""
+        if future.cancelled():
+            self.proc_manager.wake(process, error=InterruptedError("the operation was cancelled"))
+        elif future.exception() is not None:
+            self.proc_manager.wake(process, error=future.exception())
+        else:
+            self.proc_manager.wake(process, future.result())
+
+    # --- MAIN LOOP ---
+
+    def _ready_for_input(self):
+        """True if the shell or the foreground process is waiting for a line."""
+        foreground_process = self.proc_manager.get_foreground_process()
+        return foreground_process is None or foreground_process.state == ProcessState.WAITING_FOR_INPUT
+
+    def _input_pending(self):
+        """True if the input side has work to do: a prompt to show, a line to hand out or EOF."""
+        if not self._ready_for_input():
+            return False
+        return not self._prompt_shown or bool(self._input_lines) or self._input_eof
+
+    def _poll_events(self):
+        """Waits for events and runs their callbacks. Sleeps if there is nothing to do."""
+        if self._events or self.proc_manager.has_ready_processes() or self._input_pending():
+            timeout = 0
+        else:
+            # Nothing runnable: sleep until an event arrives or the next timer is due
+            deadline = self.scheduler.next_deadline()
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        for key, _ in self.selector.select(timeout):
+            key.data()
+        while self._events:
+            self._events.popleft()()
+        self.scheduler.run_due()
+
+    def _dispatch_input(self):
+        """Hands queued input lines to whoever is currently reading."""
+        if not self._ready_for_input():
+            return
+        if not self._prompt_shown:
+            prompt = self._get_prompt()
+            if not self.boot_timer.finished:
+                self.boot_timer.finish()
+                if self.show_boot_times:
+                    print(f"Boot time breakdown:\n{self.boot_timer.report()}")
+            self.console.prompt(prompt)
+            self._prompt_shown = True
+        if not self._input_lines:
+            if self._input_eof:
+                # Nobody can type anymore, so shut down like 'exit' would
+                print()
+                self.running = False
+            return
+
+        user_input = self._input_lines.popleft()
+        self._prompt_shown = False
+        foreground_process = self.proc_manager.get_foreground_process()
+        if foreground_process and foreground_process.state == ProcessState.WAITING_FOR_INPUT:
+            # An app is waiting for input, so the line is meant for it
+            self.proc_manager.wake(foreground_process, user_input)
+        else:
+            self.io_manager.handle_input(user_input)
+
     def start(self):
-        """Starts the main kernel loop to process commands."""
+        """Starts the main kernel loop: watches input and runs processes between keystrokes."""
         self.running = True
-        while self.running:
-            try:
-                # --- INPUT HANDLING ---
-                foreground_process = self.proc_manager.get_foreground_process()
-                if foreground_process and foreground_process.state == ProcessState.WAITING_FOR_INPUT:
-                    # An app is waiting for input, so we block and wait for the user
-                    user_input = input(self._get_prompt())
-                    foreground_process.app_instance.send_input(user_input)
-                    foreground_process.state = ProcessState.RUNNING
-                else:
-                    # The shell is active. We can run background tasks here.
-                    # For now, we just handle the next command.
-                    user_input = input(self._get_prompt())
-                    self.io_manager.handle_input(user_input)
-
-                # --- SCHEDULER ---
-                # Give every running process a chance to run
-                # Make a copy of the list as it might be modified during iteration
-                for process in list(self.proc_manager.get_running_processes()):
-                    if process.state == ProcessState.RUNNING:
-                        try:
-                            # Execute the next step of the process's generator
-                            next(process.task)
-                        except StopIteration:
-                            # The process's run() method has finished
-                            print(f"\n[{process.pid}] Process '{process.name}' terminated.")
-                            process.state = ProcessState.TERMINATED
-                            if self.proc_manager.foreground_pid == process.pid:
-                                self.proc_manager.foreground_pid = None
-                        except Exception as e:
-                            print(f"\n[{process.pid}] Error in process '{process.name}': {e}")
-                            process.state = ProcessState.TERMINATED
-                            if self.proc_manager.foreground_pid == process.pid:
-                                self.proc_manager.foreground_pid = None
-
-            except KeyboardInterrupt:
-                print("\nUse 'exit' to shut down the system.")
-            except Exception as e:
-                print(f"An error occurred: {e}")
+        self.console.attach(self)
+        try:
+            while self.running:
+                try:
+                    # --- EVENTS ---
+                    self._poll_events()
+
+                    # --- INPUT HANDLING ---
+                    self._dispatch_input()
+
+                    # --- SCHEDULER ---
+                    # Run the highest priority ready process for one time slice
+                    self.proc_manager.run_next()
+
+                except KeyboardInterrupt:
+                    print("\nUse 'exit' to shut down the system.")
+                    self._prompt_shown = False
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+        finally:
+            self.console.detach()
+            if self._fs_manager is not None:
+                self._fs_manager.shutdown() # Also waits for the I/O pool
+            self.worker_pool.shutdown()
+            self.aio_manager.shutdown()
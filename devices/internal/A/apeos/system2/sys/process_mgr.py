@@ -1,47 +1,322 @@
 import enum
+import time
+import heapq
+import itertools
+from collections import deque, OrderedDict
+from .syscalls import Yield
 
 class ProcessState(enum.Enum):
     """Represents the state of a running process."""
     RUNNING = 1         # The process is actively running or ready to run.
     WAITING_FOR_INPUT = 2 # The process is paused, waiting for user input.
     TERMINATED = 3      # The process has finished execution.
+    SLEEPING = 4        # The process is parked until a timer wakes it.
+    WAITING_FOR_PROCESS = 5 # The process is waiting for another process to finish.
+    WAITING_FOR_IO = 6  # The process is waiting for work done outside the kernel thread.
 
 class Process:
     """Represents a single running application instance."""
-    def __init__(self, pid, name, app_instance):
+    __slots__ = ('pid', 'name', 'app_instance', 'state', 'task', 'priority', 'level',
+                 'syscall', 'send_value', 'send_error', 'quiet',
+                 'started_ns', 'cpu_ns', 'steps', 'max_step_ns', 'input_wait_ns', 'blocked_ns')
+
+    def __init__(self, pid, name, task, app_instance=None, priority=0, quiet=False):
         self.pid = pid
         self.name = name
         self.app_instance = app_instance
         self.state = ProcessState.RUNNING
         # Use a generator for cooperative multitasking
-        self.task = self.app_instance.run()
+        self.task = task
+        # Scheduling: the base priority level and the current feedback level
+        self.priority = priority
+        self.level = priority
+        self.syscall = None # The request the process is parked on, if any
+        self.send_value = None # Result handed back to the generator on its next step
+        self.send_error = None # Or an exception raised inside it instead
+        # Shell commands run as processes: not announced, and nobody collects their exit code
+        self.quiet = quiet
+        # Accounting, all in perf_counter nanoseconds
+        self.started_ns = time.perf_counter_ns()
+        self.cpu_ns = 0 # Total time spent inside the generator
+        self.steps = 0
+        self.max_step_ns = 0 # The longest single step, i.e. the worst stall it caused
+        self.input_wait_ns = 0 # Total time parked on ReadInput
+        self.blocked_ns = 0 # When the current wait started
+
+    def avg_step_ns(self):
+        """Average time per step."""
+        return self.cpu_ns // self.steps if self.steps else 0
+
+class RunQueue:
+    """
+    A multi-level feedback queue of ready processes.
+
+    Level 0 has the highest priority and the shortest time slice. A process
+    that uses up its whole slice is demoted one level; a process that blocks
+    keeps its level, and every process is boosted back to its base priority
+    periodically so nothing starves. Only ready processes are ever queued,
+    so blocked processes cost nothing per tick.
+    """
+    def __init__(self, time_slices=(0.002, 0.005, 0.010), boost_interval=1.0):
+        """
+        :param time_slices: Time slice in seconds for each level, highest priority first.
+        :param boost_interval: Seconds between priority boosts.
+        """
+        self.time_slices = tuple(time_slices)
+        self.boost_interval = boost_interval
+        self.levels = [deque() for _ in self.time_slices]
+        self._size = 0
+        self._next_boost = time.perf_counter() + boost_interval
+
+    def __len__(self):
+        return self._size
+
+    def push(self, process):
+        """Appends a ready process to the queue of its level."""
+        self.levels[process.level].append(process)
+        self._size += 1
+
+    def pop(self):
+        """Removes and returns the next process to run, or None if the queue is empty."""
+        if not self._size:
+            return None
+        if time.perf_counter() >= self._next_boost:
+            self._boost()
+        for queue in self.levels:
+            if queue:
+                self._size -= 1
+                return queue.popleft()
+        return None
+
+    def demote(self, process):
+        """Moves a process that used its whole slice one level down."""
+        if process.level < len(self.levels) - 1:
+            process.level += 1
+
+    def _boost(self):
+        """Returns every queued process to its base priority level."""
+        queued = [p for queue in self.levels for p in queue]
+        for queue in self.levels:
+            queue.clear()
+        for process in queued:
+            process.level = process.priority
+            self.levels[process.level].append(process)
+        self._next_boost = time.perf_counter() + self.boost_interval
 
 class ProcessManager:
     """
     Manages all running processes in the system for cooperative multitasking.
     """
-    def __init__(self):
-        self.processes = {}
+    def __init__(self, time_slices=(0.002, 0.005, 0.010), boost_interval=1.0, max_exit_statuses=1024):
+        self.processes = {} # Live processes only; finished ones are reaped
         self.next_pid = 0
         self.foreground_pid = None # PID of the process currently getting user input
+        self.run_queue = RunQueue(time_slices, boost_interval)
+        # Exit codes of finished processes nobody has waited for yet (zombies).
+        # The table is bounded: the oldest status is dropped when it is full.
+        self.exit_statuses = OrderedDict()
+        self.max_exit_statuses = max_exit_statuses
+        self._free_pids = [] # Heap of recycled PIDs, lowest is reused first
+        self._exit_waiters = {} # pid -> list of callbacks taking the exit code
+        self.current_process = None # The process whose slice is running right now
+        self.last_process = None # The process that ran in the most recent slice
+        # Called as syscall_handler(process, request) for every blocking request.
+        # The kernel installs it; it must park the process with block().
+        self.syscall_handler = None
 
-    def create_process(self, app_instance, command_name, is_foreground=True):
-        """Creates and starts a new process."""
+    def _allocate_pid(self):
+        """Returns the lowest recycled PID, or a fresh one."""
+        if self._free_pids:
+            return heapq.heappop(self._free_pids)
         pid = self.next_pid
         self.next_pid += 1
-        
-        process = Process(pid, command_name, app_instance)
+        return pid
+
+    def _release_pid(self, pid):
+        """Makes a PID available for reuse."""
+        heapq.heappush(self._free_pids, pid)
+
+    def create_process(self, app_instance, command_name, is_foreground=True, priority=0):
+        """Creates and starts a new process running app_instance.run()."""
+        return self.spawn(app_instance.run(), command_name, is_foreground, priority, app_instance)
+
+    def spawn(self, task, command_name, is_foreground=True, priority=0, app_instance=None, quiet=False):
+        """
+        Creates and starts a new process from a generator.
+
+        :param quiet: Don't print the started/terminated messages and don't keep the exit code.
+        """
+        pid = self._allocate_pid()
+
+        priority = max(0, min(priority, len(self.run_queue.levels) - 1))
+        process = Process(pid, command_name, task, app_instance, priority, quiet)
         self.processes[pid] = process
-        
+        self.run_queue.push(process)
+
         if is_foreground:
             self.foreground_pid = pid
-        
-        print(f"[{pid}] Process '{command_name}' started.")
+
+        if not quiet:
+            print(f"[{pid}] Process '{command_name}' started.")
         return process
 
+    def has_ready_processes(self):
+        """Returns True if any process is waiting in the run queue."""
+        return len(self.run_queue) > 0
+
+    def block(self, process, state, request=None):
+        """Parks a process; it is not scheduled again until wake() is called."""
+        process.state = state
+        process.syscall = request
+        process.blocked_ns = time.perf_counter_ns()
+
+    def wake(self, process, value=None, error=None):
+        """
+        Makes a blocked process ready to run again.
+
+        :param value: The result of the syscall it was parked on.
+        :param error: If given, this exception is raised inside the process instead.
+        """
+        if process.state == ProcessState.TERMINATED:
+            return
+        if process.state != ProcessState.RUNNING:
+            if process.state == ProcessState.WAITING_FOR_INPUT:
+                process.input_wait_ns += time.perf_counter_ns() - process.blocked_ns
+            process.state = ProcessState.RUNNING
+            process.syscall = None
+            process.send_value = value
+            process.send_error = error
+            # It gave up the CPU to wait, so it gets its base priority back
+            process.level = process.priority
+            self.run_queue.push(process)
+
+    def run_next(self):
+        """
+        Runs the next ready process for up to one time slice.
+        Returns False if no process was ready.
+        """
+        process = self.run_queue.pop()
+        if process is None:
+            return False
+        if process.state != ProcessState.RUNNING:
+            return True
+        self.current_process = self.last_process = process
+
+        # Every step is timed for the accounting; the same clock reading also
+        # enforces the time slice. The loop does nothing else for it: counters
+        # live in locals, the step count comes from the for loop itself and the
+        # float clock avoids allocating an int per step. They are converted and
+        # written back once at the end of the slice.
+        clock = time.perf_counter
+        now = slice_start = clock()
+        deadline = now + self.run_queue.time_slices[process.level]
+        steps = 0
+        max_step = 0.0
+        try:
+            for steps in itertools.count(1):
+                # Execute the next step of the process's generator
+                if process.send_error is None:
+                    value, process.send_value = process.send_value, None
+                    request = process.task.send(value)
+                else:
+                    error, process.send_error = process.send_error, None
+                    request = process.task.throw(error)
+                end = clock()
+                if end - now > max_step:
+                    max_step = end - now
+                now = end
+
+                if request is not None:
+                    if request.__class__ is Yield:
+                        # Gave up the rest of its slice voluntarily: no demotion
+                        break
+                    # A blocking request: the handler parks the process (and may
+                    # wake it right away), so it is never requeued here
+                    self.syscall_handler(process, request)
+                    return True
+                if process.state != ProcessState.RUNNING:
+                    return True
+                if now >= deadline:
+                    self.run_queue.demote(process)
+                    break
+        except StopIteration as stop:
+            now = clock() # The step that raised is already counted
+            # The process's run() method has finished; its return value is the exit code
+            if not process.quiet:
+                print(f"\n[{process.pid}] Process '{process.name}' terminated.")
+            self._terminate(process, stop.value if isinstance(stop.value, int) else 0)
+            return True
+        except Exception as e:
+            now = clock()
+            print(f"\n[{process.pid}] Error in process '{process.name}': {e}")
+            self._terminate(process, 1)
+            return True
+        finally:
+            self.current_process = None
+            process.cpu_ns += int((now - slice_start) * 1e9)
+            process.steps += steps
+            max_step = int(max_step * 1e9)
+            if max_step > process.max_step_ns:
+                process.max_step_ns = max_step
+
+        self.run_queue.push(process)
+        return True
+
+    def _terminate(self, process, exit_code):
+        """Reaps a finished process, keeping only its exit code."""
+        pid = process.pid
+        process.state = ProcessState.TERMINATED
+        # Drop the app and its finished generator right away
+        process.task = None
+        process.app_instance = None
+        del self.processes[pid]
+        if self.foreground_pid == pid:
+            self.foreground_pid = None
+
+        waiters = self._exit_waiters.pop(pid, None)
+        if process.quiet and not waiters:
+            self._release_pid(pid)
+            return
+        if waiters:
+            # Someone is already waiting, so the status is collected immediately
+            self._release_pid(pid)
+            for callback in waiters:
+                callback(exit_code)
+            return
+
+        self.exit_statuses[pid] = exit_code
+        if len(self.exit_statuses) > self.max_exit_statuses:
+            old_pid, _ = self.exit_statuses.popitem(last=False)
+            self._release_pid(old_pid)
+
+    def collect_exit_status(self, pid):
+        """
+        Returns and forgets the exit code of a finished process, freeing its PID.
+        Returns None if there is no unclaimed exit status for that PID.
+        """
+        if pid not in self.exit_statuses:
+            return None
+        exit_code = self.exit_statuses.pop(pid)
+        self._release_pid(pid)
+        return exit_code
+
+    def wait(self, pid, callback):
+        """
+        Calls callback(exit_code) once the process has finished.
+        Returns False if there is no such process, live or finished.
+        """
+        if pid in self.processes:
+            self._exit_waiters.setdefault(pid, []).append(callback)
+            return True
+        exit_code = self.collect_exit_status(pid)
+        if exit_code is None:
+            return False
+        callback(exit_code)
+        return True
+
     def get_running_processes(self):
         """Returns a list of all non-terminated processes."""
-        return [p for p in self.processes.values() if p.state != ProcessState.TERMINATED]
+        return list(self.processes.values())
 
     def get_foreground_process(self):
         """Gets the process currently in the foreground."""
@@ -51,7 +326,7 @@ class ProcessManager:
 
     def set_foreground_process(self, pid):
         """Sets a process to be in the foreground."""
-        if pid in self.processes and self.processes[pid].state != ProcessState.TERMINATED:
+        if pid in self.processes:
             self.foreground_pid = pid
             return True
         return False
@@ -1,15 +1,121 @@
 # This is the schedule manager for the system. It handles scheduling tasks and managing time-based events, and it logs programs and their execution times
+import math
+import time
+import heapq
+import itertools
+
+class Timer:
+    """A task scheduled to run once at a given time, or periodically."""
+    __slots__ = ('timer_id', 'when', 'interval', 'task', 'name', 'cancelled')
+
+    def __init__(self, timer_id, when, task, interval=None, name=None):
+        self.timer_id = timer_id
+        self.when = when            # time.monotonic() deadline of the next run
+        self.interval = interval    # Seconds between runs, None for one-shot timers
+        self.task = task            # Callable taking no arguments
+        self.name = name or getattr(task, '__name__', 'task')
+        self.cancelled = False
+
 class ScheduleManager:
+    """
+    Keeps timers in a binary heap ordered by deadline.
+
+    Adding a timer and firing the earliest one are O(log n). Cancelled timers
+    are only flagged and skipped when they reach the top of the heap; the heap
+    is rebuilt when they make up more than half of it.
+    """
     def __init__(self):
-        self.scheduled_tasks = []
+        self._heap = [] # Entries are (when, sequence, timer)
+        self._timers = {} # timer_id -> Timer, active timers only
+        self._ids = itertools.count(1)
+        self._sequence = itertools.count() # Keeps equal deadlines in FIFO order
+        self._cancelled = 0
+
+    def __len__(self):
+        return len(self._timers)
+
+    def call_later(self, delay, task, interval=None, name=None):
+        """
+        Schedules task() to run after delay seconds.
+
+        :param delay: Seconds from now until the first run.
+        :param task: A callable taking no arguments.
+        :param interval: If given, the task repeats every interval seconds.
+        :param name: A label shown by 'list_tasks'.
+        :return: The new Timer.
+        """
+        timer = Timer(next(self._ids), time.monotonic() + max(0.0, delay), task, interval, name)
+        self._timers[timer.timer_id] = timer
+        self._push(timer)
+        return timer
+
+    def call_every(self, interval, task, name=None):
+        """Schedules task() to run every interval seconds, starting one interval from now."""
+        return self.call_later(interval, task, interval, name)
+
+    def schedule_task(self, task, execution_time, interval=None, name=None):
+        """Schedule a new task to be executed at a specific time (seconds since the epoch)."""
+        return self.call_later(execution_time - time.time(), task, interval, name)
+
+    def cancel(self, timer_id):
+        """Cancels a timer. Returns False if no active timer has that id."""
+        timer = self._timers.pop(timer_id, None)
+        if timer is None:
+            return False
+        timer.cancelled = True
+        self._cancelled += 1
+        if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+            self._compact()
+        return True
 
-    def schedule_task(self, task, execution_time):
-        """Schedule a new task to be executed at a specific time."""
-        self.scheduled_tasks.append((execution_time, task))
+    def next_deadline(self):
+        """Returns the monotonic time of the earliest active timer, or None."""
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+            self._cancelled -= 1
+        return heap[0][0] if heap else None
 
-    def get_scheduled_tasks(self):
-        """Retrieve the list of scheduled tasks."""
-        return self.scheduled_tasks
+    def run_due(self, now=None):
+        """Runs every timer whose deadline has passed. Returns how many ran."""
+        if now is None:
+            now = time.monotonic()
+        heap = self._heap
+        fired = 0
+        while heap and heap[0][0] <= now:
+            _, _, timer = heapq.heappop(heap)
+            if timer.cancelled:
+                self._cancelled -= 1
+                continue
+            if timer.interval:
+                # Periodic timers keep their cadence, but skip the runs they missed
+                # rather than catch up on them, so the next one is after now
+                timer.when += timer.interval * (math.floor((now - timer.when) / timer.interval) + 1)
+                self._push(timer)
+            else:
+                del self._timers[timer.timer_id]
+            fired += 1
+            try:
+                timer.task()
+            except Exception as e:
+                print(f"\nScheduler: Task '{timer.name}' failed: {e}")
+        return fired
 
+    def get_scheduled_tasks(self, limit=None):
+        """
+        Retrieve the upcoming timers, soonest first.
+        Only the first 'limit' timers are ordered, the rest of the heap is left alone.
+        """
+        if limit is None:
+            limit = len(self._timers)
+        entries = heapq.nsmallest(limit + self._cancelled, self._heap)
+        return [timer for _, _, timer in entries if not timer.cancelled][:limit]
 
+    def _push(self, timer):
+        heapq.heappush(self._heap, (timer.when, next(self._sequence), timer))
 
+    def _compact(self):
+        """Drops cancelled timers from the heap."""
+        self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+        heapq.heapify(self._heap)
+        self._cancelled = 0
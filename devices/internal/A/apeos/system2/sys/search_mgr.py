@@ -0,0 +1,755 @@
+import os
+import re
+import fnmatch
+import hashlib
+import time
+import threading
+import contextlib
+
+try:
+    import sqlite3
+except ImportError: # Python built without SQLite: no search index
+    sqlite3 = None
+
+from .filesys_mgr import FileSystemError, NotADirError, FileAccessError
+
+# Every drive gets a search index, an SQLite database under .apeos_cache,
+# out of the tree the user sees (see index_path): a table of every file and directory, a trigram index of their
+# names and a trigram index of the contents of text files. Queries touch
+# only the index, so finding a file on a drive with a million of them takes
+# milliseconds instead of a walk of the whole tree.
+#
+# The index is kept up to date from three sides:
+#  - changes made through the FileSystemManager are reported to notify(),
+#    and the directories they touched are rescanned before the next query;
+#  - a sweep compares the mtimes of the indexed directories with the disk
+#    and rescans the ones that changed, which catches files created, deleted
+#    or renamed by other programs. It runs in the background at most every
+#    SWEEP_INTERVAL seconds, and checks every file once per session to
+#    catch files edited in place;
+#  - 'index /full' and 'index /rebuild' do the same by hand.
+#
+# The first query on a drive starts building its index in the background;
+# find and grep read the directories themselves until it is ready.
+
+# Where the index of a drive used to be kept, in the drive's folder; removed when the index is opened.
+# Its -wal and -shm companions share the prefix.
+_OLD_INDEX_FILE = '.apeos_index.db'
+# SQLite 3.43 can delete rows from a contentless table. Older ones leave the
+# row of a changed file behind, and the content index is rebuilt once those
+# stale rows outnumber the live ones.
+_CONTENT_DELETE = sqlite3 is not None and sqlite3.sqlite_version_info >= (3, 43, 0)
+_FORMAT = 2 if _CONTENT_DELETE else 1
+SWEEP_INTERVAL = 60.0 # Seconds between background sweeps
+# Changed paths remembered for a drive whose index is not open; past that the
+# drive is left to the full sweep every session starts with (see refresh)
+MAX_PENDING = 10_000
+MAX_TEXT_SIZE = 1 << 20 # Bigger files are indexed by name only
+_BINARY_PROBE = 8192 # A NUL byte in this many leading bytes marks a binary file
+_COMMIT_EVERY = 2000 # Changes per transaction, so queries see a long sweep progress
+_RACY_NS = 1_000_000_000 # See FileSystemManager._RACY_NS
+_MAX_PAUSE = 10.0 # Seconds a sweep waits at most for the walks that paused it (see DriveIndex.pause)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL, -- Relative to the drive, '/'-separated
+    parent TEXT NOT NULL, -- '' for the drive's root
+    is_dir INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_id INTEGER -- Row of the content index, NULL if the contents are not indexed
+);
+CREATE INDEX IF NOT EXISTS files_parent ON files (parent);
+CREATE INDEX IF NOT EXISTS files_content ON files (content_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5 (name, tokenize='trigram', detail='none');
+CREATE VIRTUAL TABLE IF NOT EXISTS content USING fts5 (body, tokenize='trigram', content='', detail='none'{});
+""".format(", contentless_delete=1" if _CONTENT_DELETE else '')
+
+
+def available():
+    """True if this Python has SQLite with the FTS5 trigram tokenizer."""
+    if sqlite3 is None:
+        return False
+    try:
+        sqlite3.connect(':memory:').execute("CREATE VIRTUAL TABLE t USING fts5 (x, tokenize='trigram')")
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def required_literals(pattern):
+    """
+    Runs of plain characters that every match of a regular expression must
+    contain, for narrowing a content search down with the trigram index.
+    Conservative: anything optional, alternative or unusual is left out, and
+    an empty list means every file is a candidate.
+    """
+    if '|' in pattern:
+        return []
+    runs = []
+    run = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        if c == '\\':
+            escaped = pattern[i:i + 1]
+            i += 1
+            if escaped and not escaped.isalnum():
+                run.append(escaped) # '\.' and the like are literal
+                continue
+            c = None # A class like \d, or a back reference
+        elif c in '*?{':
+            if run:
+                run.pop() # The character before it may not be there at all
+            if c == '{':
+                i = pattern.find('}', i) + 1 or len(pattern)
+            c = None
+        elif c == '[':
+            end = pattern.find(']', i + 1) # A ']' right after '[' is part of the set
+            i = end + 1 if end != -1 else len(pattern)
+            c = None
+        elif c == '(':
+            depth = 1 # Groups may be optional, skip them
+            while i < len(pattern) and depth:
+                if pattern[i] == '\\':
+                    i += 1
+                elif pattern[i] == '(':
+                    depth += 1
+                elif pattern[i] == ')':
+                    depth -= 1
+                i += 1
+            c = None
+        elif c in '.^$+)]}':
+            c = None
+        if c is None:
+            if run:
+                runs.append(''.join(run))
+            run = []
+        else:
+            run.append(c)
+    if run:
+        runs.append(''.join(run))
+    return [r for r in runs if len(r) >= 3]
+
+
+def _trigram_query(literals):
+    """An FTS5 query matching text that contains every literal. Trigrams are ANDed, which may match a little too much."""
+    trigrams = {lit[i:i + 3] for lit in literals for i in range(len(lit) - 2)}
+    return ' AND '.join('"' + t.replace('"', '""') + '"' for t in sorted(trigrams))
+
+
+def _glob_to_like(pattern):
+    """A LIKE pattern matching at least what the glob matches ('_' and '%' in names match too much)."""
+    return pattern.replace('*', '%').replace('?', '_')
+
+
+def index_path(index_dir, root):
+    """The database of the index of the drive in a host folder, named after the folder and a hash of its path."""
+    digest = hashlib.sha1(os.path.normcase(root).encode('utf-8', 'surrogatepass')).hexdigest()[:16]
+    return os.path.join(index_dir, f"{os.path.basename(root.rstrip(os.sep)) or 'drive'}-{digest}.db")
+
+
+class DriveIndex:
+    """The search index of one drive."""
+
+    def __init__(self, letter, root, db_path, submit, opener=open):
+        """
+        :param letter: The drive letter, e.g. 'A:'.
+        :param root: The host folder of the drive.
+        :param db_path: The database file (see index_path).
+        :param submit: Runs a function in the background and returns a Future (the I/O pool).
+        :param opener: Opens a host file in a binary mode, like open(), e.g. to decompress it.
+        """
+        self.letter = letter
+        self.root = root
+        self._opener = opener
+        self.db_path = db_path
+        self._submit = submit
+        # The sweep writes on an I/O thread while queries read on the kernel
+        # thread, each on its own connection; WAL lets them run concurrently
+        self._reader = None
+        self._writer = None
+        self._write_lock = threading.Lock()
+        self._pending = set() # Changed paths, relative to the drive
+        self._pending_lock = threading.Lock()
+        self._sweep = None # Future of the running background sweep
+        self._last_sweep = None # time.monotonic() of the last sweep of this session
+        self._stop = False
+        # Set unless find or grep are walking the drive while it is swept
+        self._resume = threading.Event()
+        self._resume.set()
+        self._pauses = 0
+        self._paused_at = 0.0
+        self._pause_lock = threading.Lock()
+        self._changes = 0 # Since the last commit
+        # Counters of the meta table, kept here and saved with every commit so
+        # that indexing a file costs no extra queries
+        self._next_content_id = 1
+        self._stale_content = 0
+        self.stats = {'added': 0, 'updated': 0, 'removed': 0} # Of the last sweep
+
+    def open(self):
+        """Opens or creates the database. Raises sqlite3.Error if it cannot."""
+        if self._writer is not None:
+            return
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(os.path.join(self.root, _OLD_INDEX_FILE + suffix))
+            except OSError:
+                pass # Never was one
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        writer = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            writer.execute("PRAGMA journal_mode=WAL")
+            writer.execute("PRAGMA synchronous=NORMAL") # The index can always be rebuilt
+            writer.executescript(_SCHEMA)
+            if self._meta(writer, 'format') not in (None, _FORMAT):
+                writer.executescript("DROP TABLE files; DROP TABLE names; DROP TABLE content; DELETE FROM meta;")
+                writer.executescript(_SCHEMA)
+            writer.commit()
+        except sqlite3.Error:
+            writer.close()
+            raise
+        self._writer = writer
+        self._next_content_id = self._meta(writer, 'next_content_id', 1)
+        self._stale_content = self._meta(writer, 'stale_content', 0)
+        self._reader = sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def close(self):
+        """Stops a running sweep, applies the pending changes and closes the database."""
+        self._stop = True
+        self._resume.set()
+        if self._writer is None:
+            return
+        with self._write_lock: # Waits for the sweep to notice _stop
+            self._stop = False
+            try:
+                self._apply_pending()
+            except (OSError, sqlite3.Error):
+                pass # The next session's sweep catches up
+            self._writer.close()
+            self._reader.close()
+            self._writer = self._reader = None
+
+    @property
+    def is_built(self):
+        return self._meta(self._reader, 'built') is not None
+
+    @contextlib.contextmanager
+    def _errors(self, action):
+        """Turns database errors into FileSystemErrors with a message for the user."""
+        try:
+            yield
+        except sqlite3.Error as e:
+            raise FileAccessError(f"Error: The search index of drive {self.letter} could not be {action}: {e}") from e
+
+    @staticmethod
+    def _meta(db, key, default=None):
+        row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._writer.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def pause(self):
+        """
+        Holds a running sweep back between directories while find or grep
+        walk the drive without the index, so that the two do not compete for
+        the interpreter. Every pause() needs a resume(); the sweep goes on
+        after _MAX_PAUSE seconds regardless. Thread-safe.
+        """
+        with self._pause_lock:
+            if not self._pauses:
+                self._paused_at = time.monotonic()
+                self._resume.clear()
+            self._pauses += 1
+
+    def resume(self):
+        """Ends a pause(). Thread-safe."""
+        with self._pause_lock:
+            self._pauses -= 1
+            if not self._pauses:
+                self._resume.set()
+
+    # --- UPDATING ---
+
+    def mark_changed(self, rel_path):
+        """Records that something at a path changed. Thread-safe."""
+        with self._pending_lock:
+            self._pending.add(rel_path)
+
+    def build(self, rebuild=False):
+        """
+        Indexes the whole drive on the calling thread, from scratch if rebuild
+        is set (which also drops the contents of files that changed since the
+        index was built; see _index_content). Returns the sweep's statistics.
+        """
+        with self._write_lock, self._errors("updated"):
+            stats = self._rebuild_locked() if rebuild else self._sweep_locked(full=True)
+        self._last_sweep = time.monotonic()
+        return stats
+
+    def start_build(self):
+        """
+        Builds the index on the I/O pool, unless a build or sweep is running.
+        Returns its Future, or None if one was running already.
+        """
+        if self._sweep is not None and not self._sweep.done():
+            return None
+        self._sweep = self._submit(self.build)
+        return self._sweep
+
+    def _rebuild_locked(self):
+        self._writer.executescript(
+            "DELETE FROM files; DELETE FROM names; DELETE FROM meta; "
+            "INSERT INTO content (content) VALUES ('delete-all');")
+        self._next_content_id = 1
+        self._stale_content = 0
+        return self._sweep_locked(full=True)
+
+    def refresh(self):
+        """
+        Brings the index up to date before a query, without blocking on a
+        running sweep: changes made through aPEOS-I are applied right away
+        if the index is free, and a background sweep is started when one is due.
+        """
+        if self._pending and self._write_lock.acquire(blocking=False):
+            try:
+                self._apply_pending()
+            finally:
+                self._write_lock.release()
+        if self._sweep is None or self._sweep.done():
+            if self._last_sweep is None or time.monotonic() - self._last_sweep >= SWEEP_INTERVAL:
+                # The first sweep of a session checks every file, later ones only the directories
+                full = self._last_sweep is None
+                self._last_sweep = time.monotonic()
+                self._sweep = self._submit(self.sweep, full)
+
+    def sweep(self, full=False):
+        """
+        Rescans every indexed directory whose mtime changed, or every directory
+        if full is set (which also catches files edited in place). Rebuilds
+        the index instead once most rows of the content index are stale.
+        Returns the statistics of the sweep.
+        """
+        with self._write_lock, self._errors("updated"):
+            # Stale rows only come about without _CONTENT_DELETE
+            if self._stale_content > self._next_content_id - 1 - self._stale_content:
+                return self._rebuild_locked()
+            return self._sweep_locked(full)
+
+    def _sweep_locked(self, full):
+        start = time.perf_counter()
+        self.stats = {'added': 0, 'updated': 0, 'removed': 0}
+        self._apply_pending()
+        dirs = [('', self._meta(self._writer, 'root_mtime', 0))]
+        dirs += self._writer.execute("SELECT path, mtime_ns FROM files WHERE is_dir").fetchall()
+        for rel_path, mtime in dirs:
+            if self._stop:
+                break
+            try:
+                current = os.stat(self._host_path(rel_path)).st_mtime_ns
+            except OSError:
+                continue # Removed along with its parent's rescan
+            if full or current != mtime:
+                self._rescan(rel_path)
+        if not self._stop:
+            self._set_meta('format', _FORMAT)
+            self._set_meta('built', time.time())
+        self._commit()
+        self.stats['seconds'] = time.perf_counter() - start
+        return self.stats
+
+    def _apply_pending(self):
+        """Rescans the directories holding the paths changed through aPEOS-I. Called with the write lock held."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, set()
+        if not pending or self._meta(self._writer, 'built') is None:
+            return
+        parents = set()
+        for rel_path in pending:
+            # The nearest directory the index already knows; new directories are scanned from there
+            parent = rel_path.rpartition('/')[0]
+            while parent and self._writer.execute(
+                    "SELECT 1 FROM files WHERE path = ? AND is_dir", (parent,)).fetchone() is None:
+                parent = parent.rpartition('/')[0]
+            parents.add(parent)
+        for parent in sorted(parents):
+            self._rescan(parent)
+        self._commit()
+
+    def _rescan(self, rel_path):
+        """
+        Brings the entries of one directory in line with the disk, indexing
+        new subdirectories completely. Files are only re-read if their size
+        or mtime changed.
+        """
+        db = self._writer
+        stack = [rel_path]
+        while stack and not self._stop:
+            if not self._resume.is_set():
+                self._resume.wait(self._paused_at + _MAX_PAUSE - time.monotonic())
+            rel_path = stack.pop()
+            host_path = self._host_path(rel_path)
+            known = {row[0].rpartition('/')[2]: row[1:] for row in db.execute(
+                "SELECT path, id, is_dir, size, mtime_ns, content_id FROM files WHERE parent = ?", (rel_path,))}
+            try:
+                mtime = os.stat(host_path).st_mtime_ns
+                entries = os.scandir(host_path)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    child = f"{rel_path}/{entry.name}" if rel_path else entry.name
+                    old = known.pop(entry.name, None)
+                    if old is not None and bool(old[1]) != is_dir:
+                        self._remove(child, old)
+                        old = None
+                    if old is None:
+                        self._add(child, rel_path, entry.name, is_dir, stat, entry.path)
+                        if is_dir:
+                            stack.append(child)
+                    elif not is_dir and (old[2] != stat.st_size or old[3] != stat.st_mtime_ns):
+                        self._update(old, stat, entry.path)
+            for name, old in known.items():
+                self._remove(f"{rel_path}/{name}" if rel_path else name, old)
+            # A directory that changed within the timestamp tick is rescanned next time
+            if time.time_ns() - mtime < _RACY_NS:
+                mtime = 0
+            if rel_path:
+                db.execute("UPDATE files SET mtime_ns = ? WHERE path = ?", (mtime, rel_path))
+            else:
+                self._set_meta('root_mtime', mtime)
+            self._counted()
+
+    def _add(self, rel_path, parent, name, is_dir, stat, host_path):
+        content_id = None if is_dir else self._index_content(host_path, stat)
+        mtime = stat.st_mtime_ns
+        if is_dir:
+            mtime = 0 # Set by the rescan that follows
+        cursor = self._writer.execute(
+            "INSERT INTO files (path, parent, is_dir, size, mtime_ns, content_id) VALUES (?, ?, ?, ?, ?, ?)",
+            (rel_path, parent, is_dir, stat.st_size, mtime, content_id))
+        self._writer.execute("INSERT INTO names (rowid, name) VALUES (?, ?)", (cursor.lastrowid, name))
+        self.stats['added'] += 1
+        self._counted()
+
+    def _update(self, old, stat, host_path):
+        file_id, _, _, _, content_id = old
+        self._drop_content(content_id)
+        self._writer.execute("UPDATE files SET size = ?, mtime_ns = ?, content_id = ? WHERE id = ?",
+                             (stat.st_size, stat.st_mtime_ns, self._index_content(host_path, stat), file_id))
+        self.stats['updated'] += 1
+        self._counted()
+
+    def _remove(self, rel_path, old):
+        """Removes an entry, and everything below it if it is a directory."""
+        db = self._writer
+        rows = [(old[0], old[4])]
+        if old[1]:
+            rows += db.execute("SELECT id, content_id FROM files WHERE path > ? AND path < ?",
+                               (rel_path + '/', rel_path + '0')).fetchall() # '0' follows '/'
+        for file_id, content_id in rows:
+            db.execute("DELETE FROM names WHERE rowid = ?", (file_id,))
+            db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            self._drop_content(content_id)
+        self.stats['removed'] += len(rows)
+        self._counted()
+
+    def _index_content(self, host_path, stat):
+        """Adds a text file to the content index. Returns its content id, or None for binary and big files."""
+        if stat.st_size > MAX_TEXT_SIZE:
+            return None
+        try:
+            with self._opener(host_path, 'rb') as f:
+                data = f.read(MAX_TEXT_SIZE)
+        except OSError:
+            return None
+        if b'\0' in data[:_BINARY_PROBE]:
+            return None
+        # A changed file gets a new row. Without _CONTENT_DELETE the content
+        # index cannot delete the old one, which is ignored from then on (see
+        # _drop_content) until the index is rebuilt.
+        content_id = self._next_content_id
+        self._next_content_id += 1
+        self._writer.execute("INSERT INTO content (rowid, body) VALUES (?, ?)",
+                             (content_id, data.decode('utf-8', errors='replace')))
+        return content_id
+
+    def _drop_content(self, content_id):
+        if content_id is None:
+            return
+        if _CONTENT_DELETE:
+            self._writer.execute("DELETE FROM content WHERE rowid = ?", (content_id,))
+        else:
+            self._stale_content += 1
+
+    def _counted(self):
+        self._changes += 1
+        if self._changes >= _COMMIT_EVERY:
+            self._commit()
+
+    def _commit(self):
+        self._set_meta('next_content_id', self._next_content_id)
+        self._set_meta('stale_content', self._stale_content)
+        self._writer.commit()
+        self._changes = 0
+
+    def _host_path(self, rel_path):
+        return os.path.join(self.root, *rel_path.split('/')) if rel_path else self.root
+
+    # --- QUERIES ---
+
+    @staticmethod
+    def _scope(prefix):
+        """SQL condition and parameters limiting a query to a subtree."""
+        if not prefix:
+            return '', ()
+        return " AND f.path > ? AND f.path < ?", (prefix + '/', prefix + '0')
+
+    def find(self, pattern, prefix='', want_dirs=None):
+        """
+        Returns (relative path, is_dir) of the entries whose name matches a glob
+        pattern, case-insensitively, sorted by path.
+
+        :param prefix: Only search below this directory (relative to the drive).
+        :param want_dirs: True or False to keep only directories or only files.
+        """
+        match = re.compile(fnmatch.translate(pattern), re.IGNORECASE).match
+        scope, params = self._scope(prefix)
+        if want_dirs is not None:
+            scope += " AND f.is_dir = ?"
+            params += (want_dirs,)
+        with self._errors("read"):
+            rows = self._reader.execute(
+                "SELECT f.path, f.is_dir FROM names JOIN files f ON f.id = names.rowid"
+                f" WHERE names.name LIKE ?{scope} ORDER BY f.path", (_glob_to_like(pattern),) + params).fetchall()
+        return [(path, bool(is_dir)) for path, is_dir in rows if match(path.rpartition('/')[2])]
+
+    def text_files(self, literals=(), prefix=''):
+        """
+        Returns the relative paths of the text files that may contain all of
+        the literals (all text files if there are none), sorted by path.
+        """
+        scope, params = self._scope(prefix)
+        with self._errors("read"):
+            if literals:
+                rows = self._reader.execute(
+                    "SELECT f.path FROM content JOIN files f ON f.content_id = content.rowid"
+                    f" WHERE content MATCH ?{scope} ORDER BY f.path", (_trigram_query(literals),) + params)
+            else:
+                rows = self._reader.execute(
+                    f"SELECT f.path FROM files f WHERE f.content_id IS NOT NULL{scope} ORDER BY f.path", params)
+            return [path for path, in rows]
+
+    def status(self):
+        """Returns the size and state of the index as a dict."""
+        db = self._reader
+        counts = dict(db.execute("SELECT is_dir, COUNT(*) FROM files GROUP BY is_dir").fetchall())
+        size = 0
+        for suffix in ('', '-wal'):
+            try:
+                size += os.path.getsize(self.db_path + suffix)
+            except OSError:
+                pass
+        return {
+            'files': counts.get(0, 0),
+            'dirs': counts.get(1, 0),
+            'text_files': db.execute("SELECT COUNT(*) FROM files WHERE content_id IS NOT NULL").fetchone()[0],
+            'stale_content': self._meta(db, 'stale_content', 0),
+            'built': self._meta(db, 'built'),
+            'sweeping': self._sweep is not None and not self._sweep.done(),
+            'bytes': size,
+        }
+
+
+class SearchManager:
+    """The search indexes of all drives, opened on first use."""
+
+    def __init__(self, fs_manager):
+        self.fs_manager = fs_manager
+        self.indexes = {} # drive letter -> open DriveIndex
+        # Changes on drives whose index is not open but exists, applied when it is
+        # opened or at shutdown: drive letter -> set of paths, or None after MAX_PENDING
+        self._pending = {}
+        self._has_index = {} # Host folder of a drive -> whether it has an index, checked once
+        self._lock = threading.Lock()
+
+    def drive_index(self, letter, build=True):
+        """
+        Returns the open index of a drive, brought up to date for a query.
+        If the drive has never been indexed, starts building the index on the
+        I/O pool and returns None until it is ready.
+
+        :param build: False to only open the index, e.g. to update it by hand.
+
+        :raises FileSystemError: If the drive does not exist or cannot be indexed.
+        """
+        index = self.indexes.get(letter)
+        if index is None:
+            if not available():
+                raise FileSystemError("Error: Search is not available, this Python has no SQLite with FTS5.")
+            drive = self.fs_manager._get_drive(letter)
+            if drive is None:
+                raise FileSystemError(f"Error: Drive '{letter}' not found.")
+            if drive['type'] == 'image':
+                # Its directory tree is already an in-memory index of names, and there is no host tree to sweep
+                raise FileAccessError(f"Search: Drive {letter} is a disk image, which cannot be indexed.")
+            index = DriveIndex(letter, drive['path'], index_path(self.fs_manager.index_dir, drive['path']),
+                               self.fs_manager.kernel.aio_manager.submit, self.fs_manager._open_host)
+            try:
+                index.open()
+            except (OSError, sqlite3.Error) as e:
+                raise FileSystemError(f"Error: Cannot open the search index of drive {letter}: {e}") from e
+            with self._lock:
+                for rel_path in self._pending.pop(letter, None) or ():
+                    index.mark_changed(rel_path)
+                self.indexes[letter] = index
+        if build and not index.is_built:
+            future = index.start_build()
+            if future is not None:
+                print(f"Search: Building the index of drive {letter} in the background, "
+                      f"searching without it until it is ready.")
+                future.add_done_callback(lambda future: self._built(letter, future))
+            return None
+        if build:
+            index.refresh()
+        return index
+
+    def _built(self, letter, future):
+        """Reports the end of a background build, from the I/O pool."""
+        try:
+            stats = future.result()
+        except (FileSystemError, OSError) as e:
+            message = str(e)
+        else:
+            message = f"Search: Indexed {stats['added']:,} entries of drive {letter} in {stats['seconds']:.2f}s."
+        self.fs_manager._post_messages([message])
+
+    def scope(self, path='.'):
+        """
+        The index and the relative directory to search for a virtual directory path.
+
+        :return: (DriveIndex, or None if there is none to use yet (see walk),
+                  relative path of the directory, virtual path prefix of the results)
+        :raises FileSystemError: If the path is not a directory or search is unavailable.
+        """
+        host_path = self.fs_manager._resolve_directory(path)
+        letter, rel_path = self.fs_manager._locate(host_path)
+        if letter is None:
+            raise NotADirError(f"Error: '{path}' is not on a drive.")
+        if self.fs_manager._volume_of(host_path)[0] is not None:
+            return None, rel_path, letter + '/' # A disk image, never indexed
+        return self.drive_index(letter), rel_path, letter + '/'
+
+    def walk(self, path='.', sizes=True):
+        """
+        What find and grep search without an index: yields (virtual path,
+        is_dir, size, host path) of everything below a directory, depth first, reading
+        each directory with a single scandir pass as it goes. Yields None
+        after reading each directory, so that the caller can give the kernel
+        a turn. A build of the drive's index waits while the walk runs.
+
+        :param sizes: False leaves the size None, sparing a stat per file.
+        :raises FileSystemError: If the path is not a directory (before the first entry).
+        """
+        fs_manager = self.fs_manager
+        host_path = fs_manager._resolve_directory(path)
+        letter, rel_path = fs_manager._locate(host_path)
+        if letter is None:
+            raise NotADirError(f"Error: '{path}' is not on a drive.")
+        # Images and compressed drives need the FileSystemManager to tell what is in them
+        plain = (fs_manager._volume_of(host_path)[0] is None
+                 and (not fs_manager._compressed or fs_manager._compressed_of(host_path)[0] is None))
+
+        def read(host, virtual):
+            if not plain:
+                for name, is_dir, size, _, _ in fs_manager._scan(host, virtual):
+                    yield os.path.join(host, name), f"{virtual}/{name}", is_dir, size
+                return
+            with os.scandir(host) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                        size = entry.stat().st_size if sizes and not is_dir else None
+                    except OSError:
+                        continue # A broken symlink, or removed meanwhile
+                    yield entry.path, f"{virtual}/{entry.name}", is_dir, size
+
+        index = self.indexes.get(letter) # Being built, or the walk would not be needed
+
+        def entries():
+            if index is not None:
+                index.pause()
+            try:
+                stack = [(host_path, f"{letter}/{rel_path}".rstrip('/'))]
+                while stack:
+                    host, virtual = stack.pop()
+                    try:
+                        for host_entry, virtual_entry, is_dir, size in read(host, virtual):
+                            yield virtual_entry, is_dir, size, host_entry
+                            if is_dir:
+                                stack.append((host_entry, virtual_entry))
+                    except (FileSystemError, OSError):
+                        pass # Unreadable, or removed meanwhile
+                    yield None
+            finally:
+                if index is not None:
+                    index.resume()
+        return entries()
+
+    def notify(self, host_path):
+        """Called by the FileSystemManager when something at a host path changed. Thread-safe."""
+        letter, rel_path = self.fs_manager._locate(host_path)
+        if letter is None:
+            return
+        with self._lock:
+            index = self.indexes.get(letter)
+            if index is None:
+                drive = self.fs_manager.mounted_drives.get(letter)
+                if drive is None:
+                    return # Unmounted meanwhile
+                root = drive['path']
+                has_index = self._has_index.get(root)
+                if has_index is None:
+                    has_index = self._has_index[root] = os.path.exists(index_path(self.fs_manager.index_dir, root))
+                paths = self._pending.get(letter, ())
+                if not has_index or paths is None:
+                    return # Nothing to update, or too much to remember
+                if len(paths) >= MAX_PENDING:
+                    self._pending[letter] = None
+                else:
+                    self._pending.setdefault(letter, set()).add(rel_path)
+                return
+        index.mark_changed(rel_path)
+
+    def close_all(self):
+        """Closes every index, e.g. at shutdown, first recording the changes of this session."""
+        for letter, paths in self._pending.items():
+            drive = self.fs_manager.mounted_drives.get(letter)
+            if paths is None:
+                continue # Too many, left to the next session's first sweep
+            db_path = index_path(self.fs_manager.index_dir, drive['path']) if drive else None
+            if db_path is None or not os.path.exists(db_path):
+                continue
+            # Read through the same opener as a live index, e.g. to decompress the files of a compressed drive
+            index = DriveIndex(letter, drive['path'], db_path, None, self.fs_manager._open_host)
+            try:
+                index.open()
+                for rel_path in paths:
+                    index.mark_changed(rel_path)
+                index.close()
+            except (OSError, sqlite3.Error):
+                pass # The next session's sweep catches up
+        self._pending.clear()
+        for index in self.indexes.values():
+            index.close()
+        self.indexes.clear()
@@ -1,39 +1,120 @@
+import os
+import re
+import shutil
+import fnmatch
 import importlib
 from . import time_mgr
+from .syscalls import ReadInput, Sleep, Await, Yield
+from .cmd_registry import command, pipe_form
+from .filesys_mgr import FileSystemError, NotAFileError, split_wildcard
 
 # Command Handler Functions
-# Each function handles the logic for a specific command.
+# Each function handles the logic for a specific command and registers
+# itself with @command; the first line of its docstring is the description
+# shown by 'help'.
 
+def _run_job(kernel, name, job, is_background):
+    """
+    Runs a command's generator as a process. In the foreground the shell waits
+    for it silently; in the background it is announced so its PID can be used.
+    """
+    kernel.proc_manager.spawn(job, name, is_foreground=not is_background, quiet=not is_background)
+
+@command("help", alias="commands")
 def _cmd_help(args, kernel, io_manager):
     """Displays a list of available commands."""
     print("Available commands:")
     # sort commands alphabetically for readability
     for cmd_name in sorted(io_manager.commands.keys()):
         cmd_info = io_manager.commands[cmd_name]
-        desc = cmd_info.get('desc', 'No description available.')
-        alias = cmd_info.get('alias')
+        desc = cmd_info.desc or 'No description available.'
+        alias = cmd_info.alias
         if alias:
             print(f"  {cmd_name:<12} (alias: {alias:<10}) - {desc}")
         else:
             print(f"  {cmd_name:<12} {' ':<19} - {desc}")
 
+@command("list_tasks", alias="tasks", level=2, category="system")
 def _cmd_list_tasks(args, kernel, io_manager):
     """Lists all currently scheduled tasks."""
-    print(f"Scheduled tasks: {kernel.scheduler.get_scheduled_tasks()}")
+    import time
+    limit = 20
+    if args:
+        try:
+            limit = int(args[0])
+        except ValueError:
+            print("Usage: list_tasks [count]")
+            return
+    timers = kernel.scheduler.get_scheduled_tasks(limit)
+    if not timers:
+        print("No scheduled tasks.")
+        return
+    now = time.monotonic()
+    print(f"{'ID':>5}  {'DUE IN':>10}  {'EVERY':>10}  TASK")
+    for timer in timers:
+        every = f"{timer.interval:.1f}s" if timer.interval else '-'
+        print(f"{timer.timer_id:>5}  {max(0.0, timer.when - now):>9.1f}s  {every:>10}  {timer.name}")
+    remaining = len(kernel.scheduler) - len(timers)
+    if remaining > 0:
+        print(f"... and {remaining} more.")
+
+@command("schedule", alias="at", level=2, category="system")
+def _cmd_schedule(args, kernel, io_manager):
+    """Runs a command after a delay, or repeatedly with /every."""
+    periodic = bool(args) and args[0].lower() == '/every'
+    if periodic:
+        args = args[1:]
+    if len(args) < 2:
+        print("Usage: schedule [/every] <seconds> <command ...>")
+        return
+    try:
+        seconds = float(args[0])
+    except ValueError:
+        print(f"Error: '{args[0]}' is not a valid number.")
+        return
+    if periodic and seconds <= 0:
+        print("Error: The interval must be greater than zero.")
+        return
+
+    command_line = " ".join(args[1:])
+    def task():
+        io_manager.handle_input(command_line)
+    timer = kernel.scheduler.call_later(seconds, task, seconds if periodic else None, command_line)
+    print(f"Scheduled task {timer.timer_id}: '{command_line}'")
 
+@command("unschedule", alias="cancel", level=2, category="system")
+def _cmd_unschedule(args, kernel, io_manager):
+    """Cancels a scheduled task."""
+    if not args:
+        print("Usage: unschedule <task_id>")
+        return
+    try:
+        timer_id = int(args[0])
+    except ValueError:
+        print(f"Error: '{args[0]}' is not a valid task ID.")
+        return
+    if kernel.scheduler.cancel(timer_id):
+        print(f"Task {timer_id} cancelled.")
+    else:
+        print(f"Error: No scheduled task with ID {timer_id}.")
+
+@command("exit", alias="quit")
 def _cmd_exit(args, kernel, io_manager):
     """Exits the current session or application."""
     print("Shutting down aPEOS-I...")
     kernel.running = False
 
+@command("time", alias="clock", category="system")
 def _cmd_time(args, kernel, io_manager):
     """Displays the current system time."""
     print(f"Current time: {time_mgr.TIME_HH_MM()}")
 
+@command("date", alias="calendar", category="system")
 def _cmd_date(args, kernel, io_manager):
     """Displays the current system date."""
     print(f"Current date: {time_mgr.TIME_DATE_DMY()}")
 
+@command("echo", alias="print")
 def _cmd_echo(args, kernel, io_manager):
     """Outputs the provided text to the console."""
     if args:
@@ -42,33 +123,43 @@ def _cmd_echo(args, kernel, io_manager):
         # To match standard 'echo' behavior, printing a blank line.
         print()
 
-def _cmd_sleep(args, kernel, io_manager):
+@command("sleep", alias="delay", level=2, background=True)
+def _cmd_sleep(args, kernel, io_manager, is_background=False):
     """Pauses execution for a specified number of seconds."""
     if not args:
         print("Usage: sleep <seconds>")
         return
     try:
         duration_sec = float(args[0])
-        print(f"Sleeping for {duration_sec} seconds...")
-        time_mgr.DELAY(duration_sec * 1000)
-        print("Awake.")
     except ValueError:
         print(f"Error: '{args[0]}' is not a valid number.")
+        return
 
+    def sleeper():
+        # Sleeping is a syscall, so the rest of the system keeps running
+        print(f"Sleeping for {duration_sec} seconds...")
+        yield Sleep(duration_sec * 1000)
+        print("Awake.")
+    _run_job(kernel, "sleep", sleeper(), is_background)
+
+@command("logtime", alias="logclock", category="system")
 def _cmd_logtime(args, kernel, io_manager):
     """Logs the current time to the system log."""
     # In a real system, this would write to a file.
     # For now, we'll print to the console.
     print(f"LOG: {time_mgr.TIME_FULL_DMY()}")
 
+@command("logdate", alias="logcalendar", category="system")
 def _cmd_logdate(args, kernel, io_manager):
     """Logs the current date to the system log."""
     print(f"LOG: {time_mgr.TIME_DATE_DMY()}")
 
+@command("version", alias="ver", category="system")
 def _cmd_version(args, kernel, io_manager):
     """Displays the current system version."""
     print(f"aPEOS-I Version: {kernel.apeos_version}")
 
+@command("fetchbanana", alias="getbanana", level=5, category="fun")
 def _cmd_fetchbanana(args, kernel, io_manager):
     """Fetches system information alongside a banana ASCII art."""
     banana_art = """
@@ -115,60 +206,356 @@ def _cmd_fetchbanana(args, kernel, io_manager):
     # Re-use the sysinfo logic
     _cmd_sysinfo(args, kernel, io_manager)
 
+@command("cmd_info", alias="commandinfo", level=2)
 def _cmd_cmd_info(args, kernel, io_manager):
     """Provides detailed information about a specific command."""
     if not args:
         print("Usage: cmd_info <command_name>")
         return
     cmd_to_find = args[0].lower()
-    if cmd_to_find in io_manager.commands:
-        info = io_manager.commands[cmd_to_find]
-        print(f"Info for command '{cmd_to_find}':")
-        print(f"  Description: {info.get('desc', 'N/A')}")
-        print(f"  Category:    {info.get('category', 'N/A')}")
-        print(f"  Alias:       {info.get('alias', 'N/A')}")
-        print(f"  Auth Level:  {info.get('level', 'N/A')}")
+    info = io_manager.lookup.get(cmd_to_find)
+    if info:
+        print(f"Info for command '{info.name}':")
+        print(f"  Description: {info.desc or 'N/A'}")
+        print(f"  Category:    {info.category or 'N/A'}")
+        print(f"  Alias:       {info.alias or 'N/A'}")
+        print(f"  Auth Level:  {info.level}")
     else:
         print(f"Command '{cmd_to_find}' not found.")
 
+@command("sysinfo", alias="systeminfo", category="system")
 def _cmd_sysinfo(args, kernel, io_manager):
     """Displays system information including OS name and version."""
     print("--- System Information ---")
     print(f"aPEOS-I Version: {kernel.apeos_version}")
     print(f"Base OS:         {kernel.os_name}")
     print(f"Base OS Version: {kernel.os_version}")
+    drives = kernel.fs_manager.drive_usage()
+    if drives:
+        print(f"{'Drive':<6} {'Type':<10} {'Used bytes':>16} {'Files':>10} {'Free bytes':>18}")
+    unmeasured = False
+    for drive in drives:
+        if drive['used'] is None:
+            unmeasured = True
+            used, files = '-', '-'
+        else:
+            used, files = f"{drive['used']:,}", f"{drive['files']:,}"
+        free = '-' if drive['free'] is None else f"{drive['free']:,}"
+        print(f"{drive['letter']:<6} {drive['type']:<10} {used:>16} {files:>10} {free:>18}")
+    if unmeasured:
+        print("(Used bytes show after a 'du' of the whole drive, e.g. 'du A:/', until something on it changes.)")
     print("--------------------------")
 
-def _cmd_dir(args, kernel, io_manager):
-    """Lists the contents of a directory."""
+@command("boottime", alias="boot", category="system")
+def _cmd_boottime(args, kernel, io_manager):
+    """Shows how long each phase of the boot took, up to the first prompt."""
+    print("--- Boot Time ---")
+    print(kernel.boot_timer.report())
+    print("-----------------")
+
+@command("mount", alias="attach", level=3, category="filesystem")
+def _cmd_mount(args, kernel, io_manager):
+    """Lists the drives, or mounts one. 'mount B: <host_dir or .img>' attaches a host directory or disk image as a new drive."""
+    fs_manager = kernel.fs_manager
+    if not args:
+        print(f"{'Drive':<6} {'Status':<10} {'Type':<10} {'Label':<14} Host path")
+        for drive in fs_manager.list_drives():
+            status = "mounted" if drive['mounted'] else "available"
+            print(f"{drive['letter']:<6} {status:<10} {drive['type'] or '':<10} {drive['label'] or '':<14} {drive['path']}")
+        return
+    host_path = " ".join(args[1:]) if len(args) > 1 else None
+    result = fs_manager.mount(args[0], host_path)
+    if result:
+        print(result)
+
+@command("unmount", alias="detach", level=3, category="filesystem")
+def _cmd_unmount(args, kernel, io_manager):
+    """Unmounts a drive. A drive attached from a host path with 'mount' is forgotten, the others can be mounted again."""
+    if not args:
+        print("Usage: unmount <drive:>")
+        return
+    result = kernel.fs_manager.unmount(args[0])
+    if result:
+        print(result)
+    else:
+        print(f"Drive '{args[0].upper()}' unmounted.")
+
+@command("fscache", alias="dcache", level=2, category="filesystem")
+def _cmd_fscache(args, kernel, io_manager):
+    """Shows the file system's caches and their hit rates. 'fscache clear' empties them."""
+    usage = "Usage: fscache [clear | /buffers:<MB>]"
+    fs_manager = kernel.fs_manager
+    switches, rest = _parse_switches(args, {'buffers'})
+    if [arg.lower() for arg in rest] == ['clear'] and not switches:
+        fs_manager.clear_caches()
+        print("File system caches cleared.")
+        return
+    if rest or switches.get('buffers') is True:
+        print(usage)
+        return
+    if switches:
+        try:
+            budget = int(float(switches['buffers']) * 1024 * 1024)
+        except ValueError:
+            print(usage)
+            return
+        fs_manager.buffers.set_budget(max(budget, 0))
+    stats = fs_manager.cache_stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = f"{stats['hits'] / lookups:.1%}" if lookups else 'n/a'
+    reads = stats['buffer_hits'] + stats['buffer_misses']
+    read_rate = f"{stats['buffer_hits'] / reads:.1%}" if reads else 'n/a'
+    print("--- File System Caches ---")
+    print(f"Resolved paths:    {stats['paths']:,} of {stats['paths_max']:,}")
+    print(f"Directory entries: {stats['entries']:,} of {stats['entries_max']:,}")
+    print(f"Entry lookups:     {lookups:,} ({stats['hits']:,} hits, {stats['misses']:,} misses, {hit_rate} hit rate)")
+    print(f"File buffers:      {stats['buffers']:,} files, {stats['buffer_bytes'] / 1024:,.0f} of "
+          f"{stats['buffer_budget'] / 1024:,.0f} KB, {stats['buffer_dirty']:,} not yet written back")
+    print(f"File reads:        {reads:,} ({stats['buffer_hits']:,} from buffers, {read_rate} hit rate), "
+          f"{stats['written_back']:,} files written back")
+    print(f"Subtree sizes:     {stats['usage_dirs']:,} directories measured by 'du'")
+    print("--------------------------")
+
+@command("sync", alias="flush", category="filesystem", background=True)
+def _cmd_sync(args, kernel, io_manager, is_background=False):
+    """Writes the changes waiting in the file buffers to disk."""
+    if args:
+        print("Usage: sync")
+        return
+    future = kernel.fs_manager.sync_async()
+
+    def job():
+        written, errors = yield Await(future)
+        for message in errors:
+            print(message)
+        print(f"{written:,} file(s) written back.")
+    _run_job(kernel, "sync", job(), is_background)
+
+@command("du", alias="diskusage", category="filesystem", background=True)
+def _cmd_du(args, kernel, io_manager, is_background=False):
+    """Shows how much the files below a directory take. 'du /?' shows how."""
+    usage = ("Usage: du [directory] [/d:<depth>] [/r]\n"
+             "  /d  Also show the subdirectories up to this many levels down (default 1).\n"
+             "  /r  Rescan every directory, e.g. after files were changed in place outside aPEOS-I.\n"
+             "      Without it, only directories whose modification time changed are rescanned.")
+    switches, rest = _parse_switches(args, {'d', 'r', '?'})
+    if '?' in switches or len(rest) > 1 or switches.get('d') is True:
+        print(usage)
+        return
+    try:
+        depth = int(switches.get('d', 1))
+    except ValueError:
+        print(usage)
+        return
+    future = kernel.fs_manager.disk_usage_async(rest[0] if rest else '.', max(depth, 0), 'r' in switches)
+
+    def job():
+        result = yield Await(future)
+        if isinstance(result, str):
+            print(result)
+            return
+        for path, level, totals in result:
+            print(f"{totals.bytes:>16,} {totals.files:>10,} file(s)  {path}")
+        totals = result[-1][2]
+        print(f"\n{totals.bytes:,} bytes in {totals.files:,} file(s) and {totals.dirs:,} dir(s)")
+    _run_job(kernel, "du", job(), is_background)
+
+# Sort keys of 'dir /o:<keys>'
+_DIR_SORT_KEYS = {
+    'n': lambda record: record.name.lower(),
+    'e': lambda record: os.path.splitext(record.name)[1].lower(),
+    's': lambda record: 0 if record.is_dir else record.size, # The host's size of a directory is its inode's
+    'd': lambda record: record.modified,
+    'g': lambda record: not record.is_dir, # Directories first
+}
+_DIR_USAGE = ("Usage: dir [path][pattern] [/p[:lines]] [/u] [/o:<keys>] [/a:d|-d]\n"
+              "  /p    Pause after every screenful.\n"
+              "  /u    Unsorted: show the entries as they are read, without waiting for the whole directory.\n"
+              "  /o    Sort by n (name), e (extension), s (size), d (date), g (directories first); '-' reverses the next key.\n"
+              "  /a:d  Only directories. /a:-d  Only files.\n"
+              "  A pattern like *.txt at the end of the path lists only the matching names.")
+
+@command("dir", alias="ls", category="filesystem", background=True)
+def _cmd_dir(args, kernel, io_manager, is_background=False):
+    """Lists the contents of a directory. 'dir /?' shows the paging, sorting and filter switches."""
+    options = _dir_options(args)
+    if options is None:
+        return
+    path, keep, order, page_lines = options
+    fs_manager = kernel.fs_manager
+    packed = fs_manager.is_compressed(path)
+    try:
+        if order is None:
+            records = fs_manager.scan_directory(path)
+        else:
+            # Listing a huge directory can take a while, so it runs on the I/O pool
+            future = fs_manager.scan_directory_async(path)
+    except FileSystemError as e:
+        print(e)
+        return
+
+    def job():
+        nonlocal records
+        try:
+            if order is not None:
+                records = _sort_records((yield Await(future)), order)
+            if keep is not None:
+                records = filter(keep, records)
+            lines = _listing_lines(records, kernel, packed)
+            if page_lines and not is_background:
+                yield from _print_paged(lines, page_lines)
+            else:
+                yield from _pump(lines, None)
+        except FileSystemError as e:
+            print(e)
+    _run_job(kernel, "dir", job(), is_background)
+
+@pipe_form("dir")
+def _dir_lines(args, kernel, io_manager, stdin):
+    """The listing of 'dir' as lines, for pipelines. Paging does not apply there."""
+    options = _dir_options(args)
+    if options is None:
+        return
+    path, keep, order, _ = options
+    try:
+        records = kernel.fs_manager.scan_directory(path)
+        if order is not None:
+            records = _sort_records(records, order)
+    except FileSystemError as e:
+        print(e)
+        return
+    if keep is not None:
+        records = filter(keep, records)
+    yield from _listing_lines(records, kernel, kernel.fs_manager.is_compressed(path))
+
+def _dir_options(args):
+    """
+    Parses the arguments of 'dir'. None after printing a diagnostic.
+
+    :return: (directory, filter function or None, sort order or None for unsorted, lines per page or 0)
+    """
+    switches, rest = _parse_switches(args, {'p', 'u', 'o', 'a', '?'})
+    if '?' in switches or len(rest) > 1:
+        print(_DIR_USAGE)
+        return None
+
+    path, pattern = split_wildcard(rest[0] if rest else '.')
+
+    attributes = switches.get('a', True)
+    if attributes is True:
+        want_dirs = None
+    elif attributes.lower() in ('d', '-d'):
+        want_dirs = attributes.lower() == 'd'
+    else:
+        print(_DIR_USAGE)
+        return None
+    if pattern and want_dirs is not None:
+        keep = lambda record: record.is_dir == want_dirs and pattern(record.name)
+    elif pattern:
+        keep = lambda record: pattern(record.name)
+    elif want_dirs is not None:
+        keep = lambda record: record.is_dir == want_dirs
+    else:
+        keep = None
+
+    order = None
+    if 'u' not in switches:
+        order = []
+        reverse = False
+        keys = switches.get('o', 'n')
+        for key in ('n' if keys is True else keys.lower()):
+            if key == '-':
+                reverse = True
+            elif key in _DIR_SORT_KEYS:
+                order.append((_DIR_SORT_KEYS[key], reverse))
+                reverse = False
+            else:
+                print(_DIR_USAGE)
+                return None
+
+    page_lines = 0
+    if 'p' in switches:
+        page_lines = switches['p']
+        if page_lines is True:
+            page_lines = shutil.get_terminal_size().lines - 1
+        else:
+            try:
+                page_lines = int(page_lines)
+            except ValueError:
+                page_lines = 0
+        if page_lines < 1:
+            print(_DIR_USAGE)
+            return None
+    return path, keep, order, page_lines
+
+def _sort_records(records, order):
+    """Sorts DirRecords by a list of (key function, reverse), the first key being the most significant."""
+    records = list(records)
+    if order[-1][0] is not _DIR_SORT_KEYS['n']:
+        records.sort(key=_DIR_SORT_KEYS['n']) # Entries that tie come in name order
+    # Sorts are stable, so sorting by the least significant key first gives the combined order
+    for key, reverse in reversed(order):
+        records.sort(key=key, reverse=reverse)
+    return records
+
+def _print_paged(lines, page_lines):
+    """Prints lines a screenful at a time, waiting for Enter in between. 'q' stops."""
+    shown = 0
+    for line in lines:
+        if shown == page_lines:
+            answer = yield ReadInput("-- More -- (Enter: next page, q: quit) ")
+            if answer.strip().lower() == 'q':
+                return
+            shown = 0
+        print(line, end='')
+        shown += 1
+
+def _listing_lines(records, kernel, packed=False):
+    """
+    Formats DirRecords as the lines of a directory listing, with totals at the end.
+
+    :param packed: The directory is on a compressed drive: also show the size each file takes on the host.
+    """
     from datetime import datetime
-    path_to_list = args[0] if args else '.'
-    contents = kernel.fs_manager.list_directory(path_to_list)
-    
-    if isinstance(contents, list):
-        dir_path = kernel.fs_manager.get_full_current_path()
-        print(f" Directory of {dir_path}\n")
-        if not contents:
-            print("File Not Found")
+    dir_path = kernel.fs_manager.get_full_current_path()
+    yield f" Directory of {dir_path}\n\n"
+    files = 0
+    dirs = 0
+    total_size = 0
+    total_stored = 0
+    # Formatting a timestamp is slow, and the entries of a directory tend to
+    # share the same few minutes
+    times = {}
+    for name, is_dir, size, modified, stored in records:
+        minute = int(modified // 60)
+        mod_time = times.get(minute)
+        if mod_time is None:
+            mod_time = times[minute] = datetime.fromtimestamp(minute * 60).strftime('%m/%d/%Y %I:%M %p')
+        if is_dir:
+            dirs += 1
+            if packed:
+                yield f"{mod_time:<18} {'<DIR>':<8} {'':>14} {'':>14} {name}\n"
+            else:
+                yield f"{mod_time:<18} {'<DIR>':<8} {'':>14} {name}\n"
         else:
-            files = 0
-            dirs = 0
-            total_size = 0
-            for item in sorted(contents, key=lambda x: x['name']):
-                mod_time = datetime.fromtimestamp(item['modified']).strftime('%m/%d/%Y %I:%M %p')
-                size_str = f"{item['size']:,}" if item['type'] != '<DIR>' else ''
-                print(f"{mod_time:<18} {item['type']:<8} {size_str:>14} {item['name']}")
-                if item['type'] == '<DIR>':
-                    dirs += 1
-                else:
-                    files += 1
-                    total_size += item['size']
-            print(f"\n{files:16} File(s) {total_size:14,} bytes")
-            print(f"{dirs:16} Dir(s)")
+            files += 1
+            total_size += size
+            if packed:
+                stored = size if stored is None else stored
+                total_stored += stored
+                yield f"{mod_time:<18} {'':<8} {size:>14,} {stored:>14,} {name}\n"
+            else:
+                yield f"{mod_time:<18} {'':<8} {size:>14,} {name}\n"
+    if not files and not dirs:
+        yield "File Not Found\n"
     else:
-        # An error message was returned
-        print(contents)
+        yield f"\n{files:16} File(s) {total_size:14,} bytes\n"
+        if packed:
+            ratio = f", {total_size / total_stored:.2f}:1" if total_stored else ""
+            yield f"{'':16}         {total_stored:14,} bytes stored{ratio}\n"
+        yield f"{dirs:16} Dir(s)\n"
 
+@command("cd", alias="chdir", category="filesystem")
 def _cmd_cd(args, kernel, io_manager):
     """Changes the current working directory."""
     if not args:
@@ -180,6 +567,7 @@ def _cmd_cd(args, kernel, io_manager):
     if result: # An error message was returned
         print(result)
 
+@command("md", alias="mkdir", level=2, category="filesystem")
 def _cmd_md(args, kernel, io_manager):
     """Creates a directory."""
     if not args:
@@ -189,6 +577,7 @@ def _cmd_md(args, kernel, io_manager):
     if result:
         print(result)
 
+@command("rd", alias="rmdir", level=2, category="filesystem")
 def _cmd_rd(args, kernel, io_manager):
     """Removes an empty directory."""
     if not args:
@@ -198,54 +587,725 @@ def _cmd_rd(args, kernel, io_manager):
     if result:
         print(result)
 
-def _cmd_type(args, kernel, io_manager):
+@command("type", alias="cat", category="filesystem", stream=True)
+def _cmd_type(args, kernel, io_manager, stdin):
     """Displays the contents of a text file."""
     if not args:
+        if stdin is not None:
+            yield from stdin # 'cat' in the middle of a pipeline
+            return
         print("Usage: type <filename>")
         return
-    
-    content = kernel.fs_manager.read_file(args[0])
-    
-    # read_file returns the content on success and an error string on failure.
-    # We can check if the return value starts with "Error:" to distinguish.
-    if isinstance(content, str) and content.startswith("Error:"):
-        print(content)
-    else:
-        # To avoid printing a trailing newline if the file doesn't have one,
-        # we use end=''.
-        print(content, end='')
+    # Paged through a file handle, so a huge file never has to fit in memory
+    try:
+        yield from kernel.fs_manager.read_chunks(args[0])
+    except FileSystemError as e:
+        print(e)
 
-def _cmd_delete(args, kernel, io_manager):
+@command("delete", alias="del", level=2, category="filesystem", background=True)
+def _cmd_delete(args, kernel, io_manager, is_background=False):
     """Moves a file or directory to the trashbin."""
     if not args:
         print("Usage: delete <file_or_directory>")
         return
     path = args[0]
-    result = kernel.fs_manager.move_to_trash(path)
-    if result:
-        print(result)
+    # Moving across devices copies everything, so it runs on the I/O pool
+    future = kernel.fs_manager.move_to_trash_async(path)
+
+    def job():
+        result = yield Await(future)
+        if result:
+            print(result)
+    _run_job(kernel, "delete", job(), is_background)
+
+@command("trash", alias="recycle", level=2, category="filesystem", background=True)
+def _cmd_trash(args, kernel, io_manager, is_background=False):
+    """Lists the trashbin, restores items from it and purges them. 'trash /?' shows how."""
+    from datetime import datetime
+    usage = ("Usage: trash [list]\n"
+             "       trash restore <id> [path]    Puts an item back where it was deleted from, or at path.\n"
+             "       trash purge <id ...> | /all  Deletes items for good, in the background.\n"
+             "       trash quota [/size:<MB>] [/age:<days>]")
+    fs_manager = kernel.fs_manager
+    trash = fs_manager.trash
+    if trash is None:
+        print("Error: Trashbin is not configured.")
+        return
+    if not trash.loading.done():
+        # Read on the I/O pool; run the command once it is
+        def wait():
+            try:
+                yield Await(trash.loading)
+            except OSError as e:
+                print(f"Error: Could not open the trashbin: {e}")
+                return
+            _cmd_trash(args, kernel, io_manager, is_background)
+        _run_job(kernel, "trash", wait(), is_background)
+        return
+    if trash.loading.exception() is not None:
+        print(f"Error: Could not open the trashbin: {trash.loading.exception()}")
+        return
+    action = args[0].lower() if args else 'list'
+    rest = args[1:]
 
-def _cmd_force_dlt(args, kernel, io_manager):
+    if action == 'list' and not rest:
+        entries = trash.list()
+        if not entries:
+            print("The trash is empty.")
+            return
+        print(f"{'ID':>6}  {'Deleted':<19} {'Size':>14}  Original path")
+        for entry in entries:
+            deleted = datetime.fromtimestamp(entry.deleted).strftime('%m/%d/%Y %I:%M %p')
+            origin = entry.origin or f"(unknown) {entry.name}"
+            print(f"{entry.id:>6}  {deleted:<19} {entry.size:>14,}  {origin}{'/' if entry.is_dir else ''}")
+        print(f"\n{len(entries):,} item(s), {trash.total_size:,} bytes")
+    elif action == 'restore' and 1 <= len(rest) <= 2 and rest[0].isdigit():
+        entry_id = int(rest[0])
+        future = fs_manager.restore_from_trash_async(entry_id, rest[1] if len(rest) > 1 else None)
+
+        def job():
+            result = yield Await(future)
+            print(result or f"Item {entry_id} restored.")
+        _run_job(kernel, "trash restore", job(), is_background)
+    elif action == 'purge' and rest:
+        if rest == ['/all']:
+            entry_ids = [entry.id for entry in trash.list()]
+        elif all(arg.isdigit() for arg in rest):
+            entry_ids = [int(arg) for arg in rest]
+        else:
+            print(usage)
+            return
+        count, size = trash.purge(entry_ids)
+        if count < len(entry_ids) and rest != ['/all']:
+            print("Some of those items are not in the trash.")
+        print(f"Purging {count:,} item(s), {size:,} bytes, in the background.")
+    elif action == 'quota':
+        switches, extra = _parse_switches(rest, {'size', 'age'})
+        if extra or any(value is True for value in switches.values()):
+            print(usage)
+            return
+        try:
+            max_bytes = int(float(switches['size']) * 1024 * 1024) if 'size' in switches else None
+            max_age = float(switches['age']) * 24 * 3600 if 'age' in switches else None
+        except ValueError:
+            print(usage)
+            return
+        if any(value is not None and value <= 0 for value in (max_bytes, max_age)):
+            print(usage)
+            return
+        if switches:
+            count, size = trash.set_quotas(max_bytes, max_age)
+            if count:
+                print(f"Purging {count:,} item(s), {size:,} bytes, that exceed the new quotas.")
+        print(f"Trash quotas: {trash.max_bytes / (1024 * 1024):,.0f} MB, items kept {trash.max_age / (24 * 3600):g} days.")
+    else:
+        print(usage)
+
+@command("force_dlt", alias="erase", level=3, category="filesystem", background=True)
+def _cmd_force_dlt(args, kernel, io_manager, is_background=False):
     """Permanently deletes a file or directory."""
     if not args:
         print("Usage: force_dlt <file_or_directory>")
         return
     path = args[0]
-    result = kernel.fs_manager.force_delete(path)
-    if result:
-        print(result)
+    # Deleting a large tree can take a while, so it runs on the I/O pool
+    future = kernel.fs_manager.force_delete_async(path)
+
+    def job():
+        result = yield Await(future)
+        if result:
+            print(result)
+    _run_job(kernel, "force_dlt", job(), is_background)
+
+@command("copy", alias="cp", level=2, category="filesystem", background=True)
+def _cmd_copy(args, kernel, io_manager, is_background=False):
+    """Copies files, or whole directories with /s. 'copy /?' shows how."""
+    usage = ("Usage: copy [/s] [/y] <source ...> <destination>\n"
+             "  source       A file or directory; wildcards like *.txt pick files from one directory.\n"
+             "  destination  A directory to copy into, or for a single source, the name of the copy.\n"
+             "  /s           Copy directories too, with everything below them.\n"
+             "  /y           Overwrite files that exist instead of skipping them.")
+    _transfer(args, kernel, is_background, usage, moving=False)
+
+@command("move", alias="mv", level=2, category="filesystem", background=True)
+def _cmd_move(args, kernel, io_manager, is_background=False):
+    """Moves or renames files and directories. 'move /?' shows how."""
+    usage = ("Usage: move [/y] <source ...> <destination>\n"
+             "  source       A file or directory; wildcards like *.txt pick from one directory.\n"
+             "  destination  A directory to move into, or for a single source, its new name.\n"
+             "  /y           Replace files that exist instead of skipping them.")
+    _transfer(args, kernel, is_background, usage, moving=True)
+
+def _transfer(args, kernel, is_background, usage, moving):
+    """Runs a copy or move as a job. In the foreground it reports its progress once a second."""
+    from .copy_mgr import CopyProgress
+    switches, rest = _parse_switches(args, {'y', '?'} if moving else {'s', 'y', '?'})
+    if '?' in switches or len(rest) < 2:
+        print(usage)
+        return
+    progress = CopyProgress()
+    # Posted to the kernel loop, so the workers never wait on the console
+    report = None if is_background else lambda line: kernel.post_event(lambda: print(line))
+    fs_manager = kernel.fs_manager
+    if moving:
+        future = fs_manager.move_async(rest[:-1], rest[-1], 'y' in switches, progress, report)
+    else:
+        future = fs_manager.copy_async(rest[:-1], rest[-1], 's' in switches, 'y' in switches, progress, report)
+
+    def job():
+        result = yield Await(future)
+        if result:
+            print(result)
+        if progress.skipped:
+            print(f"{len(progress.skipped):,} file(s) skipped because they exist. Use /y to overwrite them.")
+        if result and not progress.files_done:
+            return
+        if moving:
+            print(f"{progress.files_done:>9,} file(s) moved.")
+        else:
+            print(f"{progress.files_done:>9,} file(s) copied, {progress.bytes_done:,} bytes in {progress.seconds:.2f}s.")
+    _run_job(kernel, "move" if moving else "copy", job(), is_background)
+
+@command("wait", alias="waitpid", category="system")
+def _cmd_wait(args, kernel, io_manager):
+    """Waits for a process to finish and shows its exit code."""
+    if not args:
+        print("Usage: wait <pid>")
+        return
+    try:
+        pid = int(args[0])
+    except ValueError:
+        print(f"Error: '{args[0]}' is not a valid PID.")
+        return
+
+    proc_manager = kernel.proc_manager
+    def report(exit_code):
+        print(f"[{pid}] Exit code: {exit_code}")
+
+    if pid in proc_manager.processes:
+        # Bring the process to the foreground so the shell waits for it
+        proc_manager.set_foreground_process(pid)
+    if not proc_manager.wait(pid, report):
+        print(f"Error: No process with PID {pid}.")
+
+# Short labels for process states in 'ps' and 'top'
+_STATE_LABELS = {
+    'RUNNING': 'run',
+    'WAITING_FOR_INPUT': 'input',
+    'SLEEPING': 'sleep',
+    'WAITING_FOR_PROCESS': 'wait',
+    'WAITING_FOR_IO': 'io',
+}
+
+def _print_process_rows(kernel, processes, cpu_percent=None):
+    """Prints one accounting row per process; '+' marks the foreground process."""
+    print(f"{'PID':>5} {'NAME':<12} {'STATE':<6} {'LVL':>3} {'CPU(ms)':>9} {'%CPU':>5} "
+          f"{'STEPS':>9} {'AVG(us)':>8} {'MAX(us)':>8} {'INPUT(s)':>8}")
+    foreground_pid = kernel.proc_manager.foreground_pid
+    for p in processes:
+        pid = f"{'+' if p.pid == foreground_pid else ''}{p.pid}"
+        percent = f"{cpu_percent[p.pid]:.1f}" if cpu_percent is not None else '-'
+        print(f"{pid:>5} {p.name[:12]:<12} {_STATE_LABELS.get(p.state.name, '?'):<6} {p.level:>3} "
+              f"{p.cpu_ns / 1e6:>9.1f} {percent:>5} {p.steps:>9} {p.avg_step_ns() / 1e3:>8.1f} "
+              f"{p.max_step_ns / 1e3:>8.1f} {p.input_wait_ns / 1e9:>8.1f}")
+
+@command("ps", alias="tasklist", category="system")
+def _cmd_ps(args, kernel, io_manager):
+    """Lists processes with their CPU accounting."""
+    processes = sorted(kernel.proc_manager.get_running_processes(), key=lambda p: p.pid)
+    if not processes:
+        print("No processes running.")
+        return
+    _print_process_rows(kernel, processes)
+
+@command("top", alias="monitor", level=2, category="system", background=True)
+def _cmd_top(args, kernel, io_manager, is_background=False):
+    """Shows the processes using the most kernel time, refreshed periodically."""
+    try:
+        count = int(args[0]) if args else 5
+        interval = float(args[1]) if len(args) > 1 else 1.0
+    except ValueError:
+        print("Usage: top [count] [seconds]")
+        return
+    if count < 1 or interval <= 0:
+        print("Usage: top [count] [seconds]")
+        return
+
+    def job():
+        import time
+        proc_manager = kernel.proc_manager
+        # Processes are told apart by PID and start time, since PIDs are recycled
+        previous = {(p.pid, p.started_ns): p.cpu_ns for p in proc_manager.get_running_processes()}
+        for sample in range(count):
+            started = time.perf_counter_ns()
+            yield Sleep(interval * 1000)
+            elapsed = time.perf_counter_ns() - started
+            processes = proc_manager.get_running_processes()
+            cpu_percent = {}
+            for p in processes:
+                delta = p.cpu_ns - previous.get((p.pid, p.started_ns), 0)
+                cpu_percent[p.pid] = 100.0 * delta / elapsed
+            previous = {(p.pid, p.started_ns): p.cpu_ns for p in processes}
+            processes.sort(key=lambda p: cpu_percent[p.pid], reverse=True)
+            print(f"\ntop - {time_mgr.TIME_FULL_DMY()}  {len(processes)} processes, "
+                  f"{sum(cpu_percent.values()):.1f}% of the kernel thread used ({sample + 1}/{count})")
+            _print_process_rows(kernel, processes[:15], cpu_percent)
+    _run_job(kernel, "top", job(), is_background)
+
+@command("profile", alias="prof", level=3)
+def _cmd_profile(args, kernel, io_manager):
+    """Runs a command under cProfile and prints the functions that took the most time."""
+    import cProfile
+    import pstats
+    if not args:
+        print("Usage: profile <command> [args ...]")
+        return
+    command_name = args[0].lower()
+    cmd = io_manager.lookup.get(command_name)
+    if cmd is None or cmd.name == 'profile':
+        print(f"Unknown command: '{command_name}'.")
+        return
+
+    proc_manager = kernel.proc_manager
+    profiler = cProfile.Profile()
+
+    def report(exit_code=None):
+        profiler.disable()
+        print(f"\n--- Profile of '{' '.join(args)}' (top 15 by cumulative time) ---")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+
+    foreground_before = proc_manager.foreground_pid
+    profiler.enable()
+    run_command(cmd, args[1:], kernel, io_manager)
+    foreground_pid = proc_manager.foreground_pid
+    if foreground_pid is not None and foreground_pid != foreground_before:
+        # The command went on as a foreground process: keep profiling the
+        # kernel until it has finished, then report
+        proc_manager.wait(foreground_pid, report)
+    else:
+        report()
+
+@command("trace", alias="tracer", level=3)
+def _cmd_trace(args, kernel, io_manager):
+    """Controls the kernel tracer: on, off, status, clear or export to a Chrome trace file."""
+    tracer = kernel.tracer
+    action = args[0].lower() if args else 'status'
+    if action == 'on':
+        if len(args) > 1:
+            try:
+                tracer.set_capacity(int(args[1]))
+            except ValueError:
+                print(f"Error: '{args[1]}' is not a valid number of events.")
+                return
+        tracer.enable()
+        print(f"Tracing enabled (buffer of {tracer.events.maxlen:,} events).")
+    elif action == 'off':
+        tracer.disable()
+        print(f"Tracing disabled, {len(tracer.events):,} events recorded.")
+    elif action == 'clear':
+        tracer.clear()
+        print("Trace buffer cleared.")
+    elif action == 'status':
+        state = 'on' if tracer.enabled else 'off'
+        print(f"Tracing is {state}: {len(tracer.events):,}/{tracer.events.maxlen:,} events buffered.")
+    elif action == 'export':
+        if len(args) < 2:
+            print("Usage: trace export <file>")
+            return
+        result = kernel.fs_manager.write_file(args[1], tracer.export_chrome())
+        if result:
+            print(result)
+        else:
+            print(f"Exported {len(tracer.events):,} events to '{args[1]}' (Chrome trace format).")
+    else:
+        print("Usage: trace [on [events]|off|status|clear|export <file>]")
+
+# --- Pipeline filters ---
+# Filters read the lines of a file, or the output of the previous pipeline
+# stage, and yield their own output as they go.
+
+def _parse_switches(args, names):
+    """
+    Splits DOS-style switches like '/i' or '/n:20' from the other arguments.
+    Only the given switch names are recognized, so paths are never mistaken for switches.
+
+    :return: ({name: value or True}, remaining arguments)
+    """
+    switches = {}
+    rest = []
+    for arg in args:
+        name, _, value = arg[1:].partition(':')
+        if arg.startswith('/') and name.lower() in names:
+            switches[name.lower()] = value or True
+        else:
+            rest.append(arg)
+    return switches, rest
+
+def _lines(chunks):
+    """
+    Chunks of text, line by line, with an empty string after every chunk: not
+    a line, but a point where a filter that reads on without output yields ''
+    in turn, so the kernel gets a turn (see _pump).
+    """
+    for chunk in chunks:
+        yield from chunk.splitlines(True)
+        yield ''
+
+def _input_lines(files, kernel, stdin, usage):
+    """The input of a filter, line by line (see _lines): the named file if there is one, otherwise the pipe. None after printing a diagnostic."""
+    if files:
+        try:
+            chunks = kernel.fs_manager.read_chunks(files[0])
+        except FileSystemError as e:
+            print(e)
+            return None
+    elif stdin is None:
+        print(usage)
+        return None
+    else:
+        chunks = stdin
+    return _lines(chunks)
+
+def _line_count(switches, usage, default=10):
+    """The /n:<lines> switch of head and tail. None after printing a diagnostic."""
+    value = switches.get('n', default)
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        count = -1
+    if count < 0:
+        print(usage)
+        return None
+    return count
+
+@command("grep", alias="search", stream=True)
+def _cmd_grep(args, kernel, io_manager, stdin):
+    """Prints the lines matching a regular expression, from a file, a pipe, or every file below a directory."""
+    usage = "Usage: grep [/i] [/v] [/n] [/c] <pattern> [file | directory]"
+    switches, rest = _parse_switches(args, {'i', 'v', 'n', 'c'})
+    if not rest or len(rest) > 2:
+        print(usage)
+        return
+    try:
+        regex = re.compile(rest[0], re.IGNORECASE if 'i' in switches else 0)
+    except re.error as e:
+        print(f"Error: Invalid pattern '{rest[0]}': {e}")
+        return
+
+    if stdin is None:
+        # Without a pipe, a directory (the current one by default) is searched through the index
+        path = rest[1] if len(rest) > 1 else '.'
+        try:
+            chunks = kernel.fs_manager.read_chunks(path) if len(rest) > 1 else None
+        except NotAFileError:
+            chunks = None
+        except FileSystemError as e:
+            print(e)
+            return
+        if chunks is None:
+            yield from _grep_tree(rest[0], regex, switches, path, kernel)
+            return
+        lines = _lines(chunks)
+    else:
+        lines = _input_lines(rest[1:], kernel, stdin, usage)
+        if lines is None:
+            return
+    yield from _grep_lines(lines, regex, switches)
+
+def _grep_lines(lines, regex, switches, label=''):
+    """The output of grep for one input. label (e.g. 'A:/file.txt:') starts every line when searching many files."""
+    search = regex.search
+    invert = 'v' in switches
+    numbered = 'n' in switches
+    count_only = 'c' in switches
+    count = number = 0
+    for line in lines:
+        if not line:
+            yield '' # Matches may be far apart: give the kernel a turn meanwhile
+            continue
+        number += 1
+        if (search(line) is None) != invert:
+            continue
+        count += 1
+        if count_only:
+            continue
+        if not line.endswith('\n'):
+            line += '\n'
+        yield f"{label}{number}:{line}" if numbered else label + line
+    if count_only and (count or not label):
+        yield f"{label}{count}\n"
+
+_GREP_SLICE = 0.01 # Seconds grep reads through a tree before the kernel gets a turn
+
+def _grep_tree(pattern, regex, switches, path, kernel):
+    """
+    grep over every text file below a directory. The search index narrows
+    down the files to read; without one, every file is read and the binary
+    ones skipped.
+    """
+    import time
+    from itertools import chain
+    from .search_mgr import required_literals, MAX_TEXT_SIZE, _BINARY_PROBE
+    fs_manager = kernel.fs_manager
+    try:
+        index, rel_path, prefix = fs_manager.search.scope(path)
+        if index is not None:
+            # Inverted matches can be in any file
+            candidates = [(prefix + candidate, None) for candidate in index.text_files(
+                [] if 'v' in switches else required_literals(pattern), rel_path)]
+        else:
+            candidates = (entry and (entry[0], entry[3]) for entry in fs_manager.search.walk(path)
+                          if entry is None or (not entry[1] and entry[2] <= MAX_TEXT_SIZE))
+    except FileSystemError as e:
+        print(e)
+        return
+    # A turn per small file would cost more than reading it
+    turn = time.monotonic() + _GREP_SLICE
+    for candidate in candidates:
+        if candidate is None:
+            if time.monotonic() >= turn:
+                turn = time.monotonic() + _GREP_SLICE
+                yield '' # A directory was read, the kernel gets a turn
+            continue
+        file_path, host_path = candidate
+        try:
+            if host_path is None:
+                chunks = fs_manager.read_chunks(file_path)
+            else:
+                chunks = fs_manager._chunks(file_path, host_path) # Just found by the walk
+        except FileSystemError:
+            continue # Removed since it was indexed
+        if index is None:
+            try:
+                first = next(chunks, '')
+            except FileSystemError:
+                continue # Removed since it was found
+            if '\0' in first[:_BINARY_PROBE]:
+                chunks.close()
+                continue
+            chunks = chain([first], chunks)
+        for line in _grep_lines(_lines(chunks), regex, switches, file_path + ':'):
+            if line:
+                yield line
+            elif time.monotonic() >= turn:
+                turn = time.monotonic() + _GREP_SLICE
+                yield ''
+
+@command("find", alias="where", category="filesystem", stream=True)
+def _cmd_find(args, kernel, io_manager, stdin):
+    """Finds files and directories by name or pattern below a directory (the current one by default), using the search index."""
+    usage = "Usage: find [/a:d|-d] <name or pattern> [directory]"
+    switches, rest = _parse_switches(args, {'a'})
+    attributes = switches.get('a', True)
+    if not rest or len(rest) > 2 or (attributes is not True and attributes.lower() not in ('d', '-d')):
+        print(usage)
+        return
+    want_dirs = None if attributes is True else attributes.lower() == 'd'
+    pattern = rest[0]
+    if '*' not in pattern and '?' not in pattern:
+        pattern = f"*{pattern}*" # A plain name matches anywhere in a name
+    path = rest[1] if len(rest) > 1 else '.'
+    try:
+        index, rel_path, prefix = kernel.fs_manager.search.scope(path)
+        if index is not None:
+            for found, is_dir in index.find(pattern, rel_path, want_dirs):
+                yield f"{prefix}{found}{'/' if is_dir else ''}\n"
+            return
+        # No index yet: the directories are read as the search goes
+        match = re.compile(fnmatch.translate(pattern), re.IGNORECASE).match
+        for entry in kernel.fs_manager.search.walk(path, sizes=False):
+            if entry is None:
+                yield '' # The kernel gets a turn
+            elif (want_dirs is None or entry[1] == want_dirs) and match(entry[0].rpartition('/')[2]):
+                yield f"{entry[0]}{'/' if entry[1] else ''}\n"
+    except FileSystemError as e:
+        print(e)
+
+@command("index", level=2, category="filesystem", background=True)
+def _cmd_index(args, kernel, io_manager, is_background=False):
+    """Updates the search index of a drive used by find and grep. 'index /status' shows its state."""
+    from datetime import datetime
+    usage = "Usage: index [drive:] [/full | /rebuild | /status]"
+    switches, rest = _parse_switches(args, {'full', 'rebuild', 'status'})
+    fs_manager = kernel.fs_manager
+    letter = rest[0].upper() if rest else fs_manager.current_drive
+    if len(rest) > 1 or len(switches) > 1 or not letter or not re.fullmatch(r'[A-Z]:', letter):
+        print(usage)
+        return
+    try:
+        index = fs_manager.search.drive_index(letter, build=False)
+    except FileSystemError as e:
+        print(e)
+        return
+
+    if 'status' in switches:
+        status = index.status()
+        built = datetime.fromtimestamp(status['built']).strftime('%m/%d/%Y %I:%M %p') if status['built'] else 'never'
+        print(f"--- Search Index of {letter} ---")
+        print(f"Entries:      {status['files']:,} files, {status['dirs']:,} directories")
+        print(f"Searchable:   {status['text_files']:,} text files")
+        print(f"Stale rows:   {status['stale_content']:,} (cleared when they outnumber the others, or by 'index /rebuild')")
+        print(f"Last update:  {built}{' (updating now)' if status['sweeping'] else ''}")
+        print(f"Size:         {status['bytes'] / 1024:,.0f} KB")
+        print("-" * (23 + len(letter)))
+        return
+
+    if 'rebuild' in switches or not index.is_built:
+        work = lambda: index.build(rebuild=True)
+    else:
+        work = lambda: index.sweep(full='full' in switches)
+
+    def job():
+        try:
+            stats = yield Await(kernel.aio_manager.submit(work))
+        except FileSystemError as e:
+            print(e)
+            return
+        print(f"Search: Index of {letter} updated in {stats['seconds']:.2f}s: {stats['added']:,} added, "
+              f"{stats['updated']:,} updated, {stats['removed']:,} removed.")
+    _run_job(kernel, "index", job(), is_background)
+
+@command("head", stream=True)
+def _cmd_head(args, kernel, io_manager, stdin):
+    """Prints the first lines of a file or a pipe (10 unless /n:<lines> is given)."""
+    usage = "Usage: head [/n:<lines>] [file]"
+    switches, rest = _parse_switches(args, {'n'})
+    count = _line_count(switches, usage)
+    lines = None if count is None else _input_lines(rest, kernel, stdin, usage)
+    if lines is None or not count:
+        return
+    # Stops reading as soon as it has enough, the rest of the pipeline is never produced
+    for line in lines:
+        yield line
+        if line:
+            count -= 1
+            if not count:
+                return
+
+@command("tail", stream=True)
+def _cmd_tail(args, kernel, io_manager, stdin):
+    """Prints the last lines of a file or a pipe (10 unless /n:<lines> is given)."""
+    from collections import deque
+    usage = "Usage: tail [/n:<lines>] [file]"
+    switches, rest = _parse_switches(args, {'n'})
+    count = _line_count(switches, usage)
+    lines = None if count is None else _input_lines(rest, kernel, stdin, usage)
+    if lines is None:
+        return
+    # Only the last lines are ever kept, however long the input is
+    last = deque(maxlen=count)
+    for line in lines:
+        if line:
+            last.append(line)
+        else:
+            yield '' # Nothing to print until the end, but the kernel gets a turn
+    yield from last
+
+@command("wc", alias="count", stream=True)
+def _cmd_wc(args, kernel, io_manager, stdin):
+    """Counts the lines, words and characters of a file or a pipe."""
+    lines = _input_lines(args, kernel, stdin, "Usage: wc [file]")
+    if lines is None:
+        return
+    line_count = word_count = char_count = 0
+    for line in lines:
+        if not line:
+            yield '' # See _lines
+            continue
+        line_count += 1
+        word_count += len(line.split())
+        char_count += len(line)
+    name = f" {args[0]}" if args else ''
+    yield f"{line_count:>8} {word_count:>8} {char_count:>10}{name}\n"
+
+# --- Pipelines ---
+
+_PIPE_BUFFER = 64 * 1024 # Characters collected before they are written out and the kernel gets a turn
+
+def run_pipeline(stages, redirect, kernel, io_manager, is_background=False):
+    """
+    Runs commands connected by '|' as one process, optionally redirecting the output into a file.
+
+    Stages pass text along in chunks of whole lines. Every stage pulls from the
+    one before it only when it needs more, so data flows through in constant
+    memory whatever its size.
+
+    :param stages: A list of (Command, args) pairs.
+    :param redirect: None, or (path, append) for '>' and '>>'.
+    """
+    output = None
+    for cmd, args in stages:
+        output = _stage_output(cmd, args, kernel, io_manager, output)
+        if isinstance(output, str):
+            print(output)
+            return
+
+    sink = None
+    if redirect:
+        path, append = redirect
+        sink = kernel.fs_manager.open_for_write(path, append)
+        if isinstance(sink, str):
+            print(sink)
+            return
+    name = "|".join(cmd.name for cmd, _ in stages)
+    _run_job(kernel, name, _pump(output, sink), is_background)
+
+def _stage_output(cmd, args, kernel, io_manager, stdin):
+    """The output of one pipeline stage as an iterator of text, or an error message string."""
+    if cmd.stream:
+        return cmd.stream(args, kernel, io_manager, stdin)
+    if cmd.is_app or cmd.background:
+        return f"Error: '{cmd.name}' cannot be used in a pipeline."
+    return _captured_output(cmd, args, kernel, io_manager)
+
+def _captured_output(cmd, args, kernel, io_manager):
+    """Runs a handler that prints, and yields what it printed."""
+    import io
+    import contextlib
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        cmd.handler(args, kernel, io_manager)
+    yield buffer.getvalue()
+
+def _pump(output, sink):
+    """Moves the output of a pipeline to the console or a file, in bounded batches."""
+    write = sink.write if sink else lambda text: print(text, end='')
+    batch = []
+    size = 0
+    try:
+        for text in output:
+            if not text:
+                yield Yield() # The stage is busy, not done: other processes run meanwhile
+                continue
+            batch.append(text)
+            size += len(text)
+            if size >= _PIPE_BUFFER:
+                write(''.join(batch))
+                batch.clear()
+                size = 0
+                yield Yield() # Let input and other processes run between batches
+        write(''.join(batch))
+    finally:
+        if sink:
+            sink.close()
 
 def _launch_app(app_info, args, kernel, io_manager, is_background):
     """Dynamically imports and runs an application."""
-    module_name = app_info.get('app_module')
-    class_name = app_info.get('app_class')
+    module_name = app_info.app_module
+    class_name = app_info.app_class
 
     if not module_name or not class_name:
-        print(f"Error: Application '{app_info.get('command')}' is not configured correctly.")
-        print("Required fields 'app_module' and 'app_class' are missing in sys_cmd.csv.")
+        print(f"Error: Application '{app_info.name}' is not configured correctly.")
+        print("Required fields 'app_module' and 'app_class' are missing in sys_apps.csv.")
         return
 
     try:
+        is_foreground = not is_background
+        if app_info.exec_mode == 'worker':
+            # CPU-heavy apps run on a host worker process; the kernel only proxies their I/O
+            kernel.worker_pool.launch(module_name, class_name, args, app_info.name, is_foreground)
+            return
+
         # Dynamically import the module
         # The 'package' argument makes the import relative to the 'apeos.system2' package.
         # This allows Python to correctly find 'sysApp' from the 'sys' directory.
@@ -257,63 +1317,50 @@ def _launch_app(app_info, args, kernel, io_manager, is_background):
         app_instance = app_class(kernel, *args) # __init__
         
         # Create a process instead of running it directly
-        is_foreground = not is_background
-        kernel.proc_manager.create_process(app_instance, app_info['command'], is_foreground)
+        kernel.proc_manager.create_process(app_instance, app_info.name, is_foreground)
     except ImportError as e:
         print(f"Error: Could not find application module: {module_name}")
         print(f"Import Error: {e}")
     except (AttributeError, Exception) as e:
         print(f"Error launching application '{class_name}': {e}")
 
-# --- Command Dispatch Table ---
-# Maps command strings to their handler functions.
-
-_COMMAND_HANDLERS = {
-    "help": _cmd_help,
-    "list_tasks": _cmd_list_tasks,
-    "exit": _cmd_exit,
-    "time": _cmd_time,
-    "date": _cmd_date,
-    "echo": _cmd_echo,
-    "sleep": _cmd_sleep,
-    "logtime": _cmd_logtime,
-    "logdate": _cmd_logdate,
-    "version": _cmd_version,
-    "fetchbanana": _cmd_fetchbanana,
-    "cmd_info": _cmd_cmd_info,
-    "sysinfo": _cmd_sysinfo,
-    "dir": _cmd_dir,
-    "cd": _cmd_cd,
-    "md": _cmd_md,
-    "rd": _cmd_rd,
-    "type": _cmd_type,
-    "delete": _cmd_delete,
-    "force_dlt": _cmd_force_dlt,
-}
+@command("reload", alias="rehash", level=3, category="system")
+def _cmd_reload(args, kernel, io_manager):
+    """Reloads the command handlers and the app list without restarting."""
+    try:
+        io_manager.registry.reload()
+    except Exception as e:
+        print(f"Error: Could not reload the commands, keeping the old ones: {type(e).__name__}: {e}")
+        return
+    print(f"Command Manager: {len(io_manager.commands)} commands reloaded.")
 
 def execute_command(command, args, kernel, io_manager, is_background=False):
     """
     Executes a system command.
 
-    :param command: The command to execute.
+    :param command: The command to execute, or one of its aliases.
     :param args: A list of arguments for the command.
     :param kernel: The kernel instance, for accessing system components.
     :param io_manager: The IOManager, for accessing command data.
     :param is_background: True if the command should run in the background.
     """
-    handler = _COMMAND_HANDLERS.get(command)
-    if handler:
-        # It's a built-in system command
-        handler(args, kernel, io_manager)
+    cmd = io_manager.lookup.get(command)
+    if cmd is None:
+        print(f"Error: Command '{command}' not recognized. Type 'help' for a list of commands.")
         return
+    run_command(cmd, args, kernel, io_manager, is_background)
 
-    # If not a built-in, check if it's an application
-    cmd_info = io_manager.commands.get(command)
-    if cmd_info and cmd_info.get('category') == 'app':
-        if is_background and cmd_info.get('allow_bg', 'false').lower() != 'true':
-            print(f"Error: Application '{command}' cannot be run in the background.")
+def run_command(cmd, args, kernel, io_manager, is_background=False):
+    """Runs a command that was already looked up in the registry."""
+    if cmd.is_app:
+        if is_background and not cmd.background:
+            print(f"Error: Application '{cmd.name}' cannot be run in the background.")
             return
-        _launch_app(cmd_info, args, kernel, io_manager, is_background)
+        _launch_app(cmd, args, kernel, io_manager, is_background)
+    elif cmd.handler is None:
+        # Only has a pipeline form: a pipeline of one, printing to the console
+        run_pipeline([(cmd, args)], None, kernel, io_manager, is_background)
+    elif cmd.background:
+        cmd.handler(args, kernel, io_manager, is_background)
     else:
-        # If it's neither a built-in nor a known application, then it's an error.
-        print(f"Error: Command '{command}' not recognized. Type 'help' for a list of commands.")
+        cmd.handler(args, kernel, io_manager)
@@ -0,0 +1,50 @@
+# System call requests for aPEOS-I processes.
+#
+# A process is a generator. Yielding nothing (a bare 'yield') just lets other
+# processes run. Yielding one of the objects below asks the kernel for
+# something: the process is parked until the request can be satisfied, and the
+# result comes back as the value of the 'yield' expression, e.g.
+#
+#     line = yield ReadInput()
+#     yield Sleep(500)
+#     exit_code = yield WaitPid(pid)
+#     result = yield Await(future)
+
+class Syscall:
+    """Base class of every request a process can yield to the kernel."""
+    __slots__ = ()
+
+class Yield(Syscall):
+    """Gives up the rest of the time slice without being demoted. Returns None."""
+    __slots__ = ()
+
+class ReadInput(Syscall):
+    """Waits for the next line typed while the process is in the foreground. Returns the line."""
+    __slots__ = ('prompt',)
+
+    def __init__(self, prompt=""):
+        self.prompt = prompt
+
+class Sleep(Syscall):
+    """Parks the process for the given number of milliseconds. Returns None."""
+    __slots__ = ('ms',)
+
+    def __init__(self, ms):
+        self.ms = ms
+
+class WaitPid(Syscall):
+    """Waits for another process to finish. Returns its exit code, or None if there is no such process."""
+    __slots__ = ('pid',)
+
+    def __init__(self, pid):
+        self.pid = pid
+
+class Await(Syscall):
+    """
+    Waits for a concurrent.futures.Future, e.g. work running on another thread
+    or host process. Returns its result, or raises its exception in the process.
+    """
+    __slots__ = ('future',)
+
+    def __init__(self, future):
+        self.future = future
@@ -33,3 +33,33 @@ def DELAY(milliseconds):
     """Pause execution for a given number of milliseconds."""
     time.sleep(milliseconds / 1000)
 
+
+class BootTimer:
+    """Measures how long every phase of the boot takes, up to the first prompt."""
+
+    def __init__(self):
+        self.start_ns = self._last_ns = time.perf_counter_ns()
+        self.phases = [] # (phase, duration_ns)
+        self.finished = False
+
+    def mark(self, phase):
+        """Ends the current phase. Ignored once the boot has finished."""
+        if self.finished:
+            return
+        now = time.perf_counter_ns()
+        self.phases.append((phase, now - self._last_ns))
+        self._last_ns = now
+
+    def finish(self, phase="first prompt"):
+        """Ends the last phase: the system is ready for input."""
+        self.mark(phase)
+        self.finished = True
+
+    def total_ns(self):
+        return self._last_ns - self.start_ns
+
+    def report(self):
+        """Returns the timing breakdown as printable lines."""
+        lines = [f"  {phase:<20} {duration_ns / 1e6:>9.2f} ms" for phase, duration_ns in self.phases]
+        lines.append(f"  {'total':<20} {self.total_ns() / 1e6:>9.2f} ms")
+        return "\n".join(lines)
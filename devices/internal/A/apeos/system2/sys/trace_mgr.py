@@ -0,0 +1,134 @@
+import json
+import time
+import inspect
+import functools
+from collections import deque
+
+class Tracer:
+    """
+    A low-overhead event tracer for the kernel.
+
+    Records scheduler slices, command dispatches and FileSystemManager calls
+    into a fixed-size ring buffer, and exports them as Chrome/Perfetto trace
+    JSON (load it in chrome://tracing or ui.perfetto.dev).
+
+    While disabled nothing is hooked in at all: tracing works by shadowing the
+    traced methods on the manager instances, and disabling removes the shadows
+    again, so the untraced code paths are exactly the normal ones.
+    """
+
+    def __init__(self, kernel, capacity=65536):
+        """
+        :param kernel: The kernel instance to trace.
+        :param capacity: How many events the ring buffer keeps.
+        """
+        self.kernel = kernel
+        self.enabled = False
+        self.events = deque(maxlen=capacity) # (name, category, start_ns, duration_ns, tid, args)
+        self._hooks = [] # (object, attribute name) pairs we shadowed
+        self._origin_ns = time.perf_counter_ns()
+
+    def set_capacity(self, capacity):
+        """Resizes the ring buffer, keeping the newest events."""
+        was_enabled = self.enabled
+        self.disable() # The hooks hold on to the old buffer
+        self.events = deque(self.events, maxlen=capacity)
+        if was_enabled:
+            self.enable()
+
+    def enable(self):
+        """Starts recording."""
+        if self.enabled:
+            return
+        kernel = self.kernel
+        proc_manager = kernel.proc_manager
+        clock = time.perf_counter_ns
+        record = self.events.append
+
+        # Scheduler: one event per time slice, on the track of the process that ran
+        run_next = proc_manager.run_next
+        def traced_run_next():
+            start = clock()
+            ran = run_next()
+            process = proc_manager.last_process
+            if ran and process is not None:
+                record((process.name, 'sched', start, clock() - start, process.pid + 1, None))
+            return ran
+        self._hook(proc_manager, 'run_next', traced_run_next)
+
+        # Command dispatches, on the shell's track
+        handle_input = kernel.io_manager.handle_input
+        def traced_handle_input(command_line):
+            start = clock()
+            try:
+                return handle_input(command_line)
+            finally:
+                name = command_line.split()[0] if command_line.split() else ''
+                record((name, 'command', start, clock() - start, 0, {'line': command_line}))
+        self._hook(kernel.io_manager, 'handle_input', traced_handle_input)
+
+        # Every public FileSystemManager method, on the track of the caller
+        # Looked up statically: reading a property like 'trash' or 'search' would create what it manages
+        fs_manager = kernel.fs_manager
+        for name in dir(type(fs_manager)):
+            if name.startswith('_') or not inspect.isfunction(inspect.getattr_static(fs_manager, name)):
+                continue
+            method = getattr(fs_manager, name)
+            self._hook(fs_manager, name, self._wrap_fs_call(name, method, proc_manager, clock, record))
+
+        self.enabled = True
+
+    @staticmethod
+    def _wrap_fs_call(name, method, proc_manager, clock, record):
+        @functools.wraps(method)
+        def traced(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                process = proc_manager.current_process
+                tid = process.pid + 1 if process is not None else 0
+                record((name, 'fs', start, clock() - start, tid, {'args': [str(a) for a in args]}))
+        return traced
+
+    def disable(self):
+        """Stops recording; the recorded events are kept."""
+        for obj, name in self._hooks:
+            # Removing the instance attribute makes the class method visible again
+            delattr(obj, name)
+        self._hooks = []
+        self.enabled = False
+
+    def _hook(self, obj, name, replacement):
+        setattr(obj, name, replacement)
+        self._hooks.append((obj, name))
+
+    def clear(self):
+        """Drops all recorded events."""
+        self.events.clear()
+
+    def export_chrome(self):
+        """Returns the recorded events as a Chrome trace JSON string."""
+        trace_events = []
+        track_names = {0: 'kernel'}
+        for name, category, start_ns, duration_ns, tid, args in self.events:
+            event = {
+                'name': name,
+                'cat': category,
+                'ph': 'X', # A complete event: start and duration
+                'ts': (start_ns - self._origin_ns) / 1000, # Microseconds
+                'dur': duration_ns / 1000,
+                'pid': 1,
+                'tid': tid,
+            }
+            if args:
+                event['args'] = args
+            trace_events.append(event)
+            if category == 'sched':
+                track_names[tid] = f"{name} [{tid - 1}]"
+        for tid, track_name in track_names.items():
+            trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid,
+                                 'args': {'name': track_name}})
+        trace_events.append({'name': 'process_name', 'ph': 'M', 'pid': 1, 'tid': 0,
+                             'args': {'name': f"aPEOS-I {self.kernel.apeos_version}"}})
+        return json.dumps({'traceEvents': trace_events, 'displayTimeUnit': 'ms'})
@@ -0,0 +1,406 @@
+import os
+import re
+import json
+import time
+import shutil
+import threading
+from collections import deque
+
+# The trashbin keeps a manifest next to the items it holds: an append-only
+# log with one JSON record per line, replayed into a dict when the trash is
+# first used. Listing the trash or restoring an item never looks at the
+# items themselves, and every item is stored under its own id, so two
+# deletes of the same name can never collide.
+#
+#   {"op": "add", "id": 7, "name": "report.txt", "origin": "A:/docs/report.txt", "size": 1234, "deleted": 1760000000.0, "is_dir": false}
+#   {"op": "remove", "id": 7}
+#   {"op": "purge", "id": 8, "stored": "8_old.log"}
+#   {"op": "quota", "max_bytes": 1073741824, "max_age": 2592000}
+#
+# A purged item leaves the manifest before its files are deleted in the
+# background, so the purge record keeps its stored name: what is left of it
+# after an interrupted purge is deleted at the next load. Anything else the
+# manifest does not know about is adopted as a new item.
+
+MANIFEST = '.manifest.jsonl'
+DEFAULT_MAX_BYTES = 1 << 30 # 1 GiB
+DEFAULT_MAX_AGE = 30 * 24 * 3600 # 30 days, in seconds
+PURGE_INTERVAL = 300.0 # Seconds between two quota checks
+_COMPACT_AFTER = 1000 # Remove records before the log is rewritten
+_STORED_NAME = re.compile(r'\d+_')
+_LEGACY_NAME = re.compile(r'(.+)\.(\d{14})$') # 'name.YYYYmmddHHMMSS', from before the manifest
+
+
+class TrashEntry:
+    """An item in the trashbin."""
+
+    __slots__ = ('id', 'name', 'origin', 'size', 'deleted', 'is_dir')
+
+    def __init__(self, id, name, origin, size, deleted, is_dir):
+        self.id = id
+        self.name = name # Its name before it was deleted
+        self.origin = origin # Its absolute virtual path before it was deleted, None if unknown
+        self.size = size # In bytes, everything below it for a directory
+        self.deleted = deleted # time.time() of the deletion
+        self.is_dir = is_dir
+
+    @property
+    def stored_name(self):
+        """Its name inside the trashbin."""
+        return f"{self.id}_{self.name}"
+
+    def record(self):
+        return {'op': 'add', 'id': self.id, 'name': self.name, 'origin': self.origin,
+                'size': self.size, 'deleted': self.deleted, 'is_dir': self.is_dir}
+
+
+class TrashManager:
+    """
+    The trashbin: moves items in and out, and purges them for good in the
+    background once they are older or bigger than its quotas allow.
+
+    The manifest is read on the I/O pool as soon as the manager is created
+    (see loading). Moving and purging run on the I/O pool too; the manifest
+    and the entry dict are guarded by a lock.
+    """
+
+    def __init__(self, fs_manager, trash_path):
+        """
+        :param trash_path: The host folder of the trashbin. Created if missing.
+        """
+        self.fs_manager = fs_manager
+        self.path = trash_path
+        self.manifest_path = os.path.join(trash_path, MANIFEST)
+        self.entries = {} # id -> TrashEntry, oldest first
+        self.total_size = 0
+        self.max_bytes = DEFAULT_MAX_BYTES
+        self.max_age = DEFAULT_MAX_AGE
+        self._next_id = 1
+        self._removed = 0 # Remove records in the log
+        self._lock = threading.Lock()
+        self._purge_queue = deque() # Host paths waiting to be deleted
+        self._purging = None # Future of the purge worker
+        self._stop = False
+        self._restoring = set() # Ids of the items being moved out, still listed until they are
+        self._purged = set() # Stored names of purged items, while the manifest is read
+        self.purged = 0 # Items purged by this session
+        self._loaded = threading.Event()
+        # Future of the load, which the kernel thread awaits before it uses the entries.
+        # Its exception, an OSError, is also what move_in and restore report.
+        self.loading = fs_manager.kernel.aio_manager.submit(self._load)
+
+    # --- MANIFEST ---
+
+    def _load(self):
+        try:
+            self._read_manifest()
+        finally:
+            self._loaded.set()
+
+    def _wait_loaded(self):
+        """None once the trash is loaded, or an error message if it could not be. Blocks until then (I/O pool only)."""
+        self._loaded.wait()
+        error = self.loading.exception()
+        return None if error is None else f"Error: Could not open the trashbin: {error}"
+
+    def _read_manifest(self):
+        os.makedirs(self.path, exist_ok=True)
+        new = not os.path.exists(self.manifest_path)
+        if not new:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue # A line cut short by a crash
+                    self._replay(record)
+
+        # Items the manifest does not know about: left by an interrupted purge
+        # (deleted), or by the old timestamped naming, a crash between a move
+        # and its record, or another program (adopted, with an unknown origin)
+        known = {entry.stored_name for entry in self.entries.values()}
+        orphans = []
+        for entry in os.scandir(self.path):
+            if entry.name.startswith(MANIFEST) or entry.name in known:
+                continue
+            if entry.name in self._purged:
+                self._purge_queue.append(entry.path)
+            else:
+                orphans.append(entry)
+        self._purged.clear()
+        if new or orphans:
+            records = [{'op': 'quota', 'max_bytes': self.max_bytes, 'max_age': self.max_age}] if new else []
+            for orphan in orphans:
+                trash_entry = self._adopt(orphan)
+                if trash_entry is not None:
+                    records.append(trash_entry.record())
+            self._append(records)
+
+    def _replay(self, record):
+        op = record.get('op')
+        if op == 'add':
+            entry = TrashEntry(record['id'], record['name'], record.get('origin'), record.get('size', 0),
+                               record.get('deleted', 0), record.get('is_dir', False))
+            self.entries[entry.id] = entry
+            self.total_size += entry.size
+            self._next_id = max(self._next_id, entry.id + 1)
+        elif op in ('remove', 'purge'):
+            entry = self.entries.pop(record.get('id'), None)
+            if entry is not None:
+                self.total_size -= entry.size
+            if op == 'purge':
+                self._purged.add(record['stored'])
+            self._removed += 1
+        elif op == 'quota':
+            self.max_bytes = record['max_bytes']
+            self.max_age = record['max_age']
+
+    def _adopt(self, dir_entry):
+        """Gives an item found in the trashbin an id, renaming it to match. None if it cannot be."""
+        name = dir_entry.name
+        legacy = _LEGACY_NAME.match(name)
+        try:
+            deleted = time.mktime(time.strptime(legacy.group(2), '%Y%m%d%H%M%S'))
+            name = legacy.group(1)
+        except (AttributeError, ValueError):
+            deleted = _mtime(dir_entry.path)
+            stored = _STORED_NAME.match(name)
+            if stored and stored.end() < len(name):
+                name = name[stored.end():] # Stored under an id the manifest lost
+        entry = TrashEntry(self._next_id, name, None, _tree_size(dir_entry.path), deleted, dir_entry.is_dir())
+        try:
+            os.rename(dir_entry.path, os.path.join(self.path, entry.stored_name))
+        except OSError:
+            return None
+        self._next_id += 1
+        self.entries[entry.id] = entry
+        self.total_size += entry.size
+        return entry
+
+    def _append(self, records):
+        """Appends records to the manifest. Called with the lock held (or before the manager is shared)."""
+        if not records:
+            return
+        if self._removed > _COMPACT_AFTER and self._removed > len(self.entries):
+            self._compact()
+        with open(self.manifest_path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record) + '\n' for record in records))
+
+    def _compact(self):
+        """Rewrites the manifest with only the items still in the trash."""
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'op': 'quota', 'max_bytes': self.max_bytes, 'max_age': self.max_age}) + '\n')
+            for entry in self.entries.values():
+                f.write(json.dumps(entry.record()) + '\n')
+            for host_path in list(self._purge_queue): # Not deleted yet
+                f.write(json.dumps({'op': 'purge', 'stored': os.path.basename(host_path)}) + '\n')
+        os.replace(temp_path, self.manifest_path)
+        self._removed = 0
+
+    # --- ITEMS ---
+
+    def list(self):
+        """Returns the TrashEntries, oldest first."""
+        with self._lock:
+            return list(self.entries.values())
+
+    def get(self, entry_id):
+        """Returns the TrashEntry with that id, or None."""
+        return self.entries.get(entry_id)
+
+    def move_in(self, host_path, origin, mover=shutil.move):
+        """
+        Moves a file or directory into the trash. Blocking, meant for the I/O pool.
+        Returns an error message string, or None on success.
+
+        :param origin: Its absolute virtual path, to restore it to.
+        :param mover: Moves it, given the source and target host paths, e.g. out of a disk image.
+        """
+        error = self._wait_loaded()
+        if error:
+            return error
+        with self._lock:
+            entry = TrashEntry(self._next_id, os.path.basename(host_path), origin, 0, time.time(), False)
+            self._next_id += 1
+        stored_path = os.path.join(self.path, entry.stored_name)
+        try:
+            mover(host_path, stored_path)
+        except OSError as e:
+            return f"Error moving '{origin}' to trash: {e}"
+        finally:
+            self.fs_manager._path_changed(host_path)
+            self.fs_manager._path_changed(stored_path)
+        # Measured in the trash, where it is a host file or tree whatever drive it came from
+        entry.size = size = _tree_size(stored_path)
+        entry.is_dir = os.path.isdir(stored_path)
+        with self._lock:
+            self.entries[entry.id] = entry
+            self.total_size += size
+            self._append([entry.record()])
+        return None
+
+    def restore(self, entry_id, host_path, mover=None):
+        """
+        Moves an item back out of the trash to a host path. Blocking, meant for the I/O pool.
+        Returns an error message string, or None on success.
+
+        :param mover: Moves it, given the source and target host paths, creating
+                      the missing directories of the target, e.g. into a disk image.
+        """
+        error = self._wait_loaded()
+        if error:
+            return error
+        with self._lock:
+            entry = self.entries.get(entry_id)
+            if entry is None:
+                return f"Error: There is no item {entry_id} in the trash."
+            if entry_id in self._restoring:
+                return f"Error: Item {entry_id} is already being restored."
+            # Stays in the dict meanwhile, so a failed restore keeps its place in the purge order
+            self._restoring.add(entry_id)
+        stored_path = os.path.join(self.path, entry.stored_name)
+        try:
+            if mover is None:
+                os.makedirs(os.path.dirname(host_path), exist_ok=True)
+                shutil.move(stored_path, host_path)
+            else:
+                mover(stored_path, host_path)
+        except OSError as e:
+            with self._lock:
+                self._restoring.discard(entry_id) # Still in the trash
+            return f"Error restoring item {entry_id}: {e}"
+        finally:
+            self.fs_manager._path_changed(stored_path)
+            self.fs_manager._path_changed(host_path)
+        with self._lock:
+            self._restoring.discard(entry_id)
+            del self.entries[entry_id]
+            self.total_size -= entry.size
+            self._removed += 1
+            self._append([{'op': 'remove', 'id': entry_id}])
+        return None
+
+    def purge(self, entry_ids):
+        """
+        Deletes items for good. They leave the manifest right away; their
+        files are deleted on the I/O pool in the background.
+        Returns (number of items, bytes) queued for deletion.
+        """
+        count = 0
+        size = 0
+        with self._lock:
+            records = []
+            for entry_id in entry_ids:
+                if entry_id in self._restoring:
+                    continue
+                entry = self.entries.pop(entry_id, None)
+                if entry is None:
+                    continue
+                count += 1
+                size += entry.size
+                records.append({'op': 'purge', 'id': entry_id, 'stored': entry.stored_name})
+                self._purge_queue.append(os.path.join(self.path, entry.stored_name))
+            self.total_size -= size
+            self._removed += len(records)
+            self._append(records)
+        self._start_purge()
+        return count, size
+
+    def _start_purge(self):
+        if self._purge_queue and (self._purging is None or self._purging.done()):
+            self._purging = self.fs_manager.kernel.aio_manager.submit(self._purge_worker)
+
+    def _purge_worker(self):
+        """Deletes the queued items one at a time until the queue is empty."""
+        while not self._stop:
+            try:
+                host_path = self._purge_queue.popleft()
+            except IndexError:
+                return
+            try:
+                if os.path.isdir(host_path) and not os.path.islink(host_path):
+                    shutil.rmtree(host_path)
+                else:
+                    os.remove(host_path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue # Left on disk, unlisted; the next session finds it and tries again
+            self.fs_manager._path_changed(host_path)
+            self.purged += 1
+
+    def close(self):
+        """Stops the purge worker after the item it is deleting, e.g. at shutdown. The rest is purged next session."""
+        self._stop = True
+
+    @property
+    def purging(self):
+        """Number of items still waiting to be deleted."""
+        return len(self._purge_queue)
+
+    # --- QUOTAS ---
+
+    def set_quotas(self, max_bytes=None, max_age=None):
+        """Changes the quotas, saves them and enforces them right away."""
+        with self._lock:
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if max_age is not None:
+                self.max_age = max_age
+            self._append([{'op': 'quota', 'max_bytes': self.max_bytes, 'max_age': self.max_age}])
+        return self.enforce_quotas()
+
+    def enforce_quotas(self):
+        """
+        Purges the items older than max_age, then the oldest items until the
+        trash fits in max_bytes. Runs periodically from the scheduler.
+        Returns (number of items, bytes) being purged.
+        """
+        if not self._loaded.is_set() or self.loading.exception() is not None:
+            return 0, 0
+        now = time.time()
+        victims = []
+        with self._lock:
+            remaining = self.total_size
+            for entry in self.entries.values(): # Oldest first
+                if now - entry.deleted > self.max_age or remaining > self.max_bytes:
+                    victims.append(entry.id)
+                    remaining -= entry.size
+        if not victims:
+            self._start_purge() # Leftovers found at load time
+            return 0, 0
+        return self.purge(victims)
+
+
+def _tree_size(host_path):
+    """The size of a file, or of everything below a directory, in bytes."""
+    try:
+        if not os.path.isdir(host_path) or os.path.islink(host_path):
+            return os.lstat(host_path).st_size
+    except OSError:
+        return 0
+    total = 0
+    stack = [host_path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    pass
+    return total
+
+
+def _mtime(host_path):
+    try:
+        return os.lstat(host_path).st_mtime
+    except OSError:
+        return time.time()
@@ -0,0 +1,190 @@
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Disk usage: how much the files below a directory take. Every directory
+# measured is cached with the mtime it had when it was scanned, the size and
+# number of the files directly in it, its subdirectories, and the totals of
+# the whole subtree below it.
+#
+# A change made through the FileSystemManager (see notify) only marks the
+# directory it happened in for a rescan and clears the totals of the
+# directories above it. The next walk rescans that one directory, re-adds
+# the totals along the path up to the root of the walk from the cached
+# totals of their other subdirectories, and leaves the rest of the tree
+# alone. Files added, removed or renamed outside aPEOS-I show in the mtime
+# of their directory, which every walk checks for the whole subtree: a walk
+# stats each directory, and only scans those whose mtime changed.
+#
+# A walk goes a level at a time, the directories of a level checked in
+# parallel on threads of its own, since scandir and stat release the GIL.
+
+WORKERS = 8 # Threads scanning the directories of a level
+CACHE_MAX = 200_000 # Directories; the cache is emptied when it grows bigger
+
+# The totals of a directory tree: bytes of its files, number of files and of directories below it
+UsageTotals = namedtuple('UsageTotals', ('bytes', 'files', 'dirs'))
+
+
+class _DirUsage:
+    """The cached usage of one directory."""
+
+    __slots__ = ('mtime', 'bytes', 'files', 'subdirs', 'total', 'stale')
+
+    def __init__(self, mtime, size, files, subdirs):
+        self.mtime = mtime # st_mtime_ns when it was scanned
+        self.bytes = size # Of the files directly in it
+        self.files = files
+        self.subdirs = subdirs # Names
+        self.total = None # UsageTotals of the subtree, None until added up or after a change below it
+        self.stale = False # Something in it changed, rescan it
+
+
+class UsageManager:
+    """
+    The cached subtree sizes behind 'du' and 'sysinfo'. Thread-safe: walks
+    run on the I/O pool while changes are reported from any thread.
+    """
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self._cache = {} # Host path -> _DirUsage
+        self._lock = threading.Lock()
+        self._generation = 0 # Bumped by every change, so a walk knows if its totals are already outdated
+        self.scanned = 0 # Directories scanned by the last walk, the others came from the cache
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._generation += 1
+
+    def notify(self, host_path):
+        """Called after something at a host path was created, changed or removed."""
+        with self._lock:
+            cache = self._cache
+            if not cache:
+                return
+            self._generation += 1
+            if cache.pop(host_path, None) is not None:
+                # A directory went or was replaced, and everything below it with it
+                prefix = os.path.join(host_path, '')
+                for path in [path for path in cache if path.startswith(prefix)]:
+                    del cache[path]
+            parent = os.path.dirname(host_path)
+            node = cache.get(parent)
+            if node is not None:
+                node.stale = True
+            while node is not None:
+                node.total = None
+                parent, child = os.path.dirname(parent), parent
+                node = cache.get(parent) if parent != child else None
+
+    def cached(self, host_path):
+        """The UsageTotals of a directory as the last walk found them, else None. No disk access."""
+        with self._lock:
+            node = self._cache.get(host_path)
+            return node.total if node is not None else None
+
+    def measure(self, host_path, depth=0, sizer=None, rescan=False):
+        """
+        Measures a directory tree. Blocking, meant for the I/O pool.
+        Raises OSError if the directory cannot be read.
+
+        :param depth: Also report the subdirectories up to this many levels below it.
+        :param sizer: sizer(host path, os.stat) -> the size of a file, e.g. the size
+                      of its contents on a compressed drive. Its st_size by default.
+        :param rescan: Scan every directory again instead of trusting the cache.
+        :return: [(host path, level, UsageTotals)], the subdirectories in name order
+                 before the directory they are in, host_path (level 0) last.
+        """
+        with self._lock:
+            generation = self._generation
+            if len(self._cache) > CACHE_MAX:
+                self._cache.clear()
+        self.scanned = 0
+        visited = [] # (host path, node) in walk order, parents first
+        level = [host_path]
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="du") as pool:
+            while level:
+                if len(level) == 1:
+                    nodes = [self._refresh(level[0], sizer, rescan)]
+                else:
+                    nodes = list(pool.map(lambda path: self._refresh(path, sizer, rescan), level))
+                next_level = []
+                for path, node in zip(level, nodes):
+                    if node is None:
+                        if path == host_path:
+                            raise FileNotFoundError(2, "No such directory", path)
+                        continue # Went away meanwhile
+                    visited.append((path, node))
+                    next_level += [os.path.join(path, name) for name in node.subdirs]
+                level = next_level
+
+        # Added up from the bottom, so the subdirectories of a directory are done before it
+        with self._lock:
+            for path, node in reversed(visited):
+                size, files, dirs = node.bytes, node.files, 0
+                for name in node.subdirs:
+                    child = self._cache.get(os.path.join(path, name))
+                    if child is not None and child.total is not None:
+                        size += child.total.bytes
+                        files += child.total.files
+                        dirs += child.total.dirs + 1
+                node.total = UsageTotals(size, files, dirs)
+            report = self._report(host_path, depth)
+            if self._generation != generation:
+                # A change came in during the walk, which these totals may miss: not for cached()
+                for _, node in visited:
+                    node.total = None
+            return report
+
+    def _refresh(self, host_path, sizer, rescan):
+        """The cached usage of a directory, scanned again if it changed. None if it is gone."""
+        try:
+            mtime = os.stat(host_path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            node = self._cache.get(host_path)
+        if node is not None and node.mtime == mtime and not node.stale and not rescan:
+            return node
+        size = files = 0
+        subdirs = []
+        try:
+            with os.scandir(host_path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif entry.is_file():
+                            stat = entry.stat()
+                            size += sizer(entry.path, stat) if sizer else stat.st_size
+                            files += 1
+                    except OSError:
+                        pass # Vanished or a dangling link
+        except OSError:
+            return None
+        node = _DirUsage(mtime, size, files, subdirs)
+        with self._lock:
+            self._cache[host_path] = node
+            self.scanned += 1
+        return node
+
+    def _report(self, host_path, depth):
+        """The measure() result from the cache. Called with the lock held."""
+        report = []
+
+        def add(path, level):
+            node = self._cache.get(path)
+            if node is None or node.total is None:
+                return
+            if level < depth:
+                for name in sorted(node.subdirs, key=str.lower):
+                    add(os.path.join(path, name), level + 1)
+            report.append((path, level, node.total))
+        add(host_path, 0)
+        return report
@@ -0,0 +1,247 @@
+import os
+import sys
+import time
+import threading
+import importlib
+from collections import deque
+from concurrent.futures import Future
+from .syscalls import Yield, Sleep, Await
+
+# Apps with exec_mode 'worker' in sys_apps.csv run their run() generator in a
+# separate host process, so CPU-heavy apps can use other cores while the
+# kernel keeps handling input. Everything the app asks of the kernel goes
+# over a pipe:
+#
+#   worker -> kernel                      kernel -> worker
+#   ('started',)
+#   ('out', text)                         (console output)
+#   ('call', method, args, kwargs)        ('ret', value) or ('err', exception)
+#   ('syscall', request)                  ('ret', value)
+#   ('exit', exit_code) or ('error', message)
+
+class WorkerPool:
+    """Runs apps in a pool of host worker processes."""
+
+    def __init__(self, kernel, max_workers=None):
+        """
+        :param kernel: The kernel instance.
+        :param max_workers: Size of the pool, defaults to the number of CPUs.
+        """
+        self.kernel = kernel
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = None # Started on first use, workers are expensive to spawn
+        self._context = None
+
+    def launch(self, module_name, class_name, args, command_name, is_foreground):
+        """
+        Starts an app in a worker and creates the kernel process that represents it.
+
+        :param module_name: App module, relative to the 'apeos.system2' package.
+        :param class_name: The app class inside that module.
+        :param args: Command-line arguments passed to the app's __init__.
+        :return: The kernel-side Process.
+        """
+        if self._executor is None:
+            # Imported here, multiprocessing is slow to import and most sessions never need it
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # 'spawn' behaves the same on every host OS and never copies kernel state
+            self._context = multiprocessing.get_context('spawn')
+            self._executor = ProcessPoolExecutor(self.max_workers, mp_context=self._context)
+        kernel_conn, worker_conn = self._context.Pipe()
+        kernel_info = {
+            'apeos_version': self.kernel.apeos_version,
+            'os_name': self.kernel.os_name,
+            'os_version': self.kernel.os_version,
+        }
+        future = self._executor.submit(_worker_main, module_name, class_name, list(args), worker_conn, kernel_info)
+        host = WorkerApp(self.kernel, kernel_conn, worker_conn, future)
+        return self.kernel.proc_manager.spawn(host.run(), command_name, is_foreground, app_instance=host)
+
+    def shutdown(self):
+        """Stops the pool, killing apps that are still running."""
+        if self._executor is None:
+            return
+        # The pool would otherwise wait for running apps when the interpreter exits
+        for worker in list((self._executor._processes or {}).values()):
+            worker.terminate()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+class WorkerApp:
+    """
+    The kernel-side stand-in for an app running in a worker.
+
+    Its run() generator is an ordinary kernel process: it parks on the pipe
+    and serves the worker's requests (console output, filesystem calls and
+    syscalls) on the kernel thread.
+    """
+
+    def __init__(self, kernel, conn, worker_conn, future):
+        self.kernel = kernel
+        self.conn = conn
+        self._worker_conn = worker_conn # Our copy of the worker's end, closed once it is running
+        self._lock = threading.Lock()
+        self._messages = deque()
+        self._waiting = None # Future handed to the process while no message is queued
+        self._reader = threading.Thread(target=self._read_loop, name="worker-reader", daemon=True)
+        self._reader.start()
+        future.add_done_callback(self._on_worker_done)
+
+    def _read_loop(self):
+        """Reads messages from the worker until the pipe closes."""
+        try:
+            while True:
+                self._deliver(self.conn.recv())
+        except (EOFError, OSError):
+            self._deliver(('closed', None))
+
+    def _on_worker_done(self, future):
+        """Reports a worker that died without saying goodbye (e.g. a broken pool)."""
+        if future.cancelled():
+            self._deliver(('closed', "the app was cancelled"))
+        elif future.exception() is not None:
+            self._deliver(('closed', str(future.exception())))
+
+    def _deliver(self, message):
+        with self._lock:
+            waiting, self._waiting = self._waiting, None
+            if waiting is None:
+                self._messages.append(message)
+                return
+        waiting.set_result(message)
+
+    def _next_message(self):
+        """Returns a future for the next message from the worker."""
+        future = Future()
+        with self._lock:
+            if self._messages:
+                future.set_result(self._messages.popleft())
+            else:
+                self._waiting = future
+        return future
+
+    def run(self):
+        try:
+            while True:
+                message = yield Await(self._next_message())
+                kind = message[0]
+                if kind == 'started':
+                    self._worker_conn.close()
+                elif kind == 'out':
+                    sys.stdout.write(message[1])
+                    sys.stdout.flush()
+                elif kind == 'call':
+                    _, method, args, kwargs = message
+                    try:
+                        reply = ('ret', getattr(self.kernel.fs_manager, method)(*args, **kwargs))
+                    except Exception as e:
+                        reply = ('err', e)
+                    self.conn.send(reply)
+                elif kind == 'syscall':
+                    # Re-issue the request as this process, e.g. to wait for a line of input
+                    result = yield message[1]
+                    self.conn.send(('ret', result))
+                elif kind == 'exit':
+                    return message[1]
+                elif kind == 'error':
+                    print(f"Error in worker: {message[1]}")
+                    return 1
+                elif kind == 'closed':
+                    print(f"Error: Worker exited unexpectedly{': ' + message[1] if message[1] else '.'}")
+                    return 1
+        finally:
+            self.conn.close()
+
+
+# --- WORKER SIDE ---
+
+class _Channel:
+    """The worker's end of the pipe to the kernel."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def send(self, message):
+        self.conn.send(message)
+
+    def request(self, message):
+        """Sends a request and blocks until the kernel replies."""
+        self.conn.send(message)
+        kind, value = self.conn.recv()
+        if kind == 'err':
+            raise value
+        return value
+
+
+class _ConsoleProxy:
+    """Stands in for sys.stdout in a worker and forwards text to the kernel console."""
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def write(self, text):
+        if text:
+            self.channel.send(('out', text))
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class _FileSystemProxy:
+    """Forwards FileSystemManager calls to the kernel."""
+
+    def __init__(self, channel):
+        self._channel = channel
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        def call(*args, **kwargs):
+            return self._channel.request(('call', method, args, kwargs))
+        return call
+
+
+class _KernelProxy:
+    """The 'kernel' object an app sees when it runs in a worker."""
+
+    def __init__(self, channel, kernel_info):
+        self.fs_manager = _FileSystemProxy(channel)
+        self.apeos_version = kernel_info['apeos_version']
+        self.os_name = kernel_info['os_name']
+        self.os_version = kernel_info['os_version']
+
+
+def _worker_main(module_name, class_name, args, conn, kernel_info):
+    """Entry point in the worker: drives the app's run() generator to completion."""
+    channel = _Channel(conn)
+    channel.send(('started',))
+    real_stdout = sys.stdout
+    sys.stdout = _ConsoleProxy(channel)
+    try:
+        app_module = importlib.import_module(f"..{module_name}", package=__package__)
+        app_instance = getattr(app_module, class_name)(_KernelProxy(channel, kernel_info), *args)
+        task = app_instance.run()
+        value = None
+        while True:
+            try:
+                request = task.send(value)
+            except StopIteration as stop:
+                channel.send(('exit', stop.value if isinstance(stop.value, int) else 0))
+                break
+            value = None
+            if request is None or isinstance(request, Yield):
+                continue # A worker has its own core, no need to give it up
+            if isinstance(request, Sleep):
+                time.sleep(request.ms / 1000)
+            elif isinstance(request, Await):
+                value = request.future.result()
+            else:
+                value = channel.request(('syscall', request))
+    except Exception as e:
+        channel.send(('error', f"{type(e).__name__}: {e}"))
+    finally:
+        sys.stdout = real_stdout
+        conn.close()
@@ -1,4 +1,5 @@
-from devices.internal.A.apeos.system2.sys.process_mgr import ProcessState
+from devices.internal.A.apeos.system2.sys.syscalls import ReadInput
+from devices.internal.A.apeos.system2.sys.filesys_mgr import FileSystemError, PathNotFoundError
  
 class BananaEditor:
     """
@@ -16,7 +17,7 @@ class BananaEditor:
         self.kernel = kernel
         self.filename = filename
         self.buffer = []  # This will hold the lines of the file as strings.
-        self.user_input = None # To receive input from the kernel
+        self.user_input = None # The last line received from the kernel
         self.is_running = False
 
     def _load_file(self):
@@ -24,14 +25,14 @@ class BananaEditor:
         if not self.filename:
             return
 
-        content = self.kernel.fs_manager.read_file(self.filename)
-
-        if isinstance(content, str) and content.startswith("Error: File"):
+        try:
+            content = self.kernel.fs_manager.read_file(self.filename)
+        except PathNotFoundError:
             # File does not exist, which is fine for a new file.
             print(f"New file: '{self.filename}'")
-        elif isinstance(content, str) and content.startswith("Error:"):
+        except FileSystemError as e:
             # Another error occurred (e.g., it's a directory)
-            print(content)
+            print(e)
             self.filename = None # Prevent saving
         else:
             # File loaded successfully
@@ -53,17 +54,8 @@ class BananaEditor:
 
     def _request_input(self):
         """A system call to the kernel to wait for input."""
-        # Find our own process object
-        proc = self.kernel.proc_manager.get_foreground_process()
-        if proc:
-            proc.state = ProcessState.WAITING_FOR_INPUT
-        self.user_input = None # Clear previous input
-        while self.user_input is None:
-            yield # Yield control to the kernel until input is received
-
-    def send_input(self, text):
-        """Called by the kernel to deliver user input."""
-        self.user_input = text
+        # The kernel parks us until a line is typed and sends it back
+        self.user_input = yield ReadInput()
 
     def run(self):
         """A generator that runs the editor's logic step-by-step."""
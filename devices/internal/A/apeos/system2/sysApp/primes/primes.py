@@ -0,0 +1,46 @@
+from devices.internal.A.apeos.system2.sys.syscalls import Yield
+
+class PrimeCounter:
+    """
+    A CPU-heavy app for aPEOS-I: counts the prime numbers up to a limit.
+    It runs on a worker core (exec_mode 'worker'), so the shell stays responsive.
+    """
+    def __init__(self, kernel, limit="5000000", output=None):
+        """
+        :param kernel: The kernel instance, providing access to system managers.
+        :param limit: Count primes up to this number.
+        :param output: Optional file to write the result to.
+        """
+        self.kernel = kernel
+        self.limit = limit
+        self.output = output
+
+    def run(self):
+        """A generator that runs the count step-by-step."""
+        try:
+            limit = int(self.limit)
+        except ValueError:
+            print(f"Error: '{self.limit}' is not a valid number.")
+            return 1
+
+        # Trial division on purpose: it keeps a core busy for a while
+        count = 0
+        for n in range(2, limit + 1):
+            d = 2
+            while d * d <= n:
+                if n % d == 0:
+                    break
+                d += 1
+            else:
+                count += 1
+            if n % 10000 == 0:
+                yield Yield() # Only matters when run on the kernel thread
+
+        result = f"There are {count:,} primes up to {limit:,}."
+        print(result)
+        if self.output:
+            error = self.kernel.fs_manager.write_file(self.output, result + "\n")
+            if error:
+                print(error)
+                return 1
+        return 0
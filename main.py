@@ -1,34 +1,60 @@
-from devices.internal.A.apeos.system2.sys.process_mgr import ProcessManager
 from devices.internal.A.apeos.system2.sys.time_mgr import *
-from devices.internal.A.apeos.system2.sys.kernel import Kernel
-import platform
-
-print("Booting aPEOS-I System...")
-DELAY(3000)
-
-PROCMGR = ProcessManager()
-print("Process Manager initialized.")
-
-DELAY(300)
-
-print("Getting system credentials...")
+BOOT_TIMER = BootTimer() # Started first, so the imports below are measured too
 
-OS_NAME = platform.system()
-OS_VERSION = platform.version()
-APEOS_VERSION = "alpha-1"
-
-print(f"Operating System: {OS_NAME} Version: {OS_VERSION}")
-
-DELAY(1500)
-
-EXEC_TIME = str(f"[{TIME_FULL_DMY()}]")
-print(f"Execution Time according to the base system: {EXEC_TIME}")
-
-print("System boot complete. Welcome to aPEOS-I!")
-print(f"aPEOSI {APEOS_VERSION}, expect bugs. Use at your own risk.")
-print("\nHanding over to kernel...")
-DELAY(500)
+import os
+import sys
+import platform
+from devices.internal.A.apeos.system2.sys.process_mgr import ProcessManager
+from devices.internal.A.apeos.system2.sys.kernel import Kernel
 
-# Initialize and start the kernel
-kernel = Kernel(PROCMGR, APEOS_VERSION, OS_NAME, OS_VERSION)
-kernel.start()
\ No newline at end of file
+# Fast boot skips the artificial delays, for scripted and test runs:
+#   python main.py --fast    or    APEOS_FAST_BOOT=1 python main.py
+# --boot-times prints how long every boot phase took before the first prompt.
+FAST_BOOT = "--fast" in sys.argv or os.environ.get("APEOS_FAST_BOOT") == "1"
+SHOW_BOOT_TIMES = "--boot-times" in sys.argv
+
+def BOOT_DELAY(milliseconds):
+    """The boot sequence's dramatic pauses, skipped in fast boot."""
+    if not FAST_BOOT:
+        DELAY(milliseconds)
+
+# Apps running on worker processes re-import this module, so the boot
+# sequence only runs when it is executed as the main script.
+if __name__ == "__main__":
+    BOOT_TIMER.mark("imports")
+    print("Booting aPEOS-I System...")
+    BOOT_DELAY(3000)
+
+    PROCMGR = ProcessManager()
+    print("Process Manager initialized.")
+
+    BOOT_DELAY(300)
+
+    print("Getting system credentials...")
+
+    OS_NAME = platform.system()
+    APEOS_VERSION = "alpha-1"
+
+    if FAST_BOOT:
+        # The version can be slow to query (it runs 'ver' on Windows), the kernel looks it up when asked
+        OS_VERSION = None
+        print(f"Operating System: {OS_NAME}")
+    else:
+        OS_VERSION = platform.version()
+        print(f"Operating System: {OS_NAME} Version: {OS_VERSION}")
+
+    BOOT_DELAY(1500)
+
+    EXEC_TIME = str(f"[{TIME_FULL_DMY()}]")
+    print(f"Execution Time according to the base system: {EXEC_TIME}")
+
+    print("System boot complete. Welcome to aPEOS-I!")
+    print(f"aPEOSI {APEOS_VERSION}, expect bugs. Use at your own risk.")
+    print("\nHanding over to kernel...")
+    BOOT_DELAY(500)
+    BOOT_TIMER.mark("boot sequence")
+
+    # Initialize and start the kernel
+    kernel = Kernel(PROCMGR, APEOS_VERSION, OS_NAME, OS_VERSION, boot_timer=BOOT_TIMER)
+    kernel.show_boot_times = SHOW_BOOT_TIMES
+    kernel.start()